@@ -1,12 +1,32 @@
+from collections import OrderedDict
+
 import flet as ft
 from login import LoginPage
 from signup import SignUpPage
 from main import MainPage
+from dashboard import DashboardPage
 from package_list import PackageListPage
+from auth import get_sessions
+from database import init_pool
+from printer_discovery import get_printer_discovery
+from printing import get_spool_queue
+
+# Pages gardées en mémoire entre deux navigations (0 : reconstruire à chaque fois,
+# pour les terminaux à mémoire limitée)
+VIEW_CACHE_SIZE = 2
 
 class MyApp:  # No need to inherit from UserControl
-    def __init__(self, page: ft.Page):
+    def __init__(self, page: ft.Page, cache_size=VIEW_CACHE_SIZE):
         self.page = page
+        self.cache_size = cache_size
+        # Pages construites, de la moins récemment affichée à la plus récente
+        self.view_cache = OrderedDict()
+        self.routes = {
+            'main': lambda: MainPage(self.page, self.show_login_page, self.show_package_list,
+                                     self.show_dashboard),
+            'packages': lambda: PackageListPage(self.page, self.show_main_page),
+            'dashboard': lambda: DashboardPage(self.page, self.show_main_page),
+        }
         self.page.title = "Application de Gestion avec QR Codes"
         self.page.window.height = 740  # Corrected for deprecation
         self.page.window.width = 390  # Corrected for deprecation
@@ -21,10 +41,42 @@ class MyApp:  # No need to inherit from UserControl
         # self.page.vertical_alignment = 'center'
         # self.page.horizontal_alignment = 'center'
 
-        # Initially, show the LoginPage
-        self.show_login_page()
+        # Initially, show the LoginPage (sauf session encore ouverte)
+        if self.has_session():
+            self.show_main_page()
+        else:
+            self.show_login_page()
+
+    def has_session(self):
+        return get_sessions().get(self.page.session.get('session_token')) is not None
+
+    def show_view(self, name):
+        """Show a cached page, refreshing its data, or build it on first visit."""
+        if not self.has_session():
+            # Session expirée : se reconnecter
+            self.show_login_page()
+            return
+        view = self.view_cache.pop(name, None)
+        if view is None:
+            view = self.routes[name]()
+        elif hasattr(view, 'refresh_view'):
+            # Page déjà construite : seules ses données sont mises à jour
+            view.refresh_view()
+        if self.cache_size > 0:
+            self.view_cache[name] = view
+            while len(self.view_cache) > self.cache_size:
+                self.view_cache.popitem(last=False)
+        self.page.views.clear()
+        self.page.views.append(view)
+        self.page.update()
 
     def show_login_page(self, e=None):  # Accept the event parameter
+        # Déconnexion : ne rien garder de la session précédente
+        token = self.page.session.get('session_token')
+        if token:
+            get_sessions().revoke(token)
+            self.page.session.remove('session_token')
+        self.view_cache.clear()
         self.page.views.clear()
         self.page.views.append(LoginPage(self.page, self.show_main_page, self.show_signup_page))
         self.page.update()
@@ -35,17 +87,19 @@ class MyApp:  # No need to inherit from UserControl
         self.page.update()
 
     def show_main_page(self, e=None):  # Accept the event parameter
-        self.page.views.clear()
-        self.page.views.append(MainPage(self.page, self.show_login_page, self.show_package_list))
-        self.page.update()
+        self.show_view('main')
 
     def show_package_list(self, e=None):  # Accept the event parameter
-        self.page.views.clear()
-        self.page.views.append(PackageListPage(self.page, self.show_main_page))
-        self.page.update()
+        self.show_view('packages')
+
+    def show_dashboard(self, e=None):
+        self.show_view('dashboard')
 
 
 def main(page: ft.Page):
+    init_pool()  # Préparer le schéma et les connexions une seule fois
+    get_spool_queue()  # Reprendre les impressions interrompues
+    get_printer_discovery().prefetch()  # Imprimantes prêtes avant la première impression
     MyApp(page)  # Initialize the app
 
 if __name__ == "__main__":
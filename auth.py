@@ -0,0 +1,223 @@
+"""Mots de passe hachés et sessions des utilisateurs.
+
+Les mots de passe sont hachés avec scrypt (ou PBKDF2 si OpenSSL ne fournit pas
+scrypt) et un sel aléatoire ; les paramètres sont enregistrés avec le hachage.
+Quand le coût de HASH_SETTINGS est relevé, le hachage d'un utilisateur est
+recalculé à sa prochaine connexion. Une session ouverte est gardée en mémoire
+sous un jeton : revenir à l'écran principal ne redemande pas le mot de passe.
+
+Usage (choisir le coût sur le poste) : python auth.py [--target 250]
+"""
+import argparse
+import base64
+import hashlib
+import hmac
+import secrets
+import sys
+import threading
+import time
+
+from database import Database
+
+# Paramètres des nouveaux hachages ; mesurer avec `python auth.py` avant de les relever
+HASH_SETTINGS = {
+    'algorithm': 'scrypt' if hasattr(hashlib, 'scrypt') else 'pbkdf2_sha256',
+    'n': 2 ** 14,               # coût scrypt (puissance de 2)
+    'r': 8,
+    'p': 1,
+    'iterations': 600_000,      # coût PBKDF2
+}
+HASH_ALGORITHMS = ('scrypt', 'pbkdf2_sha256')
+SALT_SIZE = 16
+HASH_SIZE = 32
+# Durée de vie d'une session sans activité, en secondes
+SESSION_TTL = 8 * 3600
+
+
+def _b64(data):
+    return base64.b64encode(data).decode('ascii')
+
+
+def _derive(password, algorithm, params, salt):
+    if algorithm == 'scrypt':
+        n, r, p = params
+        # maxmem : scrypt utilise 128 * n * r octets, au-delà de la limite par défaut d'OpenSSL
+        return hashlib.scrypt(password.encode('utf-8'), salt=salt, n=n, r=r, p=p,
+                              maxmem=256 * n * r, dklen=HASH_SIZE)
+    if algorithm == 'pbkdf2_sha256':
+        (iterations,) = params
+        return hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'), salt, iterations, HASH_SIZE)
+    raise ValueError(f"Algorithme de hachage inconnu: {algorithm}")
+
+
+def _current_params(settings):
+    if settings['algorithm'] == 'scrypt':
+        return settings['n'], settings['r'], settings['p']
+    return (settings['iterations'],)
+
+
+def hash_password(password, settings=None):
+    """Return 'algorithm$params$salt$hash' for password with the given (or current) settings."""
+    settings = settings or HASH_SETTINGS
+    algorithm = settings['algorithm']
+    params = _current_params(settings)
+    salt = secrets.token_bytes(SALT_SIZE)
+    digest = _derive(password, algorithm, params, salt)
+    return "$".join([algorithm, ",".join(map(str, params)), _b64(salt), _b64(digest)])
+
+
+def _parse(stored):
+    try:
+        algorithm, params, salt, digest = stored.split("$")
+        if algorithm not in HASH_ALGORITHMS:
+            return None
+        return algorithm, tuple(int(value) for value in params.split(",")), \
+            base64.b64decode(salt), base64.b64decode(digest)
+    except (AttributeError, ValueError):
+        return None
+
+
+def is_hashed(stored):
+    return _parse(stored) is not None
+
+
+def verify_password(password, stored):
+    """Check password against a stored hash, in constant time."""
+    parsed = _parse(stored)
+    if parsed is None:
+        return False
+    algorithm, params, salt, digest = parsed
+    try:
+        return hmac.compare_digest(_derive(password, algorithm, params, salt), digest)
+    except ValueError:
+        return False
+
+
+def needs_rehash(stored, settings=None):
+    """True when stored was made with other settings than the current ones."""
+    settings = settings or HASH_SETTINGS
+    parsed = _parse(stored)
+    return parsed is None or parsed[:2] != (settings['algorithm'], _current_params(settings))
+
+
+def register_user(username, password, phone=""):
+    """Create a user with a hashed password; raises sqlite3.IntegrityError if the name is taken."""
+    db = Database()
+    try:
+        db.insert_user(username, hash_password(password), phone)
+    finally:
+        db.close()
+
+
+def authenticate(username, password):
+    """Return the user row if the password matches, else None (database access, slow on purpose).
+
+    A hash made with older settings is replaced while the password is known.
+    """
+    db = Database()
+    try:
+        user = db.get_user(username)
+        if user is None:
+            # Même durée qu'un mauvais mot de passe : ne pas révéler les noms existants
+            hash_password(password)
+            return None
+        user_id, password_hash = user[0], user[2]
+        if not verify_password(password, password_hash):
+            return None
+        if needs_rehash(password_hash):
+            db.set_user_password(user_id, hash_password(password))
+        return user
+    finally:
+        db.close()
+
+
+class SessionCache:
+    """Open sessions by token, expired after ttl seconds without use."""
+
+    def __init__(self, ttl=SESSION_TTL):
+        self.ttl = ttl
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def create(self, user_id, username):
+        token = secrets.token_urlsafe(32)
+        with self._lock:
+            self._sessions[token] = {
+                'user_id': user_id,
+                'username': username,
+                'expires_at': time.monotonic() + self.ttl,
+            }
+        return token
+
+    def get(self, token):
+        """Return the session of token, extending it, or None if unknown or expired."""
+        if not token:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            session = self._sessions.get(token)
+            if session is None:
+                return None
+            if session['expires_at'] < now:
+                del self._sessions[token]
+                return None
+            session['expires_at'] = now + self.ttl
+            return session
+
+    def revoke(self, token):
+        with self._lock:
+            self._sessions.pop(token, None)
+
+
+_sessions = None
+_sessions_lock = threading.Lock()
+
+
+def get_sessions():
+    global _sessions
+    with _sessions_lock:
+        if _sessions is None:
+            _sessions = SessionCache()
+    return _sessions
+
+
+def benchmark(target_ms=250):
+    """Time each hashing cost; returns [(settings, ms)] up to the first above target_ms."""
+    results = []
+    for log_n in range(12, 21):
+        if HASH_SETTINGS['algorithm'] == 'scrypt':
+            settings = {**HASH_SETTINGS, 'n': 2 ** log_n}
+        else:
+            settings = {**HASH_SETTINGS, 'iterations': 100_000 * 2 ** (log_n - 12)}
+        start = time.perf_counter()
+        hash_password("mot de passe de test", settings)
+        elapsed = (time.perf_counter() - start) * 1000
+        results.append((settings, elapsed))
+        if elapsed > target_ms:
+            break
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Mesurer le coût du hachage des mots de passe")
+    parser.add_argument('--target', type=float, default=250,
+                        help="durée visée d'une connexion, en millisecondes")
+    args = parser.parse_args(argv)
+
+    algorithm = HASH_SETTINGS['algorithm']
+    key = 'n' if algorithm == 'scrypt' else 'iterations'
+    print(f"Algorithme : {algorithm} (réglage actuel {key} = {HASH_SETTINGS[key]})")
+    chosen = None
+    for settings, ms in benchmark(args.target):
+        print(f"  {key} = {settings[key]:>9} : {ms:7.1f} ms")
+        if ms <= args.target:
+            chosen = settings[key]
+    if chosen is None:
+        print(f"Même le coût minimal dépasse {args.target:.0f} ms")
+        return 1
+    print(f"Coût conseillé pour {args.target:.0f} ms : {key} = {chosen}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,84 @@
+"""Réception des colis au comptoir : scan continu avec la caméra.
+
+La caméra reste ouverte pendant toute la session. Chaque QR code de colis lu
+est compté une fois ; les statuts sont enregistrés par lots, chaque lot
+dans une seule transaction.
+"""
+import threading
+
+from database import Database
+from qr_payload import parse_qr_data
+from scanner import DEDUPE_WINDOW, QRScanner, unique_codes
+
+CHECKIN_STATUS = 'Réceptionné'
+# Colis scannés enregistrés ensemble, pour ne pas perdre toute la session en cas d'arrêt
+CHECKIN_BATCH_SIZE = 50
+
+
+class CheckInSession:
+    """Continuous scan session; run() blocks until stop is set or the preview is closed.
+
+    on_scan(session, data) is called for each new parcel and on_change(session)
+    whenever the tally changes, both from the scanning thread.
+    """
+
+    def __init__(self, status=CHECKIN_STATUS, window=DEDUPE_WINDOW, batch_size=CHECKIN_BATCH_SIZE,
+                 on_scan=None, on_change=None):
+        self.status = status
+        self.window = window
+        self.batch_size = batch_size
+        self.on_scan = on_scan
+        self.on_change = on_change
+        self.stop_event = threading.Event()
+        self.scanned = []
+        self.updated = 0
+        self.duplicates = 0
+        self.unknown_codes = 0
+        self.missing = []
+        self._seen = set()
+        self._pending = []
+
+    def run(self, scanner=None):
+        scanner = scanner or QRScanner()
+        try:
+            with scanner:
+                for text in unique_codes(scanner.codes(self.stop_event), self.window):
+                    self.add(text)
+        finally:
+            self.flush()
+
+    def stop(self):
+        self.stop_event.set()
+
+    def add(self, text):
+        data = parse_qr_data(text)
+        if data is None:
+            self.unknown_codes += 1
+        elif data['id'] in self._seen:
+            # Colis déjà compté, revenu devant la caméra après la fenêtre
+            self.duplicates += 1
+        else:
+            self._seen.add(data['id'])
+            self.scanned.append(data['id'])
+            self._pending.append(data['id'])
+            if self.on_scan is not None:
+                self.on_scan(self, data)
+            if len(self._pending) >= self.batch_size:
+                self.flush()
+        if self.on_change is not None:
+            self.on_change(self)
+
+    def flush(self):
+        """Write the status of the parcels scanned since the last flush."""
+        if not self._pending:
+            return
+        db = Database()
+        try:
+            updated = db.bulk_update_status(self._pending, self.status)
+        finally:
+            db.close()
+        pending, self._pending = self._pending, []
+        self.updated += len(updated)
+        self.missing.extend(sorted(set(pending) - set(updated)))
+        if self.on_change is not None:
+            self.on_change(self)
@@ -0,0 +1,123 @@
+import flet as ft
+from database import SUMMARY_MEASURES
+from reports import GROUP_LABELS, MEASURE_LABELS, PERIODS, format_measure, summary_report
+from tasks import get_executor
+
+# Regroupements proposés dans le tableau de bord
+DASHBOARD_GROUPS = ('city_dest', 'city_exp', 'gender_package', 'day')
+
+
+class DashboardPage(ft.UserControl):
+    def __init__(self, page: ft.Page, go_to_main):
+        super().__init__()
+        self.page = page
+        self.go_to_main = go_to_main
+        self.period_field = ft.Dropdown(
+            label="Période",
+            value='week',
+            options=[ft.dropdown.Option(key, label) for key, label in PERIODS.items()],
+            on_change=self.load_summary,
+            expand=True,
+        )
+        self.group_field = ft.Dropdown(
+            label="Regrouper par",
+            value='city_dest',
+            options=[ft.dropdown.Option(key, GROUP_LABELS[key]) for key in DASHBOARD_GROUPS],
+            on_change=self.load_summary,
+            expand=True,
+        )
+        self.totals_row = ft.Row(wrap=True, spacing=10)
+        self.table = ft.DataTable(columns=self.build_columns(), rows=[], column_spacing=16)
+        self.progress = ft.ProgressBar(visible=False)
+        self.load_summary()
+
+    def build_columns(self):
+        return [ft.DataColumn(ft.Text(GROUP_LABELS[self.group_field.value]))] + [
+            ft.DataColumn(ft.Text(MEASURE_LABELS[name]), numeric=True) for name in SUMMARY_MEASURES
+        ]
+
+    def build_total_card(self, name, value):
+        return ft.Container(
+            content=ft.Column([
+                ft.Text(MEASURE_LABELS[name], size=12, color=ft.colors.BLUE_GREY_400),
+                ft.Text(format_measure(name, value), size=18, weight=ft.FontWeight.BOLD, color=ft.colors.BLUE),
+            ], spacing=2),
+            padding=10,
+            bgcolor=ft.colors.BLUE_50,
+            border_radius=10,
+        )
+
+    def show_summary(self, result):
+        rows, totals = result
+        self.progress.visible = False
+        self.totals_row.controls = [self.build_total_card(name, totals[name]) for name in SUMMARY_MEASURES]
+        self.table.columns = self.build_columns()
+        self.table.rows = [
+            ft.DataRow(cells=[ft.DataCell(ft.Text(str(row['group'])))] + [
+                ft.DataCell(ft.Text(format_measure(name, row[name]))) for name in SUMMARY_MEASURES
+            ])
+            for row in rows
+        ]
+
+    def show_error(self, ex):
+        self.progress.visible = False
+        self.page.show_snack_bar(
+            ft.SnackBar(
+                content=ft.Text(f"❌ Erreur de chargement des statistiques: {str(ex)}"),
+                bgcolor=ft.colors.RED_400,
+            )
+        )
+
+    def load_summary(self, e=None):
+        period = self.period_field.value
+        group_by = self.group_field.value
+        self.progress.visible = True
+        # Lecture des seuls résumés : instantané, mais jamais dans le thread de l'interface
+        get_executor().submit(self.page, lambda task: summary_report(period, group_by),
+                              on_done=self.show_summary, on_error=self.show_error)
+        if e is not None:
+            self.page.update()
+
+    def refresh_view(self):
+        self.load_summary()
+
+    def build(self):
+        return ft.Container(
+            content=ft.Column([
+                ft.Row([
+                    ft.Text("Statistiques", size=24, weight=ft.FontWeight.BOLD, color=ft.colors.BLUE),
+                    ft.Row([
+                        ft.IconButton(
+                            icon=ft.icons.REFRESH_ROUNDED,
+                            icon_color=ft.colors.BLUE,
+                            tooltip="Rafraîchir",
+                            on_click=self.load_summary,
+                        ),
+                        ft.IconButton(
+                            icon=ft.icons.ARROW_BACK_ROUNDED,
+                            icon_color=ft.colors.BLUE,
+                            tooltip="Retour",
+                            on_click=self.go_to_main,
+                        ),
+                    ]),
+                ], alignment=ft.MainAxisAlignment.SPACE_BETWEEN),
+                ft.Row([self.period_field, self.group_field], spacing=10),
+                self.progress,
+                self.totals_row,
+                ft.ListView(
+                    controls=[ft.Row([self.table], scroll=ft.ScrollMode.AUTO)],
+                    expand=1,
+                    height=400,
+                ),
+            ], spacing=16),
+            padding=ft.padding.only(top=20, left=20, right=20),
+            bgcolor=ft.colors.WHITE,
+            border_radius=10,
+            shadow=ft.BoxShadow(
+                spread_radius=1,
+                blur_radius=15,
+                color=ft.colors.BLUE_GREY_100,
+                offset=ft.Offset(0, 0),
+            ),
+            expand=True
+        )
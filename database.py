@@ -1,12 +1,239 @@
+import json
 import sqlite3
+import threading
+import queue
 from datetime import datetime
 
+DB_PATH = 'users.db'
+POOL_SIZE = 4
+POOL_TIMEOUT = 10
+
+# Profils de configuration des connexions SQLite. Le mode WAL permet aux
+# lectures de continuer pendant une écriture (autre poste, thread du scanner).
+DB_PROFILES = {
+    'default': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'cache_size': -16000,  # en Kio quand la valeur est négative
+        'mmap_size': 64 * 1024 * 1024,
+        'busy_timeout': 5000,  # en millisecondes
+    },
+    # Poste partagé sur un disque peu fiable : chaque commit est synchronisé
+    'safe': {
+        'journal_mode': 'WAL',
+        'synchronous': 'FULL',
+        'cache_size': -16000,
+        'mmap_size': 0,
+        'busy_timeout': 10000,
+    },
+    # Terminal avec peu de mémoire
+    'low_memory': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'cache_size': -2000,
+        'mmap_size': 0,
+        'busy_timeout': 5000,
+    },
+}
+DB_PROFILE = 'default'
+PAGE_SIZE = 50
+SEARCH_LIMIT = 100
+BULK_BATCH_SIZE = 500
+FETCH_BATCH_SIZE = 1000
+# Changements lus au plus par appel à changes_since
+CHANGES_LIMIT = 500
+
+# Colonnes saisies pour un colis, dans l'ordre de insert_record
+RECORD_FIELDS = (
+    'name_exp', 'city_exp', 'phone_exp', 'name_dest', 'phone_dest', 'city_dest',
+    'nmbr_package', 'gender_package', 'value_package', 'kilos', 'price',
+)
+
+# Formats de date acceptés pour created_at à l'import ; le premier qui correspond
+# l'emporte, la date est enregistrée au format '%Y-%m-%d %H:%M:%S'
+CREATED_AT_FORMATS = (
+    "%Y-%m-%d %H:%M:%S", "%Y-%m-%dT%H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%d",
+    "%d/%m/%Y %H:%M:%S", "%d/%m/%Y %H:%M", "%d/%m/%Y",
+)
+
+# Colonnes de records indexées en texte intégral, dans l'ordre de records_fts
+FTS_COLUMNS = ('name_exp', 'name_dest', 'phone_exp', 'phone_dest', 'city_exp', 'city_dest')
+# Poids bm25 de chaque colonne : les noms comptent plus que les téléphones et les villes
+FTS_WEIGHTS = (3.0, 3.0, 2.0, 2.0, 1.0, 1.0)
+
+# Dimensions et mesures des résumés daily_summary, tenus à jour par déclencheurs
+SUMMARY_DIMENSIONS = ('city_exp', 'city_dest', 'gender_package')
+# mesure -> expression sur une ligne de records (new.* / old.* dans les déclencheurs)
+SUMMARY_MEASURES = {
+    'parcels': "1",
+    'packages': "{row}.nmbr_package",
+    'kilos': "{row}.kilos",
+    'price': "{row}.price",
+    'value_package': "{row}.value_package",
+}
+# Regroupements possibles dans get_summary
+SUMMARY_GROUPS = {
+    'day': "day",
+    # Lundi de la semaine, comme period_bounds('week') : la semaine du 1er janvier reste entière
+    'week': "date(day, '-6 days', 'weekday 1')",
+    'month': "substr(day, 1, 7)",
+    'city_exp': "city_exp",
+    'city_dest': "city_dest",
+    'gender_package': "gender_package",
+}
+
+# Index secondaires. Toute modification du jeu doit s'accompagner d'une nouvelle
+# migration qui appelle create_indexes(), qui supprime aussi les index idx_*
+# qui n'y figurent plus.
+INDEXES = {
+    'idx_modification_log_record': "modification_log (record_id, modified_at)",
+    'idx_records_created_at': "records (created_at)",
+    'idx_records_city_dest': "records (city_dest)",
+    'idx_records_status': "records (status)",
+    'idx_records_phone_exp': "records (phone_exp)",
+    'idx_records_phone_dest': "records (phone_dest)",
+    'idx_print_jobs_status': "print_jobs (status, next_attempt_at)",
+    'idx_change_log_record': "change_log (record_id)",
+}
+
+# États d'un travail d'impression (table print_jobs)
+PRINT_JOB_STATUSES = ('pending', 'printing', 'done', 'failed', 'cancelled')
+
+
+class ConnectionPool:
+    """Pool de connexions SQLite partagé par toutes les pages de l'application."""
+
+    def __init__(self, path=DB_PATH, size=POOL_SIZE, timeout=POOL_TIMEOUT, profile=DB_PROFILE):
+        self.path = path
+        self.size = size
+        self.timeout = timeout
+        self.settings = DB_PROFILES[profile]
+        self._idle = queue.LifoQueue(maxsize=size)
+        self._lock = threading.Lock()
+        self._created = 0
+        self._local = threading.local()
+
+    def _connect(self):
+        # Les connexions passent d'un thread à l'autre (scanner QR, impression)
+        conn = sqlite3.connect(
+            self.path,
+            timeout=self.settings['busy_timeout'] / 1000,
+            check_same_thread=False,
+        )
+        for pragma in ('journal_mode', 'synchronous', 'cache_size', 'mmap_size', 'busy_timeout'):
+            conn.execute(f"PRAGMA {pragma} = {self.settings[pragma]}")
+        return conn
+
+    def checkout(self):
+        """Emprunter une connexion (réentrant pour un même thread)."""
+        held = getattr(self._local, 'conn', None)
+        if held is not None:
+            self._local.depth += 1
+            return held
+
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                can_create = self._created < self.size
+                if can_create:
+                    self._created += 1
+            if can_create:
+                conn = self._connect()
+            else:
+                try:
+                    conn = self._idle.get(timeout=self.timeout)
+                except queue.Empty:
+                    raise sqlite3.OperationalError("Aucune connexion disponible dans le pool")
+
+        self._local.conn = conn
+        self._local.depth = 1
+        return conn
+
+    def checkin(self, conn):
+        """Rendre une connexion au pool."""
+        if getattr(self._local, 'conn', None) is conn:
+            self._local.depth -= 1
+            if self._local.depth > 0:
+                return
+            self._local.conn = None
+
+        if conn.in_transaction:
+            conn.rollback()
+        self._idle.put(conn)
+
+    def close_all(self):
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+        with self._lock:
+            self._created = 0
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def record_to_dict(record):
+    """Map a records row (SELECT * order) to {'id': ..., field: value}."""
+    data = {'id': record[0]}
+    data.update(zip(RECORD_FIELDS, record[1:len(RECORD_FIELDS) + 1]))
+    data['created_at'] = record[12]
+    data['modified_at'] = record[13]
+    data['status'] = record[14]
+    return data
+
+
+def normalize_created_at(value):
+    """Return value as 'YYYY-MM-DD HH:MM:SS', or None if it is not a date in CREATED_AT_FORMATS."""
+    if isinstance(value, datetime):
+        return value.strftime(CREATED_AT_FORMATS[0])
+    text = str(value).strip()
+    for date_format in CREATED_AT_FORMATS:
+        try:
+            return datetime.strptime(text, date_format).strftime(CREATED_AT_FORMATS[0])
+        except ValueError:
+            continue
+    return None
+
+
+def _create_pool(path, size, profile):
+    pool = ConnectionPool(path, size, profile=profile)
+    # Le schéma n'est préparé qu'une seule fois, à la création du pool
+    db = Database(pool)
+    try:
+        db.migrate_database()
+    finally:
+        db.close()
+    return pool
+
+
+def init_pool(path=DB_PATH, size=POOL_SIZE, profile=DB_PROFILE):
+    """Créer (ou recréer) le pool partagé, à appeler au démarrage de l'application."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close_all()
+        _pool = _create_pool(path, size, profile)
+    return _pool
+
+
+def get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = _create_pool(DB_PATH, POOL_SIZE, DB_PROFILE)
+    return _pool
+
+
 class Database:
-    def __init__(self):
-        self.conn = sqlite3.connect('users.db')
+    def __init__(self, pool=None):
+        self.pool = pool or get_pool()
+        self.conn = self.pool.checkout()
         self.cursor = self.conn.cursor()
-        self.create_tables()
-        self.migrate_database()
         
     def create_tables(self):
         # Users table
@@ -51,22 +278,26 @@ class Database:
             FOREIGN KEY (record_id) REFERENCES records(id)
         )
         """)
-        
-        self.conn.commit()
 
-    def insert_user(self, username, password, phone):
+    def insert_user(self, username, password_hash, phone):
+        """Insert a user; the password is hashed by auth.register_user."""
         self.cursor.execute("""
         INSERT INTO users (username, password, phone)
         VALUES (?, ?, ?)
-        """, (username, password, phone))
+        """, (username, password_hash, phone))
         self.conn.commit()
         
-    def get_user(self, username, password):
+    def get_user(self, username):
+        """Return the user row of username, or None; auth.authenticate checks the password."""
         self.cursor.execute("""
         SELECT * FROM users 
-        WHERE username = ? AND password = ?
-        """, (username, password))
+        WHERE username = ?
+        """, (username,))
         return self.cursor.fetchone()
+
+    def set_user_password(self, user_id, password_hash):
+        self.cursor.execute("UPDATE users SET password = ? WHERE id = ?", (password_hash, user_id))
+        self.conn.commit()
     
     def insert_record(self, name_exp, city_exp, phone_exp, name_dest, phone_dest, city_dest, 
                      nmbr_package, gender_package, value_package, kilos, price):
@@ -88,17 +319,238 @@ class Database:
             self.conn.rollback()
             raise
     
+    def _begin_write(self, name):
+        """Start a write transaction; returns the savepoint used instead, or None.
+
+        The pool hands the same connection to nested Database() of a thread:
+        if it is already in a transaction, BEGIN would fail, so a savepoint
+        is opened and the outer transaction keeps control of the commit.
+        """
+        if self.conn.in_transaction:
+            self.cursor.execute(f"SAVEPOINT {name}")
+            return name
+        self.cursor.execute("BEGIN IMMEDIATE")
+        return None
+
+    def _commit_write(self, savepoint):
+        if savepoint is None:
+            self.conn.commit()
+        else:
+            self.cursor.execute(f"RELEASE SAVEPOINT {savepoint}")
+
+    def _rollback_write(self, savepoint):
+        if savepoint is None:
+            self.conn.rollback()
+        else:
+            # Annuler le seul travail de la méthode, pas la transaction englobante
+            self.cursor.execute(f"ROLLBACK TO SAVEPOINT {savepoint}")
+            self.cursor.execute(f"RELEASE SAVEPOINT {savepoint}")
+
+    def bulk_insert_records(self, rows, batch_size=BULK_BATCH_SIZE):
+        """Insert many records in a single transaction.
+
+        rows is any iterable of dicts with the RECORD_FIELDS keys (and an
+        optional created_at, normalized with normalize_created_at); it is
+        consumed lazily and written with executemany every batch_size valid
+        rows. Each row is checked with validate_record_data. Returns (ids,
+        errors): ids is a list of (row_number, record_id) for inserted rows
+        and errors a list of (row_number, message) for rejected ones, row
+        numbers starting at 1.
+        """
+        ids = []
+        errors = []
+        batch = []
+        batch_rows = []
+
+        def flush():
+            self.cursor.executemany(f"""
+                INSERT INTO records ({", ".join(RECORD_FIELDS)}, created_at)
+                VALUES ({", ".join("?" * (len(RECORD_FIELDS) + 1))})
+            """, batch)
+            # Le verrou d'écriture est détenu : les ids du lot sont consécutifs
+            self.cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = 'records'")
+            last_id = self.cursor.fetchone()[0]
+            first_id = last_id - len(batch) + 1
+            ids.extend(zip(batch_rows, range(first_id, last_id + 1)))
+            batch.clear()
+            batch_rows.clear()
+
+        savepoint = self._begin_write("bulk_insert")
+        try:
+            for row_number, row in enumerate(rows, start=1):
+                if not isinstance(row, dict):
+                    errors.append((row_number, "Ligne illisible"))
+                    continue
+
+                # Un 0 numérique reste "0" : seule une valeur absente est vide
+                data = {field: "" if row.get(field) is None else str(row.get(field)).strip()
+                        for field in RECORD_FIELDS}
+                is_valid, message = self.validate_record_data(data)
+                if not is_valid:
+                    errors.append((row_number, message))
+                    continue
+                # Même format que insert_record : les filtres et résumés comparent des chaînes
+                created_at = row.get('created_at')
+                if created_at is None or str(created_at).strip() == "":
+                    created_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                else:
+                    created_at = normalize_created_at(created_at)
+                    if created_at is None:
+                        errors.append((row_number, f"Date de création invalide: {row['created_at']}"))
+                        continue
+
+                batch.append((
+                    data['name_exp'], data['city_exp'], data['phone_exp'],
+                    data['name_dest'], data['phone_dest'], data['city_dest'],
+                    int(data['nmbr_package']), data['gender_package'],
+                    float(data['value_package']), float(data['kilos']), float(data['price']),
+                    created_at,
+                ))
+                batch_rows.append(row_number)
+                if len(batch) >= batch_size:
+                    flush()
+
+            if batch:
+                flush()
+            self._commit_write(savepoint)
+        except Exception as e:
+            print(f"Error bulk inserting records: {str(e)}")
+            self._rollback_write(savepoint)
+            raise
+
+        return ids, errors
+
     def get_all_records(self):
         self.cursor.execute("SELECT * FROM records ORDER BY id DESC")
         return self.cursor.fetchall()
-        
-    def search_records(self, search_text):
-        self.cursor.execute("""
-            SELECT * FROM records 
-            WHERE id LIKE ? OR name_exp LIKE ? 
-            ORDER BY id DESC
-        """, (f"%{search_text}%", f"%{search_text}%"))
+
+    def get_records_page(self, before_id=None, limit=PAGE_SIZE):
+        """Get one page of records, newest first, with their modification count.
+
+        Keyset pagination: pass the id of the last row of the previous page
+        as before_id to get the next one. The modification count is the last
+        column of each row.
+        """
+        query = """
+            SELECT r.*,
+                   (SELECT COUNT(*) FROM modification_log m WHERE m.record_id = r.id) AS mod_count
+            FROM records r
+        """
+        params = ()
+        if before_id is not None:
+            query += " WHERE r.id < ?"
+            params = (before_id,)
+        query += " ORDER BY r.id DESC LIMIT ?"
+        self.cursor.execute(query, params + (limit,))
         return self.cursor.fetchall()
+
+    def get_record_columns(self):
+        """Column names of the records table, in SELECT * order."""
+        self.cursor.execute("PRAGMA table_info(records)")
+        return [row[1] for row in self.cursor.fetchall()]
+
+    @staticmethod
+    def _record_filters(start_date=None, end_date=None, city=None, status=None):
+        """Return the WHERE clause (or "") and parameters for the record filters."""
+        conditions = []
+        params = []
+        if start_date:
+            conditions.append("created_at >= ?")
+            params.append(start_date)
+        if end_date:
+            conditions.append("created_at < date(?, '+1 day')")
+            params.append(end_date)
+        if city:
+            conditions.append("city_dest = ?")
+            params.append(city)
+        if status:
+            conditions.append("status = ?")
+            params.append(status)
+        if not conditions:
+            return "", params
+        return " WHERE " + " AND ".join(conditions), params
+
+    def _iter_query(self, query, params, batch_size):
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute(query, params)
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield from rows
+        finally:
+            cursor.close()
+
+    def iter_records(self, start_date=None, end_date=None, city=None, status=None,
+                     batch_size=FETCH_BATCH_SIZE):
+        """Yield records in id order without loading them all in memory.
+
+        Dates are 'YYYY-MM-DD' strings, both bounds included; city filters on
+        the destination city. Rows are read batch_size at a time with
+        fetchmany on a dedicated cursor.
+        """
+        where, params = self._record_filters(start_date, end_date, city, status)
+        yield from self._iter_query(f"SELECT * FROM records{where} ORDER BY id", params, batch_size)
+
+    def count_records(self, start_date=None, end_date=None, city=None, status=None):
+        """Count the records matching the same filters as iter_records."""
+        where, params = self._record_filters(start_date, end_date, city, status)
+        self.cursor.execute(f"SELECT COUNT(*) FROM records{where}", params)
+        return self.cursor.fetchone()[0]
+
+    def iter_records_by_ids(self, record_ids, batch_size=BULK_BATCH_SIZE):
+        """Yield the records with the given ids in id order; unknown ids are skipped.
+
+        Ids are looked up batch_size at a time to stay under SQLite's limit on
+        bound parameters.
+        """
+        record_ids = sorted(set(int(record_id) for record_id in record_ids))
+        for start in range(0, len(record_ids), batch_size):
+            batch = record_ids[start:start + batch_size]
+            placeholders = ", ".join("?" * len(batch))
+            query = f"SELECT * FROM records WHERE id IN ({placeholders}) ORDER BY id"
+            yield from self._iter_query(query, batch, batch_size)
+
+    def search_records(self, search_text, limit=SEARCH_LIMIT):
+        """Search records by names, phones and cities, best matches first.
+
+        Every word typed is matched as a prefix against the full-text index.
+        A purely numeric search also matches the record with that id, which
+        is returned first.
+        """
+        search_text = search_text.strip()
+        results = []
+        if search_text.isdigit():
+            record = self.get_record(int(search_text))
+            if record:
+                results.append(record)
+
+        match = self.build_fts_query(search_text)
+        if not match:
+            return results
+
+        weights = ", ".join(str(weight) for weight in FTS_WEIGHTS)
+        self.cursor.execute(f"""
+            SELECT r.* FROM records_fts
+            JOIN records r ON r.id = records_fts.rowid
+            WHERE records_fts MATCH ?
+            ORDER BY bm25(records_fts, {weights})
+            LIMIT ?
+        """, (match, limit))
+        found_ids = {record[0] for record in results}
+        results.extend(row for row in self.cursor.fetchall() if row[0] not in found_ids)
+        return results[:limit]
+
+    @staticmethod
+    def build_fts_query(search_text):
+        """Turn free text into an FTS5 query matching every word as a prefix."""
+        terms = []
+        for word in search_text.split():
+            word = word.replace('"', '')
+            if word:
+                terms.append(f'"{word}"*')
+        return " ".join(terms)
         
     def update_record(self, record_id, data):
         """Update an existing record in the database."""
@@ -250,6 +702,39 @@ class Database:
             print(f"Error deleting record: {e}")
             return False
             
+    def bulk_update_status(self, record_ids, status, batch_size=BULK_BATCH_SIZE):
+        """Set the status of many records in a single transaction.
+
+        Each change is written to modification_log. Returns the ids that were
+        updated, in id order; ids of records that do not exist are skipped.
+        """
+        record_ids = sorted(set(int(record_id) for record_id in record_ids))
+        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        updated = []
+        savepoint = self._begin_write("bulk_update_status")
+        try:
+            for start in range(0, len(record_ids), batch_size):
+                batch = record_ids[start:start + batch_size]
+                placeholders = ", ".join("?" * len(batch))
+                self.cursor.execute(f"SELECT id FROM records WHERE id IN ({placeholders}) ORDER BY id",
+                                    batch)
+                existing = [row[0] for row in self.cursor.fetchall()]
+                self.cursor.execute(f"""
+                    UPDATE records SET status = ?, modified_at = ?
+                    WHERE id IN ({placeholders})
+                """, [status, now] + batch)
+                updated.extend(existing)
+
+            self.cursor.executemany("""
+                INSERT INTO modification_log (record_id, action_type, modified_at, details)
+                VALUES (?, 'STATUT', ?, ?)
+            """, [(record_id, now, f"Statut: {status}") for record_id in updated])
+            self._commit_write(savepoint)
+        except Exception:
+            self._rollback_write(savepoint)
+            raise
+        return updated
+
     def execute_query(self, query, params=()):
         self.cursor.execute(query, params)
         self.conn.commit()
@@ -263,43 +748,305 @@ class Database:
         return self.cursor.fetchall()
 
     def close(self):
+        if self.conn is None:
+            return
         self.cursor.close()
-        self.conn.close()
+        self.pool.checkin(self.conn)
+        self.conn = None
 
     def migrate_database(self):
-        """Add missing columns to existing tables"""
-        try:
-            # Vérifier et ajouter les colonnes manquantes dans records
-            try:
-                self.cursor.execute("SELECT modified_at FROM records LIMIT 1")
-            except sqlite3.OperationalError:
-                self.cursor.execute("ALTER TABLE records ADD COLUMN modified_at TEXT")
-                print("Colonne modified_at ajoutée à records")
+        """Apply pending schema migrations, tracked with PRAGMA user_version."""
+        self.cursor.execute("PRAGMA user_version")
+        if self.cursor.fetchone()[0] >= len(MIGRATIONS):
+            return
 
+        for target, migration in enumerate(MIGRATIONS, start=1):
             try:
-                self.cursor.execute("SELECT status FROM records LIMIT 1")
-            except sqlite3.OperationalError:
-                self.cursor.execute("ALTER TABLE records ADD COLUMN status TEXT")
-                print("Colonne status ajoutée à records")
+                # Verrou en écriture avant de relire la version : un autre poste
+                # peut avoir appliqué la migration entre-temps
+                self.cursor.execute("BEGIN IMMEDIATE")
+                self.cursor.execute("PRAGMA user_version")
+                if self.cursor.fetchone()[0] >= target:
+                    self.conn.commit()
+                    continue
+                migration(self)
+                self.cursor.execute(f"PRAGMA user_version = {target}")
+                self.conn.commit()
+                print(f"Migration {target} appliquée : {migration.__doc__}")
+            except Exception as e:
+                print(f"Erreur lors de la migration {target}: {str(e)}")
+                self.conn.rollback()
+                return
 
-            # Vérifier et ajouter les colonnes manquantes dans modification_log
-            try:
-                self.cursor.execute("SELECT details FROM modification_log LIMIT 1")
-            except sqlite3.OperationalError:
-                self.cursor.execute("ALTER TABLE modification_log ADD COLUMN details TEXT")
-                print("Colonne details ajoutée à modification_log")
+    def add_missing_columns(self, table, columns):
+        """Add the given (name, type) columns that an older schema lacks."""
+        self.cursor.execute(f"PRAGMA table_info({table})")
+        existing = {row[1] for row in self.cursor.fetchall()}
+        for name, column_type in columns:
+            if name not in existing:
+                self.cursor.execute(f"ALTER TABLE {table} ADD COLUMN {name} {column_type}")
+                print(f"Colonne {name} ajoutée à {table}")
 
-            try:
-                self.cursor.execute("SELECT modified_at FROM modification_log LIMIT 1")
-            except sqlite3.OperationalError:
-                self.cursor.execute("ALTER TABLE modification_log ADD COLUMN modified_at TEXT")
-                print("Colonne modified_at ajoutée à modification_log")
+    def create_search_index(self):
+        """Create the full-text search index over records, kept in sync by triggers."""
+        columns = ", ".join(FTS_COLUMNS)
+        new_values = ", ".join(f"new.{col}" for col in FTS_COLUMNS)
+        old_values = ", ".join(f"old.{col}" for col in FTS_COLUMNS)
+        self.cursor.execute(f"""
+        CREATE VIRTUAL TABLE IF NOT EXISTS records_fts USING fts5(
+            {columns},
+            content='records',
+            content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2'
+        )
+        """)
+        self.cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS records_fts_insert AFTER INSERT ON records BEGIN
+            INSERT INTO records_fts (rowid, {columns}) VALUES (new.id, {new_values});
+        END
+        """)
+        self.cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS records_fts_delete AFTER DELETE ON records BEGIN
+            INSERT INTO records_fts (records_fts, rowid, {columns}) VALUES ('delete', old.id, {old_values});
+        END
+        """)
+        self.cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS records_fts_update AFTER UPDATE OF {columns} ON records BEGIN
+            INSERT INTO records_fts (records_fts, rowid, {columns}) VALUES ('delete', old.id, {old_values});
+            INSERT INTO records_fts (rowid, {columns}) VALUES (new.id, {new_values});
+        END
+        """)
 
-            self.conn.commit()
-            print("Migration de la base de données terminée avec succès")
-        except Exception as e:
-            print(f"Erreur lors de la migration: {str(e)}")
-            self.conn.rollback()
+    def rebuild_search_index(self):
+        self.cursor.execute("INSERT INTO records_fts (records_fts) VALUES ('rebuild')")
+
+    def create_indexes(self):
+        """Bring the secondary indexes in line with INDEXES."""
+        self.cursor.execute("""
+            SELECT name FROM sqlite_master
+            WHERE type = 'index' AND name LIKE 'idx\\_%' ESCAPE '\\'
+        """)
+        existing = {row[0] for row in self.cursor.fetchall()}
+
+        for name in existing - INDEXES.keys():
+            self.cursor.execute(f"DROP INDEX IF EXISTS {name}")
+            print(f"Index {name} supprimé")
+
+        self.cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table'")
+        tables = {row[0] for row in self.cursor.fetchall()}
+
+        for name, definition in INDEXES.items():
+            # La table peut n'être créée que par une migration ultérieure
+            table = definition.split(" ", 1)[0]
+            if name not in existing and table in tables:
+                self.cursor.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {definition}")
+                print(f"Index {name} créé")
+
+    def create_print_jobs_table(self):
+        """Create the print_jobs table used by the printing spool queue."""
+        self.cursor.execute("""
+        CREATE TABLE IF NOT EXISTS print_jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            printer_uri TEXT NOT NULL,
+            record_ids TEXT NOT NULL,
+            layout TEXT NOT NULL,
+            copies INTEGER NOT NULL DEFAULT 1,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at TEXT,
+            last_error TEXT,
+            document BLOB,
+            created_at TEXT NOT NULL,
+            modified_at TEXT
+        )
+        """)
+
+    def create_change_log(self):
+        """Create the change_log feed, kept up to date by triggers on records and modification_log.
+
+        Each change to a record gets a new, strictly increasing seq. Only the
+        latest change of each record is kept, so the table stays as large as
+        the number of records (deleted ones included).
+        """
+        # AUTOINCREMENT : un seq n'est jamais réutilisé, même après suppression de la ligne
+        self.cursor.execute("""
+        CREATE TABLE IF NOT EXISTS change_log (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            record_id INTEGER NOT NULL,
+            action TEXT NOT NULL
+        )
+        """)
+        triggers = {
+            'records_change_insert': ("AFTER INSERT ON records", 'new.id', 'insert'),
+            'records_change_update': ("AFTER UPDATE ON records", 'new.id', 'update'),
+            'records_change_delete': ("AFTER DELETE ON records", 'old.id', 'delete'),
+            # Le nombre de modifications affiché dans la liste change avec le journal
+            'modification_log_change': ("AFTER INSERT ON modification_log", 'new.record_id', 'update'),
+        }
+        for name, (event, record_id, action) in triggers.items():
+            self.cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {name} {event} BEGIN
+                DELETE FROM change_log WHERE record_id = {record_id};
+                INSERT INTO change_log (record_id, action) VALUES ({record_id}, '{action}');
+            END
+            """)
+
+    def current_change_seq(self):
+        """Return the seq of the latest change, 0 if there is none."""
+        self.cursor.execute("SELECT COALESCE(MAX(seq), 0) FROM change_log")
+        return self.cursor.fetchone()[0]
+
+    def changes_since(self, seq, limit=CHANGES_LIMIT):
+        """Return (last_seq, changed, deleted) for the changes made after seq.
+
+        changed holds the inserted or updated records, newest first, in the
+        get_records_page row format; deleted holds the ids of deleted records.
+        At most limit changes are read: call again with last_seq while it
+        keeps moving.
+        """
+        self.cursor.execute("""
+            SELECT c.seq, c.record_id, r.*,
+                   (SELECT COUNT(*) FROM modification_log m WHERE m.record_id = r.id) AS mod_count
+            FROM change_log c
+            LEFT JOIN records r ON r.id = c.record_id
+            WHERE c.seq > ?
+            ORDER BY c.seq
+            LIMIT ?
+        """, (seq, limit))
+        rows = self.cursor.fetchall()
+        if not rows:
+            return seq, [], []
+        changed = sorted((row[2:] for row in rows if row[2] is not None), key=lambda row: row[0], reverse=True)
+        deleted = [row[1] for row in rows if row[2] is None]
+        return rows[-1][0], changed, deleted
+
+    def create_unique_usernames(self):
+        """Rename duplicate usernames (all but the oldest account) and index username as unique."""
+        self.cursor.execute("""
+            SELECT id, username FROM users
+            WHERE id NOT IN (SELECT MIN(id) FROM users GROUP BY username)
+        """)
+        for user_id, username in self.cursor.fetchall():
+            renamed = f"{username}#{user_id}"
+            self.cursor.execute("UPDATE users SET username = ? WHERE id = ?", (renamed, user_id))
+            print(f"Utilisateur en double {username} renommé en {renamed}")
+        self.cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS uq_users_username ON users (username)")
+
+    def hash_plaintext_passwords(self):
+        """Replace the passwords stored in clear by the first versions of the application."""
+        from auth import hash_password, is_hashed
+
+        self.cursor.execute("SELECT id, password FROM users")
+        for user_id, password in self.cursor.fetchall():
+            if not is_hashed(password):
+                self.cursor.execute("UPDATE users SET password = ? WHERE id = ?",
+                                    (hash_password(password), user_id))
+
+    def create_summary_tables(self):
+        """Create daily_summary, one row per day and dimensions, kept in sync by triggers on records."""
+        dimensions = ", ".join(SUMMARY_DIMENSIONS)
+        measures = ", ".join(f"{name} REAL NOT NULL DEFAULT 0" for name in SUMMARY_MEASURES)
+        self.cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS daily_summary (
+            day TEXT NOT NULL,
+            {", ".join(f"{name} TEXT NOT NULL" for name in SUMMARY_DIMENSIONS)},
+            {measures},
+            PRIMARY KEY (day, {dimensions})
+        ) WITHOUT ROWID
+        """)
+
+        def key(row):
+            return [f"substr({row}.created_at, 1, 10)"] + [f"{row}.{name}" for name in SUMMARY_DIMENSIONS]
+
+        def add(row):
+            values = ", ".join(key(row) + [expr.format(row=row) for expr in SUMMARY_MEASURES.values()])
+            updates = ", ".join(f"{name} = {name} + excluded.{name}" for name in SUMMARY_MEASURES)
+            return f"""
+                INSERT INTO daily_summary (day, {dimensions}, {", ".join(SUMMARY_MEASURES)})
+                VALUES ({values})
+                ON CONFLICT (day, {dimensions}) DO UPDATE SET {updates};
+            """
+
+        def subtract(row):
+            where = " AND ".join(f"{name} = {value}" for name, value in zip(('day',) + SUMMARY_DIMENSIONS, key(row)))
+            updates = ", ".join(f"{name} = {name} - {expr.format(row=row)}" for name, expr in SUMMARY_MEASURES.items())
+            return f"""
+                UPDATE daily_summary SET {updates} WHERE {where};
+                DELETE FROM daily_summary WHERE {where} AND parcels <= 0;
+            """
+
+        # Colonnes lues par key() et SUMMARY_MEASURES
+        tracked = ", ".join(('created_at',) + SUMMARY_DIMENSIONS + ('nmbr_package', 'kilos', 'price', 'value_package'))
+        self.cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS records_summary_insert AFTER INSERT ON records BEGIN
+            {add('new')}
+        END
+        """)
+        self.cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS records_summary_delete AFTER DELETE ON records BEGIN
+            {subtract('old')}
+        END
+        """)
+        self.cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS records_summary_update AFTER UPDATE OF {tracked} ON records BEGIN
+            {subtract('old')}
+            {add('new')}
+        END
+        """)
+
+    def rebuild_summary(self):
+        """Recompute daily_summary from records (full scan, for the migration or a repair)."""
+        dimensions = ", ".join(SUMMARY_DIMENSIONS)
+        totals = ", ".join(f"TOTAL({expr.format(row='records')})" for expr in SUMMARY_MEASURES.values())
+        self.cursor.execute("DELETE FROM daily_summary")
+        self.cursor.execute(f"""
+            INSERT INTO daily_summary (day, {dimensions}, {", ".join(SUMMARY_MEASURES)})
+            SELECT substr(created_at, 1, 10), {dimensions}, {totals}
+            FROM records
+            GROUP BY substr(created_at, 1, 10), {dimensions}
+        """)
+
+    def get_summary(self, start_date=None, end_date=None, group_by=('city_dest',)):
+        """Return [(group values..., measures...)] from daily_summary, in SUMMARY_MEASURES order.
+
+        Dates are 'YYYY-MM-DD' strings, both bounds included; group_by names
+        keys of SUMMARY_GROUPS. Only the summary table is read.
+        """
+        groups = [SUMMARY_GROUPS[name] for name in group_by]
+        conditions = []
+        params = []
+        if start_date:
+            conditions.append("day >= ?")
+            params.append(start_date)
+        if end_date:
+            conditions.append("day <= ?")
+            params.append(end_date)
+        query = f"""
+            SELECT {", ".join(groups + [f"SUM({name})" for name in SUMMARY_MEASURES])}
+            FROM daily_summary
+        """
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        if groups:
+            query += f" GROUP BY {', '.join(groups)} ORDER BY {', '.join(groups)}"
+        self.cursor.execute(query, params)
+        return self.cursor.fetchall()
+
+    def create_workstation_printers_table(self):
+        """Create the table remembering the last printer used on each workstation."""
+        self.cursor.execute("""
+        CREATE TABLE IF NOT EXISTS workstation_printers (
+            workstation TEXT PRIMARY KEY,
+            printer_name TEXT NOT NULL,
+            printer_uri TEXT NOT NULL,
+            used_at TEXT NOT NULL
+        )
+        """)
+
+    def explain_query_plan(self, query, params=()):
+        """Return the detail lines of EXPLAIN QUERY PLAN for a query."""
+        self.cursor.execute(f"EXPLAIN QUERY PLAN {query}", params)
+        return [row[-1] for row in self.cursor.fetchall()]
 
     def modify_record(self, record_id, data):
         """Modify an existing record in the database with logging."""
@@ -377,3 +1124,148 @@ class Database:
         except Exception as e:
             self.conn.rollback()
             return False, f"Erreur: {str(e)}"
+
+    def add_print_job(self, printer_uri, record_ids, layout, copies=1):
+        """Queue a print job for the given record ids and return its id."""
+        self.cursor.execute("""
+            INSERT INTO print_jobs (printer_uri, record_ids, layout, copies, created_at)
+            VALUES (?, ?, ?, ?, ?)
+        """, (printer_uri, json.dumps(list(record_ids)), layout, copies,
+              datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+        self.conn.commit()
+        return self.cursor.lastrowid
+
+    def next_print_job(self, now):
+        """Return the oldest pending job due at now, or None.
+
+        The row is (id, printer_uri, record_ids, layout, copies, attempts,
+        document), record_ids being decoded from JSON.
+        """
+        self.cursor.execute("""
+            SELECT id, printer_uri, record_ids, layout, copies, attempts, document
+            FROM print_jobs
+            WHERE status = 'pending' AND (next_attempt_at IS NULL OR next_attempt_at <= ?)
+            ORDER BY id
+            LIMIT 1
+        """, (now,))
+        job = self.cursor.fetchone()
+        if job is None:
+            return None
+        return job[:2] + (json.loads(job[2]),) + job[3:]
+
+    def next_print_job_time(self):
+        """Return the earliest next_attempt_at of the pending jobs, or None."""
+        self.cursor.execute("""
+            SELECT MIN(next_attempt_at) FROM print_jobs
+            WHERE status = 'pending' AND next_attempt_at IS NOT NULL
+        """)
+        return self.cursor.fetchone()[0]
+
+    def update_print_job(self, job_id, **fields):
+        """Set the given print_jobs columns (status, attempts, last_error...)."""
+        if 'status' in fields and fields['status'] not in PRINT_JOB_STATUSES:
+            raise ValueError(f"Statut d'impression inconnu: {fields['status']}")
+        fields['modified_at'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        assignments = ", ".join(f"{column} = ?" for column in fields)
+        self.cursor.execute(f"UPDATE print_jobs SET {assignments} WHERE id = ?",
+                            list(fields.values()) + [job_id])
+        self.conn.commit()
+
+    def cancel_print_job(self, job_id):
+        """Cancel a job that has not been printed yet; returns True if it was."""
+        self.cursor.execute("""
+            UPDATE print_jobs SET status = 'cancelled', modified_at = ?
+            WHERE id = ? AND status IN ('pending', 'printing')
+        """, (datetime.now().strftime("%Y-%m-%d %H:%M:%S"), job_id))
+        self.conn.commit()
+        return self.cursor.rowcount > 0
+
+    def reset_interrupted_print_jobs(self):
+        """Put jobs left 'printing' by a crash back to 'pending'; returns their count."""
+        self.cursor.execute("UPDATE print_jobs SET status = 'pending' WHERE status = 'printing'")
+        self.conn.commit()
+        return self.cursor.rowcount
+
+    def get_workstation_printer(self, workstation):
+        """Return (printer_name, printer_uri) last used on a workstation, or None."""
+        self.cursor.execute("""
+            SELECT printer_name, printer_uri FROM workstation_printers WHERE workstation = ?
+        """, (workstation,))
+        return self.cursor.fetchone()
+
+    def set_workstation_printer(self, workstation, printer_name, printer_uri):
+        self.cursor.execute("""
+            INSERT INTO workstation_printers (workstation, printer_name, printer_uri, used_at)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT (workstation) DO UPDATE SET
+                printer_name = excluded.printer_name,
+                printer_uri = excluded.printer_uri,
+                used_at = excluded.used_at
+        """, (workstation, printer_name, printer_uri, datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+        self.conn.commit()
+
+
+def migrate_base_schema(db):
+    """tables users, records et modification_log"""
+    db.create_tables()
+    # Colonnes ajoutées après la première version de l'application
+    db.add_missing_columns('records', [('modified_at', 'TEXT'), ('status', 'TEXT')])
+    db.add_missing_columns('modification_log', [('details', 'TEXT'), ('modified_at', 'TEXT')])
+
+
+def migrate_search_index(db):
+    """index plein texte records_fts"""
+    db.create_search_index()
+    # Indexer les enregistrements créés avant l'index plein texte
+    db.rebuild_search_index()
+
+
+def migrate_secondary_indexes(db):
+    """index secondaires"""
+    db.create_indexes()
+
+
+def migrate_print_jobs(db):
+    """file d'attente d'impression print_jobs"""
+    db.create_print_jobs_table()
+    db.create_indexes()
+
+
+def migrate_workstation_printers(db):
+    """dernière imprimante utilisée par poste"""
+    db.create_workstation_printers_table()
+
+
+def migrate_change_log(db):
+    """journal des changements change_log"""
+    db.create_change_log()
+    db.create_indexes()
+
+
+def migrate_password_hashes(db):
+    """mots de passe hachés et noms d'utilisateur uniques"""
+    db.create_unique_usernames()
+    db.hash_plaintext_passwords()
+    # idx_users_username fait double emploi avec l'index unique
+    db.create_indexes()
+
+
+def migrate_summary_tables(db):
+    """résumés statistiques daily_summary"""
+    db.create_summary_tables()
+    # Résumer les colis enregistrés avant les déclencheurs
+    db.rebuild_summary()
+
+
+# Migrations dans l'ordre : la n-ième amène PRAGMA user_version à n.
+# Ne jamais réordonner ni supprimer une entrée, seulement en ajouter à la fin.
+MIGRATIONS = [
+    migrate_base_schema,
+    migrate_search_index,
+    migrate_secondary_indexes,
+    migrate_print_jobs,
+    migrate_workstation_printers,
+    migrate_change_log,
+    migrate_password_hashes,
+    migrate_summary_tables,
+]
@@ -0,0 +1,104 @@
+"""Export des colis en CSV ou JSONL, éventuellement compressé en gzip.
+
+Les lignes sont lues par lots et écrites au fur et à mesure : la mémoire
+utilisée ne dépend pas du nombre de colis exportés.
+
+Usage : python export.py colis.csv.gz [--format csv] [--gzip] [--from 2024-01-01]
+        [--to 2024-01-31] [--city Rabat] [--status Modifié] [--db users.db]
+"""
+import argparse
+import csv
+import gzip
+import json
+import os
+import sys
+from datetime import datetime
+
+import database
+from database import Database, DB_PATH
+
+EXPORT_DIR = 'exports'
+EXPORT_FORMATS = ('csv', 'jsonl')
+
+
+def open_output(path, compress):
+    if compress:
+        return gzip.open(path, 'wt', encoding='utf-8', newline='')
+    return open(path, 'w', encoding='utf-8', newline='')
+
+
+def write_csv(f, columns, rows):
+    writer = csv.writer(f)
+    writer.writerow(columns)
+    count = 0
+    for row in rows:
+        writer.writerow(row)
+        count += 1
+    return count
+
+
+def write_jsonl(f, columns, rows):
+    count = 0
+    for row in rows:
+        f.write(json.dumps(dict(zip(columns, row)), ensure_ascii=False))
+        f.write('\n')
+        count += 1
+    return count
+
+
+WRITERS = {
+    'csv': write_csv,
+    'jsonl': write_jsonl,
+}
+
+
+def export_records(path, file_format='csv', compress=False, start_date=None, end_date=None,
+                   city=None, status=None):
+    """Write the matching records to path and return how many were exported."""
+    db = Database()
+    try:
+        columns = db.get_record_columns()
+        rows = db.iter_records(start_date=start_date, end_date=end_date, city=city, status=status)
+        with open_output(path, compress) as f:
+            return WRITERS[file_format](f, columns, rows)
+    finally:
+        db.close()
+
+
+def default_export_path(file_format='csv', compress=False):
+    """Timestamped file name in EXPORT_DIR, used by the package list page."""
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    name = f"colis_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{file_format}"
+    if compress:
+        name += '.gz'
+    return os.path.join(EXPORT_DIR, name)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Exporter les colis")
+    parser.add_argument('output', help="fichier de sortie")
+    parser.add_argument('--format', choices=EXPORT_FORMATS, default='csv')
+    parser.add_argument('--gzip', action='store_true', help="compresser la sortie")
+    parser.add_argument('--from', dest='start_date', help="date de début incluse (AAAA-MM-JJ)")
+    parser.add_argument('--to', dest='end_date', help="date de fin incluse (AAAA-MM-JJ)")
+    parser.add_argument('--city', help="ville de destination")
+    parser.add_argument('--status', help="statut du colis")
+    parser.add_argument('--db', default=DB_PATH, help="base SQLite source")
+    args = parser.parse_args(argv)
+
+    database.init_pool(args.db)
+    count = export_records(
+        args.output,
+        file_format=args.format,
+        compress=args.gzip or args.output.endswith('.gz'),
+        start_date=args.start_date,
+        end_date=args.end_date,
+        city=args.city,
+        status=args.status,
+    )
+    print(f"{count} colis exportés vers {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,76 @@
+"""Import d'un manifeste de colis (CSV ou JSONL) dans la base.
+
+Chaque ligne porte les colonnes de RECORD_FIELDS (et éventuellement
+created_at). Les lignes invalides sont ignorées et listées à la fin.
+
+Usage : python import_manifest.py manifeste.csv [--db users.db] [--batch-size 500]
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+
+import database
+from database import Database, DB_PATH, BULK_BATCH_SIZE
+
+
+def read_csv(path):
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        yield from csv.DictReader(f)
+
+
+def read_jsonl(path):
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                # Signalée comme ligne illisible par bulk_insert_records
+                yield None
+
+
+READERS = {
+    'csv': read_csv,
+    'jsonl': read_jsonl,
+}
+
+
+def detect_format(path):
+    extension = os.path.splitext(path)[1].lower().lstrip('.')
+    return 'jsonl' if extension in ('jsonl', 'json', 'ndjson') else 'csv'
+
+
+def import_manifest(path, file_format=None, batch_size=BULK_BATCH_SIZE):
+    """Import a manifest file and return (ids, errors) as bulk_insert_records does."""
+    rows = READERS[file_format or detect_format(path)](path)
+    db = Database()
+    try:
+        return db.bulk_insert_records(rows, batch_size=batch_size)
+    finally:
+        db.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Importer un manifeste de colis")
+    parser.add_argument('manifest', help="fichier CSV ou JSONL")
+    parser.add_argument('--format', choices=sorted(READERS), help="format du fichier (déduit de l'extension par défaut)")
+    parser.add_argument('--db', default=DB_PATH, help="base SQLite cible")
+    parser.add_argument('--batch-size', type=int, default=BULK_BATCH_SIZE, help="lignes par lot d'insertion")
+    args = parser.parse_args(argv)
+
+    database.init_pool(args.db)
+    ids, errors = import_manifest(args.manifest, args.format, args.batch_size)
+
+    print(f"{len(ids)} colis importés, {len(errors)} lignes rejetées")
+    if ids:
+        print(f"IDs attribués : {ids[0][1]} à {ids[-1][1]}")
+    for row_number, message in errors:
+        print(f"  ligne {row_number} : {message}")
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,276 @@
+"""Planches d'étiquettes pour imprimer les colis par lots.
+
+Les étiquettes (QR code + destinataire) sont rendues en parallèle dans un
+pool de processus, assemblées en pages A4 ou rouleau thermique, puis écrites
+page par page : un seul PDF multi-pages ou un répertoire de PNG. Seules les
+pages en cours de rendu sont gardées en mémoire.
+
+Usage : python label_sheet.py etiquettes.pdf [--ids 12 13 14] [--from 2024-01-01]
+        [--to 2024-01-31] [--city Rabat] [--status Modifié] [--layout a4]
+        [--format pdf] [--db users.db]
+"""
+import argparse
+import os
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from functools import lru_cache
+from io import BytesIO
+
+from PIL import Image, ImageDraw, ImageFont
+
+import database
+from database import Database, DB_PATH, record_to_dict
+from qr_payload import encode_payload, LABEL_FIELDS
+from qr_render import render_qr_image
+from tasks import CPU_CONTEXT, CPU_WORKERS
+
+LABEL_DIR = 'labels'
+LABEL_FORMATS = ('pdf', 'png')
+
+# Dimensions en millimètres ; une page thermique contient une seule étiquette
+LAYOUTS = {
+    'a4': {'page_mm': (210, 297), 'dpi': 300, 'columns': 3, 'rows': 8, 'margin_mm': 5},
+    'thermal': {'page_mm': (100, 150), 'dpi': 203, 'columns': 1, 'rows': 1, 'margin_mm': 3},
+}
+
+# Nombre de pages rendues à l'avance par le pool de processus
+PAGES_AHEAD = 2
+
+FONT_NAMES = ("DejaVuSans-Bold.ttf", "Arial Bold.ttf", "arialbd.ttf")
+
+
+def mm_to_px(mm, dpi):
+    return int(round(mm * dpi / 25.4))
+
+
+def label_size(layout):
+    """Return the (width, height) in pixels of one label cell of a layout."""
+    spec = LAYOUTS[layout]
+    page_w, page_h = (mm_to_px(mm, spec['dpi']) for mm in spec['page_mm'])
+    margin = mm_to_px(spec['margin_mm'], spec['dpi'])
+    return ((page_w - 2 * margin) // spec['columns'], (page_h - 2 * margin) // spec['rows'])
+
+
+@lru_cache(maxsize=32)
+def load_font(size):
+    for name in FONT_NAMES:
+        try:
+            return ImageFont.truetype(name, size)
+        except OSError:
+            continue
+    return ImageFont.load_default()
+
+
+def fit_font(draw, lines, width, size):
+    """Largest font, up to size, for which every line fits in width."""
+    font = load_font(size)
+    while size > 8 and max(draw.textlength(line, font=font) for line in lines) > width:
+        size = int(size * 0.9)
+        font = load_font(size)
+    return font
+
+
+def render_label(record, size):
+    """Render one label for a record dict; returns (size, raw grayscale bytes).
+
+    Module-level and picklable so it can run in the process pool; raw bytes
+    are cheaper to send back than a PNG to re-decode.
+    """
+    width, height = size
+    padding = max(4, height // 20)
+    payload = encode_payload(record['id'], {field: record.get(field) for field in LABEL_FIELDS})
+
+    label = Image.new('L', size, 255)
+    draw = ImageDraw.Draw(label)
+    lines = [
+        f"COLIS #{record['id']}",
+        str(record.get('name_dest') or ""),
+        str(record.get('city_dest') or ""),
+        f"{record.get('nmbr_package') or 1} colis",
+    ]
+
+    # Étiquette en portrait (rouleau) : QR code en haut, texte en dessous ;
+    # sinon QR code à gauche, texte à droite
+    if height > width:
+        qr_size = min(width - 2 * padding, height // 2)
+        label.paste(render_qr_image(payload, qr_size, 'M', border=1), ((width - qr_size) // 2, padding))
+        text_box = (padding, qr_size + 2 * padding, width - 2 * padding, height - qr_size - 3 * padding)
+    else:
+        qr_size = min(height - 2 * padding, width // 2)
+        label.paste(render_qr_image(payload, qr_size, 'M', border=1), (padding, (height - qr_size) // 2))
+        text_box = (qr_size + 2 * padding, padding, width - qr_size - 3 * padding, height - 2 * padding)
+
+    x, y, text_width, text_height = text_box
+    line_height = text_height // len(lines)
+    font = fit_font(draw, lines, text_width, max(8, int(line_height * 0.7)))
+    for i, line in enumerate(lines):
+        draw.text((x, y + i * line_height), line, fill=0, font=font)
+    return size, label.tobytes()
+
+
+def compose_page(labels, layout):
+    """Paste rendered labels row by row onto a blank page of the layout."""
+    spec = LAYOUTS[layout]
+    page_size = tuple(mm_to_px(mm, spec['dpi']) for mm in spec['page_mm'])
+    margin = mm_to_px(spec['margin_mm'], spec['dpi'])
+    cell_w, cell_h = label_size(layout)
+
+    page = Image.new('L', page_size, 255)
+    for i, (size, data) in enumerate(labels):
+        row, column = divmod(i, spec['columns'])
+        page.paste(Image.frombytes('L', size, data), (margin + column * cell_w, margin + row * cell_h))
+    return page
+
+
+def render_label_document(records, layout='thermal'):
+    """Render a few record dicts as an in-memory PDF, without the process pool.
+
+    Used to print single labels; batches go through generate_labels.
+    """
+    spec = LAYOUTS[layout]
+    per_page = spec['columns'] * spec['rows']
+    size = label_size(layout)
+    pages = [
+        compose_page([render_label(record, size) for record in records[start:start + per_page]], layout)
+        for start in range(0, len(records), per_page)
+    ]
+    buffer = BytesIO()
+    pages[0].save(buffer, 'PDF', resolution=spec['dpi'], save_all=True, append_images=pages[1:])
+    return buffer.getvalue()
+
+
+class PdfPageWriter:
+    """Append pages to a single PDF file, one save per page."""
+
+    def __init__(self, path, dpi):
+        self.path = path
+        self.dpi = dpi
+        self.pages = 0
+
+    def write(self, page):
+        page.save(self.path, 'PDF', resolution=self.dpi, append=self.pages > 0)
+        self.pages += 1
+
+
+class PngPageWriter:
+    """Write each page as page_0001.png, page_0002.png... in a directory."""
+
+    def __init__(self, path, dpi):
+        self.path = path
+        self.dpi = dpi
+        self.pages = 0
+        os.makedirs(path, exist_ok=True)
+
+    def write(self, page):
+        self.pages += 1
+        page.save(os.path.join(self.path, f"page_{self.pages:04d}.png"), 'PNG', dpi=(self.dpi, self.dpi))
+
+
+WRITERS = {
+    'pdf': PdfPageWriter,
+    'png': PngPageWriter,
+}
+
+
+def generate_labels(path, records, layout='a4', file_format='pdf', total=None, task=None,
+                    workers=CPU_WORKERS):
+    """Render records (rows or dicts) as label pages written to path.
+
+    Labels are rendered PAGES_AHEAD pages ahead in a process pool while the
+    current page is assembled and written. When run as a tasks.Task, progress
+    is reported per page (relative to total if given) and cancellation is
+    checked between pages. Returns (labels, pages) written.
+    """
+    spec = LAYOUTS[layout]
+    per_page = spec['columns'] * spec['rows']
+    size = label_size(layout)
+    writer = WRITERS[file_format](path, spec['dpi'])
+    pending = deque()
+    count = 0
+
+    def flush(labels):
+        nonlocal count
+        writer.write(compose_page([future.result() for future in labels], layout))
+        count += len(labels)
+        if task is not None:
+            task.check_cancelled()
+            progress = count / total if total else 0
+            task.report_progress(progress, f"{count} étiquettes, {writer.pages} pages")
+
+    with ProcessPoolExecutor(max_workers=workers, mp_context=CPU_CONTEXT) as pool:
+        try:
+            for record in records:
+                if not isinstance(record, dict):
+                    record = record_to_dict(record)
+                pending.append(pool.submit(render_label, record, size))
+                if len(pending) >= per_page * PAGES_AHEAD:
+                    flush([pending.popleft() for _ in range(per_page)])
+            while pending:
+                flush([pending.popleft() for _ in range(min(per_page, len(pending)))])
+        except BaseException:
+            for future in pending:
+                future.cancel()
+            raise
+    return count, writer.pages
+
+
+def generate_label_sheet(path, record_ids=None, start_date=None, end_date=None, city=None,
+                         status=None, layout='a4', file_format='pdf', task=None):
+    """Generate labels for the given ids, or else for the records matching the filters."""
+    db = Database()
+    try:
+        if record_ids is not None:
+            record_ids = set(record_ids)
+            records = db.iter_records_by_ids(record_ids)
+            total = len(record_ids)
+        else:
+            records = db.iter_records(start_date=start_date, end_date=end_date, city=city,
+                                      status=status)
+            total = db.count_records(start_date=start_date, end_date=end_date, city=city,
+                                     status=status)
+        return generate_labels(path, records, layout, file_format, total=total, task=task)
+    finally:
+        db.close()
+
+
+def default_label_path(file_format='pdf'):
+    """Timestamped output path in LABEL_DIR (a directory for PNG sets)."""
+    os.makedirs(LABEL_DIR, exist_ok=True)
+    name = f"etiquettes_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+    if file_format == 'pdf':
+        name += '.pdf'
+    return os.path.join(LABEL_DIR, name)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Générer des planches d'étiquettes de colis")
+    parser.add_argument('output', help="fichier PDF ou répertoire PNG de sortie")
+    parser.add_argument('--ids', type=int, nargs='+', help="identifiants des colis")
+    parser.add_argument('--from', dest='start_date', help="date de début incluse (AAAA-MM-JJ)")
+    parser.add_argument('--to', dest='end_date', help="date de fin incluse (AAAA-MM-JJ)")
+    parser.add_argument('--city', help="ville de destination")
+    parser.add_argument('--status', help="statut du colis")
+    parser.add_argument('--layout', choices=sorted(LAYOUTS), default='a4')
+    parser.add_argument('--format', choices=LABEL_FORMATS, default='pdf')
+    parser.add_argument('--db', default=DB_PATH, help="base SQLite source")
+    args = parser.parse_args(argv)
+
+    database.init_pool(args.db)
+    labels, pages = generate_label_sheet(
+        args.output,
+        record_ids=args.ids,
+        start_date=args.start_date,
+        end_date=args.end_date,
+        city=args.city,
+        status=args.status,
+        layout=args.layout,
+        file_format=args.format,
+    )
+    print(f"{labels} étiquettes sur {pages} pages écrites vers {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,5 +1,9 @@
+import math
+
 import flet as ft
-from database import Database
+from auth import authenticate, get_sessions
+from tasks import get_executor
+from throttle import TERMINAL, get_login_throttle
 
 class LoginPage(ft.UserControl):
     def __init__(self, page: ft.Page, go_to_main, go_to_signup):
@@ -47,13 +51,33 @@ class LoginPage(ft.UserControl):
                 )
             )
             return
-            
-        try:
-            db = Database()
-            user = db.get_user(username, password)
-            db.close()
-            
+
+        # Refus immédiat, sans accès à la base, après trop de tentatives
+        throttle = get_login_throttle()
+        terminal = self.page.client_ip or TERMINAL
+        wait = throttle.check(username, terminal)
+        if wait:
+            delay = f"{math.ceil(wait / 60)} min" if wait >= 60 else f"{math.ceil(wait)} s"
+            self.page.show_snack_bar(
+                ft.SnackBar(
+                    content=ft.Text(f"🔒 Trop de tentatives, réessayez dans {delay}"),
+                    bgcolor=ft.colors.RED_400
+                )
+            )
+            return
+
+        def attempt(task):
+            user = authenticate(username, password)
             if user:
+                throttle.record_success(username, terminal)
+            else:
+                throttle.record_failure(username, terminal)
+            return user
+
+        def authenticated(user):
+            if user:
+                # Jeton de session : la navigation ne redemande plus le mot de passe
+                self.page.session.set('session_token', get_sessions().create(user[0], user[1]))
                 self.page.show_snack_bar(
                     ft.SnackBar(
                         content=ft.Text("✅ Connexion réussie"),
@@ -68,14 +92,17 @@ class LoginPage(ft.UserControl):
                         bgcolor=ft.colors.RED_400
                     )
                 )
-        except Exception as e:
+
+        def failed(ex):
             self.page.show_snack_bar(
                 ft.SnackBar(
-                    content=ft.Text(f"❌ Erreur de connexion: {str(e)}"),
+                    content=ft.Text(f"❌ Erreur de connexion: {str(ex)}"),
                     bgcolor=ft.colors.RED_400
                 )
             )
 
+        get_executor().submit(self.page, attempt, on_done=authenticated, on_error=failed)
+
     def build(self):
         return ft.Container(
             content=ft.Column([
@@ -1,21 +1,21 @@
 import flet as ft
-from database import Database
-import qrcode
-from io import BytesIO
-from PIL import Image
-from datetime import datetime
-import cv2
-from pyzbar.pyzbar import decode
-import numpy as np
-import base64
-import time
+from database import Database, RECORD_FIELDS, record_to_dict
+from qr_cache import load_qr_code
+from qr_payload import encode_payload, parse_qr_data, LABEL_FIELDS
+from printer_discovery import get_printer_discovery
+from printing import get_spool_queue
+from tasks import get_executor
+import threading
 
 class MainPage(ft.UserControl):
-    def __init__(self, page: ft.Page, go_to_login, go_to_package_list):
+    def __init__(self, page: ft.Page, go_to_login, go_to_package_list, go_to_dashboard):
         super().__init__()
         self.page = page
         self.go_to_login = go_to_login
         self.go_to_package_list = go_to_package_list
+        self.go_to_dashboard = go_to_dashboard
+        # Dernier colis enregistré, imprimé par do_print
+        self.last_record_id = None
 
         # Champs de la base de données avec style français
         self.name_exp_field = ft.TextField(
@@ -175,10 +175,44 @@ class MainPage(ft.UserControl):
             tooltip="Scanner un QR Code",
             on_click=self.read_qr_code,
         )
+        self.checkin_button = ft.IconButton(
+            icon=ft.icons.DOCUMENT_SCANNER,
+            icon_color=ft.colors.BLUE,
+            icon_size=24,
+            tooltip="Réception continue",
+            on_click=self.start_checkin,
+        )
+
+        # Compteur de la session de réception en cours
+        self.checkin_session = None
+        self.checkin_count = ft.Text("0 colis", size=24, weight=ft.FontWeight.BOLD, color=ft.colors.BLUE)
+        self.checkin_last = ft.Text("Présentez les colis devant la caméra", size=14, color=ft.colors.GREY_700)
+        self.checkin_details = ft.Text("", size=12, color=ft.colors.GREY_500)
+        self.checkin_panel = ft.Container(
+            content=ft.Column([
+                ft.Text("Réception en cours", weight=ft.FontWeight.BOLD, size=16),
+                self.checkin_count,
+                self.checkin_last,
+                self.checkin_details,
+                ft.ElevatedButton(
+                    "Terminer",
+                    icon=ft.icons.STOP,
+                    on_click=self.stop_checkin,
+                    bgcolor=ft.colors.RED,
+                    color=ft.colors.WHITE,
+                ),
+            ], spacing=8),
+            padding=15,
+            border=ft.border.all(1, ft.colors.BLUE_200),
+            border_radius=10,
+            bgcolor=ft.colors.BLUE_50,
+            visible=False,
+        )
 
     def build(self):
         # Créer une liste de contrôles de base
         controls = [
+            self.checkin_panel,
             self.name_exp_field,
             self.city_exp_field,
             self.phone_exp_field,
@@ -218,11 +252,17 @@ class MainPage(ft.UserControl):
                     ft.Text("Accueil", size=20, weight=ft.FontWeight.BOLD),
                     ft.Row([
                         self.read_qr_button,
+                        self.checkin_button,
                         ft.IconButton(
                             icon=ft.icons.LIST_ALT,
                             tooltip="Liste des colis",
                             on_click=self.go_to_package_list
                         ),
+                        ft.IconButton(
+                            icon=ft.icons.BAR_CHART,
+                            tooltip="Statistiques",
+                            on_click=self.go_to_dashboard
+                        ),
                         ft.IconButton(
                             icon=ft.icons.LOGOUT,
                             tooltip="Déconnexion",
@@ -255,108 +295,78 @@ class MainPage(ft.UserControl):
         self.go_to_login()
 
     def add_record(self, e):
+        fields = [
+            self.name_exp_field,
+            self.city_exp_field,
+            self.phone_exp_field,
+            self.name_dest_field,
+            self.phone_dest_field,
+            self.city_dest_field,
+            self.nmbr_package_field,
+            self.gender_package_field,
+            self.value_package_field,
+            self.kilos_field,
+            self.price_field
+        ]
+        # Validate inputs
+        if not all(field.value for field in fields):
+            self.page.show_snack_bar(ft.SnackBar(content=ft.Text("Please fill in all fields")))
+            return
+
+        (name_exp, city_exp, phone_exp, name_dest, phone_dest, city_dest,
+         nmbr_package, gender_package, value_package, kilos, price) = [field.value for field in fields]
         try:
-            # Validate inputs
-            if not all([
-                self.name_exp_field.value,
-                self.city_exp_field.value,
-                self.phone_exp_field.value,
-                self.name_dest_field.value,
-                self.phone_dest_field.value,
-                self.city_dest_field.value,
-                self.nmbr_package_field.value,
-                self.gender_package_field.value,
-                self.value_package_field.value,
-                self.kilos_field.value,
-                self.price_field.value
-            ]):
-                self.page.show_snack_bar(ft.SnackBar(content=ft.Text("Please fill in all fields")))
-                return
+            values = (
+                name_exp, city_exp, phone_exp, name_dest, phone_dest, city_dest,
+                int(nmbr_package), gender_package, float(value_package), float(kilos), float(price),
+            )
+        except ValueError:
+            self.page.show_snack_bar(
+                ft.SnackBar(content=ft.Text("Veuillez entrer des nombres valides"))
+            )
+            return
 
+        def insert(task):
             db = Database()
             try:
                 # Insert record and get the ID
-                record_id = db.insert_record(
-                    self.name_exp_field.value,
-                    self.city_exp_field.value,
-                    self.phone_exp_field.value,
-                    self.name_dest_field.value,
-                    self.phone_dest_field.value,
-                    self.city_dest_field.value,
-                    int(self.nmbr_package_field.value),
-                    self.gender_package_field.value,
-                    float(self.value_package_field.value),
-                    float(self.kilos_field.value),
-                    float(self.price_field.value)
-                )
-
-                # Générer le QR code
-                data = f"""
-                ID: {record_id}
-                EXPEDITEUR:
-                Nom: {self.name_exp_field.value}
-                Ville: {self.city_exp_field.value}
-                Tel: {self.phone_exp_field.value}
-                
-                DESTINATAIRE:
-                Nom: {self.name_dest_field.value}
-                Ville: {self.city_dest_field.value}
-                Tel: {self.phone_dest_field.value}
-                
-                COLIS:
-                Nombre: {self.nmbr_package_field.value}
-                Type: {self.gender_package_field.value}
-                Valeur: {self.value_package_field.value} €
-                Poids: {self.kilos_field.value} Kg
-                Prix: {self.price_field.value} €
-                Date: {datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
-                """
-                
-                # Créer le QR code
-                qr = qrcode.QRCode(
-                    version=None,
-                    error_correction=qrcode.constants.ERROR_CORRECT_H,
-                    box_size=10,
-                    border=4,
-                )
-                qr.add_data(data)
-                qr.make(fit=True)
-                qr_image = qr.make_image(fill_color="black", back_color="white")
-                
-                # Convertir en base64
-                buffer = BytesIO()
-                qr_image.save(buffer, format="PNG")
-                qr_code_data = base64.b64encode(buffer.getvalue()).decode('utf-8')
-                
-                # Créer et afficher l'image
-                if self.qr_code_image is None:
-                    self.qr_code_image = ft.Image(
-                        width=200,
-                        height=200,
-                        fit=ft.ImageFit.CONTAIN,
-                    )
-                
-                self.qr_code_image.src_base64 = qr_code_data
-                
-                self.page.show_snack_bar(
-                    ft.SnackBar(content=ft.Text(f"✅ Colis ajouté avec succès! ID: {record_id}"))
-                )
-                
-                # Clear fields
-                self.clear_fields(None)
-                
+                return db.insert_record(*values)
             finally:
                 db.close()
-                
-        except ValueError as ve:
+
+        def show_qr_code(qr_code_data):
+            # Créer et afficher l'image
+            if self.qr_code_image is None:
+                self.qr_code_image = ft.Image(
+                    width=200,
+                    height=200,
+                    fit=ft.ImageFit.CONTAIN,
+                )
+            self.qr_code_image.src_base64 = qr_code_data
+
+        def on_inserted(record_id):
+            self.last_record_id = record_id
+            # Générer le QR code
+            record = dict(zip(RECORD_FIELDS, values))
+            data = encode_payload(record_id, {field: record[field] for field in LABEL_FIELDS})
+            # Le rendu du QR code se fait dans le pool de processus, sauf s'il est en cache
+            load_qr_code(self.page, data, show_qr_code, on_error, record_id=record_id,
+                         error_correction='H', box_size=10, border=4)
+
             self.page.show_snack_bar(
-                ft.SnackBar(content=ft.Text("Veuillez entrer des nombres valides"))
+                ft.SnackBar(content=ft.Text(f"✅ Colis ajouté avec succès! ID: {record_id}"))
             )
-        except Exception as ex:
+
+            # Clear fields
+            self.clear_fields(None)
+
+        def on_error(ex):
             self.page.show_snack_bar(
                 ft.SnackBar(content=ft.Text(f"❌ Erreur: {str(ex)}"))
             )
 
+        get_executor().submit(self.page, insert, on_done=on_inserted, on_error=on_error)
+
     def clear_fields(self, e):
         for field in [
             self.name_exp_field,
@@ -383,80 +393,95 @@ class MainPage(ft.UserControl):
     def read_qr_code(self, e):
         def scan_qr():
             try:
-                # Initialiser la caméra
-                cap = cv2.VideoCapture(0)
-                
-                while True:
-                    # Lire l'image de la caméra
-                    ret, frame = cap.read()
-                    
-                    # Détecter les QR codes dans l'image
-                    decoded_objects = decode(frame)
-                    
-                    # Dessiner un rectangle autour des QR codes détectés
-                    for obj in decoded_objects:
-                        points = obj.polygon
-                        if len(points) > 4:
-                            hull = cv2.convexHull(np.array([point for point in points], dtype=np.float32))
-                            points = hull
-                        
-                        # Dessiner les points du polygone
-                        n = len(points)
-                        for j in range(n):
-                            cv2.line(frame, points[j], points[(j+1) % n], (0, 255, 0), 3)
-
-                        # Extraire et décoder les données
-                        qr_data = obj.data.decode('utf-8')
-                        
-                        # Fermer la caméra
-                        cap.release()
-                        cv2.destroyAllWindows()
-                        
-                        # Traiter les données du QR code
+                # Import différé : OpenCV et zbar ne sont chargés qu'au premier scan
+                from scanner import QRScanner
+
+                with QRScanner() as scanner:
+                    for qr_data in scanner.codes():
+                        # Traiter le premier QR code lu puis fermer la caméra
                         self.process_qr_data(qr_data)
                         return
-                    
-                    # Afficher le flux vidéo
-                    cv2.imshow('QR Code Scanner', frame)
-                    
-                    # Quitter si 'q' est pressé
-                    if cv2.waitKey(1) & 0xFF == ord('q'):
-                        break
-                
-                # Nettoyer
-                cap.release()
-                cv2.destroyAllWindows()
-                
+
             except Exception as ex:
                 self.page.show_snack_bar(
                     ft.SnackBar(content=ft.Text(f"Erreur de scan: {str(ex)}"))
                 )
+                self.page.update()
+
+        # Lancer le scan dans un thread séparé : la boucle de la caméra dure tout le scan
+        threading.Thread(target=scan_qr, daemon=True).start()
+
+    def start_checkin(self, e):
+        if self.checkin_session is not None:
+            return
 
-        # Lancer le scan dans un thread séparé
-        import threading
-        threading.Thread(target=scan_qr).start()
+        def scanned(session, data):
+            name = data.get('name_dest')
+            self.checkin_last.value = f"Colis #{data['id']}" + (f" - {name}" if name else "")
+
+        def changed(session):
+            self.checkin_count.value = f"{len(session.scanned)} colis"
+            self.checkin_details.value = (
+                f"{session.updated} enregistrés, {session.duplicates} doublons, "
+                f"{session.unknown_codes} codes inconnus"
+            )
+            self.page.update()
+
+        def run():
+            try:
+                session.run()
+                message = f"✅ {session.updated} colis réceptionnés"
+                if session.missing:
+                    message += f", {len(session.missing)} introuvables: {', '.join(map(str, session.missing))}"
+            except Exception as ex:
+                message = f"❌ Erreur de réception: {str(ex)}"
+            self.checkin_session = None
+            self.checkin_panel.visible = False
+            self.page.show_snack_bar(ft.SnackBar(content=ft.Text(message), action="OK"))
+            self.page.update()
+
+        # Import différé : OpenCV et zbar ne sont chargés qu'au premier scan
+        from checkin import CheckInSession
+
+        session = CheckInSession(on_scan=scanned, on_change=changed)
+        self.checkin_session = session
+        self.checkin_count.value = "0 colis"
+        self.checkin_last.value = "Présentez les colis devant la caméra"
+        self.checkin_details.value = ""
+        self.checkin_panel.visible = True
+        self.page.update()
+
+        # La caméra reste ouverte jusqu'à « Terminer » : thread dédié
+        threading.Thread(target=run, daemon=True).start()
+
+    def stop_checkin(self, e):
+        if self.checkin_session is not None:
+            self.checkin_session.stop()
 
     def process_qr_data(self, qr_data):
-        try:
-            # Essayer de traiter comme un QR code de colis
-            lines = qr_data.split('\n')
-            data = {}
-            
-            for line in lines:
-                if ':' in line:
-                    key, value = line.split(':', 1)
-                    data[key.strip()] = value.strip()
-            
-            if 'ID' in data:
-                # C'est un QR code de colis
-                self.show_scanned_details(data)
-            else:
-                # C'est un QR code universel
-                self.show_universal_qr(qr_data)
-                
-        except Exception as ex:
-            # Afficher le contenu brut si le format n'est pas reconnu
+        # Essayer de traiter comme un QR code de colis (format compact ou ancien format texte)
+        payload = parse_qr_data(qr_data)
+        if payload is None:
+            # C'est un QR code universel
             self.show_universal_qr(qr_data)
+            return
+
+        def fetch(task):
+            db = Database()
+            try:
+                return db.get_record(payload['id'])
+            finally:
+                db.close()
+
+        def show(record):
+            # La base fait foi ; le contenu du QR code sert si le colis est inconnu
+            data = dict(payload)
+            if record:
+                data.update(record_to_dict(record))
+            self.show_scanned_details(data)
+
+        get_executor().submit(self.page, fetch, on_done=show,
+                              on_error=lambda ex: self.show_scanned_details(payload))
 
     def show_universal_qr(self, qr_data):
         def close_dialog(e):
@@ -541,8 +566,8 @@ class MainPage(ft.UserControl):
                                    weight=ft.FontWeight.BOLD,
                                    color=ft.colors.BLUE,
                                    size=16),
-                            ft.Text(f"ID Colis: #{data.get('ID', 'N/A')}", size=14),
-                            ft.Text(f"Code de suivi: TR{data.get('ID', '000000'):06d}", size=14),
+                            ft.Text(f"ID Colis: #{data['id']}", size=14),
+                            ft.Text(f"Code de suivi: TR{data['id']:06d}", size=14),
                         ]),
                         padding=10,
                         border=ft.border.all(1, ft.colors.BLUE_200),
@@ -558,15 +583,15 @@ class MainPage(ft.UserControl):
                                    size=16),
                             ft.Row([
                                 ft.Icon(ft.icons.PERSON, size=16, color=ft.colors.BLUE_GREY),
-                                ft.Text(f"Nom: {data.get('Nom', 'N/A')}", size=14),
+                                ft.Text(f"Nom: {data.get('name_exp', 'N/A')}", size=14),
                             ]),
                             ft.Row([
                                 ft.Icon(ft.icons.LOCATION_CITY, size=16, color=ft.colors.BLUE_GREY),
-                                ft.Text(f"Ville: {data.get('Ville', 'N/A')}", size=14),
+                                ft.Text(f"Ville: {data.get('city_exp', 'N/A')}", size=14),
                             ]),
                             ft.Row([
                                 ft.Icon(ft.icons.PHONE, size=16, color=ft.colors.BLUE_GREY),
-                                ft.Text(f"Tél: {data.get('Tel', 'N/A')}", size=14),
+                                ft.Text(f"Tél: {data.get('phone_exp', 'N/A')}", size=14),
                             ]),
                         ]),
                         padding=10,
@@ -583,15 +608,15 @@ class MainPage(ft.UserControl):
                                    size=16),
                             ft.Row([
                                 ft.Icon(ft.icons.PERSON, size=16, color=ft.colors.BLUE_GREY),
-                                ft.Text(f"Nom: {data.get('Nom', 'N/A')}", size=14),
+                                ft.Text(f"Nom: {data.get('name_dest', 'N/A')}", size=14),
                             ]),
                             ft.Row([
                                 ft.Icon(ft.icons.LOCATION_CITY, size=16, color=ft.colors.BLUE_GREY),
-                                ft.Text(f"Ville: {data.get('Ville', 'N/A')}", size=14),
+                                ft.Text(f"Ville: {data.get('city_dest', 'N/A')}", size=14),
                             ]),
                             ft.Row([
                                 ft.Icon(ft.icons.PHONE, size=16, color=ft.colors.BLUE_GREY),
-                                ft.Text(f"Tél: {data.get('Tel', 'N/A')}", size=14),
+                                ft.Text(f"Tél: {data.get('phone_dest', 'N/A')}", size=14),
                             ]),
                         ]),
                         padding=10,
@@ -608,23 +633,23 @@ class MainPage(ft.UserControl):
                                    size=16),
                             ft.Row([
                                 ft.Icon(ft.icons.INVENTORY_2, size=16, color=ft.colors.BLUE_GREY),
-                                ft.Text(f"Nombre: {data.get('Nombre', 'N/A')}", size=14),
+                                ft.Text(f"Nombre: {data.get('nmbr_package', 'N/A')}", size=14),
                             ]),
                             ft.Row([
                                 ft.Icon(ft.icons.CATEGORY, size=16, color=ft.colors.BLUE_GREY),
-                                ft.Text(f"Type: {data.get('Type', 'N/A')}", size=14),
+                                ft.Text(f"Type: {data.get('gender_package', 'N/A')}", size=14),
                             ]),
                             ft.Row([
                                 ft.Icon(ft.icons.ATTACH_MONEY, size=16, color=ft.colors.BLUE_GREY),
-                                ft.Text(f"Valeur: {data.get('Valeur', 'N/A')}", size=14),
+                                ft.Text(f"Valeur: {data.get('value_package', 'N/A')} €", size=14),
                             ]),
                             ft.Row([
                                 ft.Icon(ft.icons.SCALE, size=16, color=ft.colors.BLUE_GREY),
-                                ft.Text(f"Poids: {data.get('Poids', 'N/A')}", size=14),
+                                ft.Text(f"Poids: {data.get('kilos', 'N/A')} Kg", size=14),
                             ]),
                             ft.Row([
                                 ft.Icon(ft.icons.PAYMENTS, size=16, color=ft.colors.BLUE_GREY),
-                                ft.Text(f"Prix: {data.get('Prix', 'N/A')}", size=14),
+                                ft.Text(f"Prix: {data.get('price', 'N/A')} €", size=14),
                             ]),
                         ]),
                         padding=10,
@@ -641,7 +666,7 @@ class MainPage(ft.UserControl):
                                    size=16),
                             ft.Row([
                                 ft.Icon(ft.icons.CALENDAR_TODAY, size=16, color=ft.colors.BLUE_GREY),
-                                ft.Text(f"Date: {data.get('Date', 'N/A')}", size=14),
+                                ft.Text(f"Date: {data.get('created_at', 'N/A')}", size=14),
                             ]),
                             ft.Row([
                                 ft.Icon(ft.icons.LOCAL_SHIPPING, size=16, color=ft.colors.BLUE_GREY),
@@ -684,7 +709,38 @@ class MainPage(ft.UserControl):
             printer_dialog.open = False
             self.page.update()
 
-        def search_printers(printer_type):
+        def search_printers(printer_type, on_found, force=False):
+            # Dialogue affiché en dernier par cette recherche
+            current_dialog = None
+
+            def found(printers):
+                nonlocal current_dialog
+                # Ne pas rouvrir la liste si l'utilisateur l'a déjà quittée
+                if not printers or self.page.dialog is not current_dialog:
+                    return
+                searching_dialog.open = False
+                current_dialog = on_found([
+                    (printer['name'], printer['uri'], "Disponible", printer['description'])
+                    for printer in printers
+                ])
+
+            def completed(printers):
+                if not printers and self.page.dialog is current_dialog:
+                    searching_dialog.open = False
+                    on_found([])
+
+            # Rempli après l'ouverture de la fenêtre : Annuler peut être cliqué avant
+            tasks = []
+            cancelled = False
+
+            def cancel_search(e):
+                nonlocal cancelled
+                cancelled = True
+                for task in tasks:
+                    task.cancel()
+                searching_dialog.open = False
+                self.page.update()
+
             # Animation de recherche
             searching_dialog = ft.AlertDialog(
                 modal=True,
@@ -694,35 +750,29 @@ class MainPage(ft.UserControl):
                     ft.Text(f"Recherche d'imprimantes {printer_type}..."),
                     ft.Text("Veuillez patienter...", color=ft.colors.GREY_500, size=12),
                 ], alignment=ft.MainAxisAlignment.CENTER, spacing=10),
+                actions=[
+                    ft.TextButton("Annuler", icon=ft.icons.CANCEL, on_click=cancel_search),
+                ],
             )
             self.page.dialog = searching_dialog
+            current_dialog = searching_dialog
             searching_dialog.open = True
             self.page.update()
 
-            # Simuler la recherche
-            time.sleep(2)
-            searching_dialog.open = False
+            connection = 'bluetooth' if printer_type == 'bluetooth' else 'network'
+            tasks.extend(get_printer_discovery().discover(self.page, connection, on_update=found,
+                                                        on_complete=completed, force=force))
+            if cancelled:
+                for task in tasks:
+                    task.cancel()
             self.page.update()
 
-            # Liste des imprimantes avec leur statut
-            return {
-                'bluetooth': [
-                    ("HP Printer BT-001", "20:FA:BB:02:00:01", "Disponible", "100%"),
-                    ("Canon PIXMA BT", "20:FA:BB:02:00:02", "Disponible", "85%"),
-                    ("Epson BT Printer", "20:FA:BB:02:00:03", "Occupée", "-"),
-                    ("Brother BT", "20:FA:BB:02:00:04", "Hors ligne", "-"),
-                ],
-                'wifi': [
-                    ("HP LaserJet Pro", "192.168.1.100", "Disponible", "192.168.1.100"),
-                    ("Canon PIXMA WiFi", "192.168.1.101", "Disponible", "192.168.1.101"),
-                    ("Epson WorkForce", "192.168.1.102", "Hors ligne", "-"),
-                    ("Brother WiFi", "192.168.1.103", "Occupée", "192.168.1.103"),
-                ]
-            }.get(printer_type, [])
-
-        def connect_printer(printer_type, e):
+        def connect_printer(printer_type, e, force=False):
+            search_printers(printer_type, lambda printers: show_printers(printer_type, printers),
+                            force=force)
+
+        def show_printers(printer_type, printers):
             try:
-                printers = search_printers(printer_type)
                 if not printers:
                     raise Exception("Aucune imprimante trouvée")
 
@@ -744,7 +794,7 @@ class MainPage(ft.UserControl):
                                     subtitle=ft.Column([
                                         ft.Text(address),
                                         ft.Text(
-                                            f"Signal: {details}" if status == "Disponible" else "",
+                                            details if status == "Disponible" else "",
                                             color=ft.colors.GREY_700,
                                             size=12,
                                         ),
@@ -761,10 +811,10 @@ class MainPage(ft.UserControl):
                                         padding=5,
                                     ),
                                     disabled=status != "Disponible",
-                                    on_click=lambda _, name=name, status=status: 
-                                        select_printer(name) if status == "Disponible" else None,
+                                    on_click=lambda _, name=name, address=address, status=status:
+                                        select_printer(name, address) if status == "Disponible" else None,
                                 )
-                            ] + [ft.Divider(height=1)] if i < len(printers)-1 else [])
+                            ] + ([ft.Divider(height=1)] if i < len(printers)-1 else []))
                         ) for i, (name, address, status, details) in enumerate(printers)
                     ], scroll=ft.ScrollMode.AUTO, height=300),
                     actions=[
@@ -784,64 +834,48 @@ class MainPage(ft.UserControl):
                 def refresh_printers():
                     printer_list.open = False
                     self.page.update()
-                    connect_printer(printer_type, None)
+                    connect_printer(printer_type, None, force=True)
 
-                def select_printer(printer_name):
-                    try:
-                        printer_list.open = False
-                        self.page.update()
-
-                        # Animation de connexion
-                        connecting_dialog = ft.AlertDialog(
-                            modal=True,
-                            title=ft.Text("Connexion à l'imprimante"),
-                            content=ft.Column([
-                                ft.ProgressRing(width=40, height=40, stroke_width=3),
-                                ft.Text(f"Connexion à {printer_name}..."),
-                                ft.Text("Établissement de la connexion...", 
-                                      color=ft.colors.GREY_500, 
-                                      size=12),
-                            ], alignment=ft.MainAxisAlignment.CENTER, spacing=10),
+                def select_printer(printer_name, printer_uri):
+                    printer_list.open = False
+                    if self.last_record_id is None:
+                        self.page.show_snack_bar(
+                            ft.SnackBar(content=ft.Text("Aucun colis à imprimer"))
                         )
-                        self.page.dialog = connecting_dialog
-                        connecting_dialog.open = True
                         self.page.update()
+                        return
 
-                        time.sleep(1.5)
-                        connecting_dialog.open = False
-
-                        # Dialogue d'impression avec barre de progression
-                        progress = ft.ProgressBar(width=400, color=ft.colors.BLUE)
-                        printing_dialog = ft.AlertDialog(
-                            modal=True,
-                            title=ft.Text("Impression en cours"),
-                            content=ft.Column([
-                                ft.Text(f"Imprimante: {printer_name}"),
-                                progress,
-                                ft.Text("Préparation...", 
-                                      color=ft.colors.GREY_700,
-                                      size=14),
-                            ], spacing=20),
-                        )
-
-                        self.page.dialog = printing_dialog
-                        printing_dialog.open = True
-                        self.page.update()
+                    # Dialogue d'impression avec barre de progression
+                    progress = ft.ProgressBar(width=400, color=ft.colors.BLUE)
+                    step_text = ft.Text("Mise en file d'attente...",
+                                        color=ft.colors.GREY_700,
+                                        size=14)
+                    printing_dialog = ft.AlertDialog(
+                        modal=True,
+                        title=ft.Text("Impression en cours"),
+                        content=ft.Column([
+                            ft.Text(f"Imprimante: {printer_name}"),
+                            progress,
+                            step_text,
+                        ], spacing=20),
+                        actions=[
+                            ft.TextButton("Annuler", icon=ft.icons.CANCEL,
+                                          on_click=lambda e: cancel_printing()),
+                        ],
+                    )
+                    self.page.dialog = printing_dialog
+                    printing_dialog.open = True
+                    self.page.update()
 
-                        # Étapes détaillées de l'impression
-                        steps = [
-                            ("Initialisation...", "Configuration de l'imprimante"),
-                            ("Envoi des données...", "Transmission du document"),
-                            ("Impression en cours...", "Impression des pages"),
-                            ("Finalisation...", "Finalisation du travail d'impression")
-                        ]
+                    job_id = None
+                    cancelled = False
 
-                        for i, (step, detail) in enumerate(steps):
-                            time.sleep(0.8)
-                            progress.value = (i + 1) / len(steps)
-                            printing_dialog.content.controls[-1].value = f"{step}\n{detail}"
-                            self.page.update()
+                    def show_progress(value, message):
+                        progress.value = value
+                        step_text.value = message
 
+                    def printed(result):
+                        get_printer_discovery().remember_printer(printer_name, printer_uri)
                         printing_dialog.open = False
                         self.page.show_snack_bar(
                             ft.SnackBar(
@@ -851,16 +885,42 @@ class MainPage(ft.UserControl):
                             )
                         )
 
-                    except Exception as ex:
+                    def failed(ex):
+                        printing_dialog.open = False
                         self.page.show_snack_bar(
                             ft.SnackBar(
                                 content=ft.Text(f"❌ Erreur d'impression: {str(ex)}"),
                                 bgcolor=ft.colors.RED_400,
                             )
                         )
-                    finally:
+
+                    def queued(new_job_id):
+                        nonlocal job_id
+                        job_id = new_job_id
+                        # Annulé pendant l'enregistrement du travail
+                        if cancelled:
+                            get_spool_queue().cancel(job_id)
+
+                    def cancel_printing():
+                        nonlocal cancelled
+                        cancelled = True
+                        if job_id is not None:
+                            get_spool_queue().cancel(job_id)
+                        printing_dialog.open = False
+                        self.page.show_snack_bar(
+                            ft.SnackBar(content=ft.Text("Impression annulée"))
+                        )
                         self.page.update()
 
+                    record_id = self.last_record_id
+                    get_executor().submit(
+                        self.page,
+                        lambda task: get_spool_queue().submit(self.page, printer_uri, [record_id],
+                                                              on_progress=show_progress,
+                                                              on_done=printed, on_error=failed),
+                        on_done=queued, on_error=failed,
+                    )
+
                 def close_printer_list(dialog):
                     dialog.open = False
                     self.page.update()
@@ -868,6 +928,7 @@ class MainPage(ft.UserControl):
                 self.page.dialog = printer_list
                 printer_list.open = True
                 self.page.update()
+                return printer_list
 
             except Exception as ex:
                 self.page.show_snack_bar(
@@ -1,10 +1,17 @@
 import flet as ft
-from database import Database
+from database import Database, PAGE_SIZE, record_to_dict
+from export import export_records, default_export_path
+from printer_discovery import get_printer_discovery
+from printing import get_spool_queue
+from qr_cache import load_qr_code, get_qr_cache
+from qr_payload import encode_payload, LABEL_FIELDS
+from sync import ChangeFollower, get_change_notifier
+from tasks import get_executor
 from datetime import datetime
-import qrcode
-from io import BytesIO
-import base64
-import time
+import threading
+
+# Distance (en pixels) avant la fin de la liste à partir de laquelle on charge la page suivante
+SCROLL_LOAD_THRESHOLD = 300
 
 class PackageListPage(ft.UserControl):
     def __init__(self, page: ft.Page, go_to_main):
@@ -44,16 +51,147 @@ class PackageListPage(ft.UserControl):
             on_click=self.refresh_list,
             rotate=ft.transform.Rotate(0, alignment=ft.alignment.center),
         )
+        self.export_button = ft.IconButton(
+            icon=ft.icons.DOWNLOAD_ROUNDED,
+            icon_color=ft.colors.BLUE,
+            icon_size=24,
+            tooltip="Exporter en CSV",
+            on_click=self.export_list,
+        )
+        self.labels_button = ft.IconButton(
+            icon=ft.icons.QR_CODE_2_ROUNDED,
+            icon_color=ft.colors.BLUE,
+            icon_size=24,
+            tooltip="Étiquettes du jour (PDF)",
+            on_click=self.print_label_sheet,
+        )
+        self.page_size = PAGE_SIZE
+        self.has_more = True
+        # Protège packages, list_view.controls et le seq des changements appliqués
+        self.page_lock = threading.Lock()
+        self.loading_more = False
+        self.list_view = ft.ListView(
+            spacing=8,
+            padding=10,
+            expand=1,
+            height=500,
+            on_scroll=self.on_list_scroll,
+            on_scroll_interval=100,
+        )
         self.load_packages()
         self.current_device_list = None
         self.current_printer_name = None
 
+    def fetch_packages(self, before_id=None):
+        db = Database()
+        try:
+            return db.get_records_page(before_id=before_id, limit=self.page_size)
+        finally:
+            db.close()
+
+    def show_packages(self, packages):
+        self.packages = packages
+        self.has_more = len(packages) == self.page_size
+        self.list_view.controls = [self.build_list_item(package) for package in packages]
+
     def load_packages(self):
+        # Ne charger que la première page, la suite arrive au défilement
         db = Database()
         try:
-            self.packages = db.get_all_records()
+            # Lu avant la page : un changement fait entre les deux est réappliqué, jamais perdu
+            change_seq = db.current_change_seq()
+            packages = db.get_records_page(limit=self.page_size)
         finally:
             db.close()
+        self.show_packages(packages)
+        self.changes = ChangeFollower(change_seq, self.apply_changes, self.page_lock,
+                                      submit=self.submit_background)
+
+    def submit_background(self, fn, on_done, on_error):
+        get_executor().submit(self.page, lambda task: fn(), on_done=on_done, on_error=on_error)
+
+    def refresh_packages(self, on_done=None, on_error=None):
+        """Apply the changes made since the last refresh, fetched in the background."""
+        self.changes.refresh(on_done=on_done, on_error=on_error or self.show_load_error)
+
+    def apply_changes(self, changed, deleted):
+        """Update the existing list items with inserted, updated and deleted records.
+
+        Called by self.changes with page_lock held.
+        """
+        positions = {package[0]: index for index, package in enumerate(self.packages)}
+        newest = self.packages[0][0] if self.packages else 0
+        controls = self.list_view.controls
+
+        added = []
+        for row in changed:
+            index = positions.get(row[0])
+            if index is not None:
+                self.packages[index] = row
+                controls[index] = self.build_list_item(row)
+            elif row[0] > newest:
+                added.append(row)
+            # Sinon colis plus ancien pas encore chargé : il arrivera au défilement
+
+        removed = {positions[record_id] for record_id in deleted if record_id in positions}
+        if removed:
+            kept = [index for index in range(len(self.packages)) if index not in removed]
+            self.packages = [self.packages[index] for index in kept]
+            controls = [controls[index] for index in kept]
+        if added:
+            self.packages = added + self.packages
+            controls = [self.build_list_item(row) for row in added] + controls
+        self.list_view.controls = controls
+
+    def did_mount(self):
+        # Colis ajoutés ou modifiés sur un autre poste, tant que la liste est affichée
+        get_change_notifier().subscribe(self.changes.notify)
+
+    def will_unmount(self):
+        get_change_notifier().unsubscribe(self.changes.notify)
+
+    def refresh_view(self):
+        """Called when the page is shown again: apply the changes made meanwhile."""
+        self.refresh_packages()
+
+    def show_load_error(self, ex):
+        self.page.show_snack_bar(
+            ft.SnackBar(
+                content=ft.Text(f"❌ Erreur de chargement: {str(ex)}"),
+                bgcolor=ft.colors.RED_400,
+            )
+        )
+
+    def load_more_packages(self):
+        # page_lock protège packages et list_view.controls, modifiés aussi par self.changes
+        with self.page_lock:
+            # Un seul chargement à la fois, les évènements de défilement arrivent en rafale
+            if self.loading_more or not self.has_more or not self.packages:
+                return
+            self.loading_more = True
+            before_id = self.packages[-1][0]
+
+        def append(rows):
+            with self.page_lock:
+                self.loading_more = False
+                self.has_more = len(rows) == self.page_size
+                # Ignorer les colis ajoutés entretemps par le journal des changements
+                known = {package[0] for package in self.packages}
+                rows = [row for row in rows if row[0] not in known]
+                self.packages.extend(rows)
+                self.list_view.controls.extend(self.build_list_item(package) for package in rows)
+
+        def failed(ex):
+            with self.page_lock:
+                self.loading_more = False
+            self.show_load_error(ex)
+
+        get_executor().submit(self.page, lambda task: self.fetch_packages(before_id),
+                              on_done=append, on_error=failed)
+
+    def on_list_scroll(self, e):
+        if e.pixels >= e.max_scroll_extent - SCROLL_LOAD_THRESHOLD:
+            self.load_more_packages()
 
     def do_search(self, e):
         search_text = self.search_field.value
@@ -63,17 +201,22 @@ class PackageListPage(ft.UserControl):
             )
             return
             
-        db = Database()
-        try:
-            results = db.search_records(search_text)
+        def search(task):
+            db = Database()
+            try:
+                return db.search_records(search_text)
+            finally:
+                db.close()
+
+        def show_results(results):
             if not results:
                 self.page.show_snack_bar(
                     ft.SnackBar(content=ft.Text("Aucun résultat trouvé", size=16))
                 )
                 return
             self.show_search_results(results)
-        finally:
-            db.close()
+
+        get_executor().submit(self.page, search, on_done=show_results, on_error=self.show_load_error)
 
     def show_search_results(self, results):
         def close_dialog(e):
@@ -183,16 +326,9 @@ class PackageListPage(ft.UserControl):
             self.details_dialog.open = False
             self.page.update()
 
-        # Générer le QR code
-        qr_code_data = self.generate_qr_code(package)
-        
-        # Créer l'image du QR code
-        qr_code_image = ft.Image(
-            src_base64=qr_code_data,
-            width=200,
-            height=200,
-            fit=ft.ImageFit.CONTAIN,
-        )
+        # Le QR code est rendu en arrière-plan et remplace l'indicateur de chargement
+        qr_code_image = self.create_qr_placeholder(200)
+        self.load_qr_image(qr_code_image, package, 200)
 
         # Create content for the dialog
         content = ft.Column(
@@ -333,74 +469,64 @@ class PackageListPage(ft.UserControl):
         self.details_dialog.open = True
         self.page.update()
 
-    def generate_qr_code(self, package):
-        # Créer le contenu du QR code
-        data = f"""
-        COLIS #{package[0]}
-        
-        EXPÉDITEUR:
-        Nom: {package[1]}
-        Ville: {package[2]}
-        Tél: {package[3]}
-        
-        DESTINATAIRE:
-        Nom: {package[4]}
-        Ville: {package[6]}
-        Tél: {package[5]}
-        
-        DÉTAILS COLIS:
-        Nombre: {package[7]}
-        Type: {package[8]}
-        Valeur: {package[9]} €
-        Poids: {package[10]} Kg
-        Prix: {package[11]} €
-        Date: {package[12]}
-        """
-        
-        # Générer le QR code
-        qr = qrcode.QRCode(version=1, box_size=10, border=5)
-        qr.add_data(data)
-        qr.make(fit=True)
-        qr_image = qr.make_image(fill_color="black", back_color="white")
-        
-        # Convertir l'image en base64
-        buffer = BytesIO()
-        qr_image.save(buffer, format="PNG")
-        img_str = base64.b64encode(buffer.getvalue()).decode('utf-8')
-        
-        return img_str
+    def build_qr_data(self, package):
+        # Contenu compact du QR code : id du colis et champs de l'étiquette
+        return encode_payload(package[0], {
+            field: value for field, value in record_to_dict(package).items() if field in LABEL_FIELDS
+        })
+
+    def create_qr_placeholder(self, size):
+        return ft.Container(
+            content=ft.ProgressRing(width=40, height=40, stroke_width=3),
+            width=size,
+            height=size,
+            alignment=ft.alignment.center,
+        )
+
+    def load_qr_image(self, container, package, size):
+        """Show the package QR code in container, rendering it in the process pool on a cache miss."""
+        def show(qr_code_data):
+            container.content = ft.Image(
+                src_base64=qr_code_data,
+                width=size,
+                height=size,
+                fit=ft.ImageFit.CONTAIN,
+            )
+
+        def failed(ex):
+            container.content = ft.Text(f"❌ Erreur de génération du QR code: {str(ex)}",
+                                        color=ft.colors.RED_400, size=12)
+
+        load_qr_code(self.page, self.build_qr_data(package), show, failed, record_id=package[0],
+                     error_correction='M', box_size=10, border=5, version=1)
 
     def build_list_item(self, package):
-        # Get modification count
-        db = Database()
-        try:
-            mods = db.get_record_modifications(package[0])
-            mod_count = len(mods)
-        finally:
-            db.close()
+        # Le nombre de modifications est la dernière colonne de la requête agrégée
+        mod_count = package[-1]
 
         def delete_package(e):
+            def deleted(success):
+                if success:
+                    get_qr_cache().invalidate_record(package[0])
+                    self.page.show_snack_bar(
+                        ft.SnackBar(
+                            content=ft.Text("✅ Colis supprimé avec succès"),
+                            bgcolor=ft.colors.GREEN_400
+                        )
+                    )
+                    # La liste suit le journal des changements, comme pour les autres postes
+                    get_change_notifier().poke()
+                else:
+                    self.page.show_snack_bar(
+                        ft.SnackBar(
+                            content=ft.Text("❌ Erreur lors de la suppression"),
+                            bgcolor=ft.colors.RED_400
+                        )
+                    )
+
             def confirm_delete(e):
                 if e.control.text == "Oui":
-                    db = Database()
-                    try:
-                        if db.delete_record(package[0]):
-                            self.page.show_snack_bar(
-                                ft.SnackBar(
-                                    content=ft.Text("✅ Colis supprimé avec succès"),
-                                    bgcolor=ft.colors.GREEN_400
-                                )
-                            )
-                            self.load_packages()  # Recharger la liste
-                        else:
-                            self.page.show_snack_bar(
-                                ft.SnackBar(
-                                    content=ft.Text("❌ Erreur lors de la suppression"),
-                                    bgcolor=ft.colors.RED_400
-                                )
-                            )
-                    finally:
-                        db.close()
+                    self.delete_record_async(package[0], deleted)
                 confirm_dialog.open = False
                 self.page.update()
 
@@ -584,6 +710,8 @@ class PackageListPage(ft.UserControl):
         )
 
     def print_package(self, package):
+        self.selected_package = package
+
         def show_print_dialog():
             def close_dialog(e):
                 print_dialog.open = False
@@ -591,7 +719,7 @@ class PackageListPage(ft.UserControl):
 
             def show_preview():
                 try:
-                    def start_print_process():
+                    def start_print_process(choose_printer=False):
                         def show_connection_dialog():
                             # Dialogue de sélection de la méthode de connexion
                             connection_dialog = ft.AlertDialog(
@@ -604,7 +732,10 @@ class PackageListPage(ft.UserControl):
                                                 ft.Icon(ft.icons.BLUETOOTH, color=ft.colors.WHITE),
                                                 ft.Text("Bluetooth"),
                                                 ft.Container(
-                                                    content=ft.Text("4 appareils", size=12),
+                                                    content=ft.Text(
+                                                        f"{len(get_printer_discovery().cached('bluetooth'))} appareils",
+                                                        size=12,
+                                                    ),
                                                     bgcolor=ft.colors.BLUE_900,
                                                     padding=5,
                                                     border_radius=10,
@@ -623,7 +754,10 @@ class PackageListPage(ft.UserControl):
                                                 ft.Icon(ft.icons.WIFI_TETHERING, color=ft.colors.WHITE),
                                                 ft.Text("WiFi Direct"),
                                                 ft.Container(
-                                                    content=ft.Text("3 appareils", size=12),
+                                                    content=ft.Text(
+                                                        f"{len(get_printer_discovery().cached('network'))} appareils",
+                                                        size=12,
+                                                    ),
                                                     bgcolor=ft.colors.GREEN_900,
                                                     padding=5,
                                                     border_radius=10,
@@ -642,121 +776,21 @@ class PackageListPage(ft.UserControl):
                                 ),
                             )
 
-                            def search_devices(connection_type):
-                                # Animation de recherche
-                                searching_dialog = ft.AlertDialog(
-                                    modal=True,
-                                    title=ft.Text(f"Recherche d'imprimantes {connection_type}"),
-                                    content=ft.Column([
-                                        ft.ProgressRing(width=40, height=40, stroke_width=3, color=ft.colors.BLUE),
-                                        ft.Text(f"Recherche des périphériques {connection_type}..."),
-                                        ft.Text("Veuillez patienter...", color=ft.colors.GREY_500, size=12),
-                                    ], alignment=ft.MainAxisAlignment.CENTER, spacing=10),
-                                )
-                                
-                                self.page.dialog = searching_dialog
-                                searching_dialog.open = True
-                                self.page.update()
-
-                                # Simuler la recherche
-                                time.sleep(2)
-                                searching_dialog.open = False
-                                self.page.update()
-
-                                # Liste des périphériques
-                                devices = {
-                                    'wifi-direct': [
-                                        (
-                                            "HP LaserJet Pro MFP M283dw", 
-                                            "DIRECT-72-HP M283dw",
-                                            "Excellent (100%)", 
-                                            "Disponible",
-                                            "Impression & Scan WiFi Direct, Recto-verso automatique"
-                                        ),
-                                        ("HP OfficeJet Pro 9020", "192.168.1.100", "Excellent (100%)", "Disponible", "Impression WiFi Direct"),
-                                        ("Brother MFC-L3770CDW", "192.168.1.101", "Très bon (85%)", "Disponible", "Impression & Scan WiFi Direct"),
-                                        ("Canon PIXMA TR8620", "192.168.1.102", "Bon (75%)", "Disponible", "Impression WiFi Direct"),
-                                        ("Epson WorkForce Pro", "192.168.1.103", "Faible (45%)", "Hors ligne", "Non disponible"),
-                                    ],
-                                    'bluetooth': [
-                                        ("HP LaserJet Pro", "20:FA:BB:02:00:01", "100%", "Disponible", ""),
-                                        ("Canon PIXMA", "20:FA:BB:02:00:02", "85%", "Disponible", ""),
-                                        ("Epson EcoTank", "20:FA:BB:02:00:03", "75%", "Occupée", ""),
-                                    ]
-                                }
-
-                                # Créer et afficher le dialogue des périphériques
-                                device_list = self.create_device_list_dialog(devices, connection_type)
-                                self.current_device_list = device_list
-                                self.page.dialog = device_list
-                                device_list.open = True
-                                self.page.update()
-
-                            def connect_device(device_name, connection_type):
-                                try:
-                                    if self.current_device_list:
-                                        self.current_device_list.open = False
-                                        self.page.update()
-
-                                    self.current_printer_name = device_name
-                                    self.show_connection_dialog(device_name, connection_type)
-
-                                except Exception as ex:
-                                    self.show_error("Erreur de connexion", ex)
-
-                            def show_connection_dialog(self, device_name, connection_type):
-                                # Créer le dialogue de connexion
-                                config_dialog = self.create_config_dialog(device_name, connection_type)
-                                self.page.dialog = config_dialog
-                                config_dialog.open = True
-                                self.page.update()
-
-                            def confirm_and_print(self, config_dialog, device_name):
-                                try:
-                                    # Mettre à jour le statut
-                                    config_dialog.content.controls[1].value = "Statut: Connecté"
-                                    config_dialog.content.controls[1].color = ft.colors.GREEN
-                                    config_dialog.content.controls[-2].visible = False
-                                    config_dialog.content.controls[-1].value = "Connexion établie"
-                                    self.page.update()
-
-                                    time.sleep(1)
-                                    config_dialog.open = False
-                                    self.page.update()
-
-                                    # Démarrer l'impression
-                                    self.start_printing(device_name)
-
-                                except Exception as ex:
-                                    self.show_error("Erreur d'impression", ex)
-
-                            def show_error(self, message, ex):
-                                self.page.show_snack_bar(
-                                    ft.SnackBar(
-                                        content=ft.Text(f"❌ {message}: {str(ex)}"),
-                                        bgcolor=ft.colors.RED_400,
-                                    )
-                                )
-                                self.page.update()
-
                             self.page.dialog = connection_dialog
                             connection_dialog.open = True
                             self.page.update()
 
-                        show_connection_dialog()
-
-                    # Générer le QR code pour l'aperçu
-                    qr_code_data = self.generate_qr_code(package)
-                    if not qr_code_data:
-                        raise Exception("Erreur de génération du QR code")
+                        # Imprimante utilisée en dernier sur ce poste : pas de recherche
+                        printer = get_printer_discovery().last_printer
+                        if printer and not choose_printer:
+                            preview_dialog.open = False
+                            self.start_printing(printer['name'], printer['uri'])
+                        else:
+                            show_connection_dialog()
 
-                    # Créer l'image avec le QR code encodé en base64
-                    qr_code_image = ft.Image(
-                        src_base64=qr_code_data,
-                        width=150,
-                        height=150,
-                        fit=ft.ImageFit.CONTAIN,
-                    )
+                    # Générer le QR code pour l'aperçu en arrière-plan
+                    qr_code_image = self.create_qr_placeholder(150)
+                    self.load_qr_image(qr_code_image, package, 150)
 
                     # Container pour le QR code
                     qr_container = ft.Container(
@@ -843,6 +877,11 @@ class PackageListPage(ft.UserControl):
                         ),
                         actions=[
                             ft.TextButton("Fermer", on_click=lambda e: close_preview(preview_dialog)),
+                            ft.TextButton(
+                                "Autre imprimante",
+                                icon=ft.icons.PRINT_OUTLINED,
+                                on_click=lambda e: start_print_process(choose_printer=True),
+                            ),
                             ft.ElevatedButton(
                                 "Imprimer",
                                 icon=ft.icons.PRINT,
@@ -919,21 +958,31 @@ class PackageListPage(ft.UserControl):
         dialog.open = False
         self.page.update()
 
-    def delete_package(self, package):
-        def confirm_delete(e):
+    def delete_record_async(self, record_id, on_deleted):
+        def delete(task):
             db = Database()
             try:
-                if db.delete_record(package[0]):
-                    self.page.show_snack_bar(
-                        ft.SnackBar(content=ft.Text("Colis supprimé avec succès!", size=16))
-                    )
-                    self.load_packages()
-                else:
-                    self.page.show_snack_bar(
-                        ft.SnackBar(content=ft.Text("Erreur lors de la suppression", size=16))
-                    )
+                return db.delete_record(record_id)
             finally:
                 db.close()
+
+        get_executor().submit(self.page, delete, on_done=on_deleted, on_error=self.show_load_error)
+
+    def delete_package(self, package):
+        def deleted(success):
+            if success:
+                get_qr_cache().invalidate_record(package[0])
+                self.page.show_snack_bar(
+                    ft.SnackBar(content=ft.Text("Colis supprimé avec succès!", size=16))
+                )
+                get_change_notifier().poke()
+            else:
+                self.page.show_snack_bar(
+                    ft.SnackBar(content=ft.Text("Erreur lors de la suppression", size=16))
+                )
+
+        def confirm_delete(e):
+            self.delete_record_async(package[0], deleted)
             confirm_dialog.open = False
             self.page.update()
 
@@ -991,10 +1040,18 @@ class PackageListPage(ft.UserControl):
             }
 
             # Mettre à jour dans la base de données
-            db = Database()
-            try:
-                success, message = db.modify_record(package[0], data)
+            def modify(task):
+                db = Database()
+                try:
+                    return db.modify_record(package[0], data)
+                finally:
+                    db.close()
+
+            def modified(result):
+                success, message = result
                 if success:
+                    # Le contenu du QR code a changé avec l'enregistrement
+                    get_qr_cache().invalidate_record(package[0])
                     self.page.show_snack_bar(
                         ft.SnackBar(
                             content=ft.Text("✅ " + message),
@@ -1002,7 +1059,8 @@ class PackageListPage(ft.UserControl):
                         )
                     )
                     close_dialog(e)
-                    self.load_packages()  # Recharger la liste
+                    # Appliquée à la liste par le notifieur, sans second rechargement
+                    get_change_notifier().poke()
                 else:
                     self.page.show_snack_bar(
                         ft.SnackBar(
@@ -1010,15 +1068,16 @@ class PackageListPage(ft.UserControl):
                             bgcolor=ft.colors.RED_400
                         )
                     )
-            except Exception as ex:
+
+            def failed(ex):
                 self.page.show_snack_bar(
                     ft.SnackBar(
                         content=ft.Text(f"Erreur: {str(ex)}"),
                         bgcolor=ft.colors.RED_400
                     )
                 )
-            finally:
-                db.close()
+
+            get_executor().submit(self.page, modify, on_done=modified, on_error=failed)
 
         # Créer les champs du formulaire avec les valeurs actuelles
         name_exp = ft.TextField(
@@ -1124,9 +1183,14 @@ class PackageListPage(ft.UserControl):
         self.page.update()
 
     def show_history(self, package):
-        db = Database()
-        try:
-            mods = db.get_record_modifications(package[0])
+        def fetch(task):
+            db = Database()
+            try:
+                return db.get_record_modifications(package[0])
+            finally:
+                db.close()
+
+        def show(mods):
             if mods:
                 content = "\n".join([
                     f"• {action} le {date}" 
@@ -1149,26 +1213,22 @@ class PackageListPage(ft.UserControl):
             )
             self.page.dialog = history_dialog
             history_dialog.open = True
-            self.page.update()
-        finally:
-            db.close()
 
         def close_history(dialog):
             dialog.open = False
             self.page.update()
 
+        get_executor().submit(self.page, fetch, on_done=show, on_error=self.show_load_error)
+
     def refresh_list(self, e):
         # Animer le bouton de rafraîchissement
         self.refresh_button.rotate.angle += 360
         self.refresh_button.update()
-        
-        try:
-            # Recharger les données
-            self.load_packages()
-            
-            # Mettre à jour l'interface
-            self.update()
-            
+
+        def refreshed():
+            # Réinitialiser la rotation du bouton
+            self.refresh_button.rotate.angle = 0
+
             # Afficher un message de succès
             self.page.show_snack_bar(
                 ft.SnackBar(
@@ -1177,7 +1237,9 @@ class PackageListPage(ft.UserControl):
                     action="OK",
                 )
             )
-        except Exception as ex:
+
+        def failed(ex):
+            self.refresh_button.rotate.angle = 0
             # En cas d'erreur
             self.page.show_snack_bar(
                 ft.SnackBar(
@@ -1186,10 +1248,94 @@ class PackageListPage(ft.UserControl):
                     action="OK",
                 )
             )
-        finally:
-            # Réinitialiser la rotation du bouton
-            self.refresh_button.rotate.angle = 0
-            self.refresh_button.update()
+
+        # Appliquer en arrière-plan les changements depuis le dernier rafraîchissement
+        self.refresh_packages(on_done=refreshed, on_error=failed)
+
+    def export_list(self, e):
+        path = default_export_path('csv')
+
+        def exported(count):
+            self.page.show_snack_bar(
+                ft.SnackBar(
+                    content=ft.Text(f"✅ {count} colis exportés vers {path}"),
+                    bgcolor=ft.colors.GREEN_400,
+                    action="OK",
+                )
+            )
+
+        def failed(ex):
+            self.page.show_snack_bar(
+                ft.SnackBar(
+                    content=ft.Text(f"❌ Erreur lors de l'export: {str(ex)}"),
+                    bgcolor=ft.colors.RED_400,
+                    action="OK",
+                )
+            )
+
+        get_executor().submit(self.page, lambda task: export_records(path, 'csv'),
+                              on_done=exported, on_error=failed)
+
+    def print_label_sheet(self, e):
+        # Import différé : Pillow n'est chargé qu'à la première planche d'étiquettes
+        from label_sheet import generate_label_sheet, default_label_path
+
+        path = default_label_path('pdf')
+        today = datetime.now().strftime("%Y-%m-%d")
+
+        def cancel_labels(e):
+            task.cancel()
+            labels_dialog.open = False
+            self.page.show_snack_bar(ft.SnackBar(content=ft.Text("Génération annulée")))
+            self.page.update()
+
+        labels_dialog = ft.AlertDialog(
+            modal=True,
+            title=ft.Text("Étiquettes du jour"),
+            content=ft.Column([
+                ft.ProgressBar(width=400, color=ft.colors.BLUE),
+                ft.Text("Rendu des QR codes...", color=ft.colors.GREY_700),
+            ], spacing=20, tight=True),
+            actions=[
+                ft.TextButton("Annuler", icon=ft.icons.CANCEL, on_click=cancel_labels),
+            ],
+        )
+        self.page.dialog = labels_dialog
+        labels_dialog.open = True
+        self.page.update()
+
+        def show_progress(value, message):
+            labels_dialog.content.controls[0].value = value
+            labels_dialog.content.controls[1].value = message
+
+        def generated(result):
+            labels, pages = result
+            labels_dialog.open = False
+            message = (f"✅ {labels} étiquettes sur {pages} pages : {path}" if labels
+                       else "Aucun colis enregistré aujourd'hui")
+            self.page.show_snack_bar(
+                ft.SnackBar(
+                    content=ft.Text(message),
+                    bgcolor=ft.colors.GREEN_400 if labels else None,
+                    action="OK",
+                )
+            )
+
+        def failed(ex):
+            labels_dialog.open = False
+            self.page.show_snack_bar(
+                ft.SnackBar(
+                    content=ft.Text(f"❌ Erreur lors de la génération des étiquettes: {str(ex)}"),
+                    bgcolor=ft.colors.RED_400,
+                    action="OK",
+                )
+            )
+
+        task = get_executor().submit(
+            self.page,
+            lambda task: generate_label_sheet(path, start_date=today, end_date=today, task=task),
+            on_done=generated, on_error=failed, on_progress=show_progress,
+        )
 
     def build(self):
         return ft.Container(
@@ -1206,6 +1352,8 @@ class PackageListPage(ft.UserControl):
                                 ft.Row(
                                     [
                                         self.refresh_button,  # Bouton de rafraîchissement
+                                        self.export_button,
+                                        self.labels_button,
                                         ft.IconButton(
                                             icon=ft.icons.ARROW_BACK_ROUNDED,
                                             icon_color=ft.colors.BLUE,
@@ -1245,14 +1393,7 @@ class PackageListPage(ft.UserControl):
                 ft.Container(
                     content=ft.Column(
                         [
-                            ft.ListView(
-                                controls=[self.build_list_item(package) for package in self.packages],
-                                spacing=8,
-                                padding=10,
-                                expand=1,
-                                auto_scroll=True,
-                                height=500,
-                            )
+                            self.list_view,
                         ],
                         scroll=ft.ScrollMode.ALWAYS,
                         expand=True,
@@ -1277,41 +1418,72 @@ class PackageListPage(ft.UserControl):
             bgcolor=ft.colors.BLUE_50,
         )
 
-    def start_printing(self, device_name):
-        try:
-            # Animation de préparation de l'impression
-            printing_dialog = ft.AlertDialog(
-                modal=True,
-                title=ft.Text("Impression en cours"),
-                content=ft.Column([
-                    ft.Text(f"Imprimante: {device_name}"),
-                    ft.ProgressBar(width=400, color=ft.colors.BLUE),
-                    ft.Text("Préparation du document...", color=ft.colors.GREY_700),
-                ], spacing=20),
-            )
+    def start_printing(self, device_name, printer_uri):
+        package = self.selected_package
+        job_id = None
+        cancelled = False
 
-            self.page.dialog = printing_dialog
-            printing_dialog.open = True
+        def cancel_printing(e):
+            nonlocal cancelled
+            cancelled = True
+            if job_id is not None:
+                get_spool_queue().cancel(job_id)
+            printing_dialog.open = False
+            self.page.show_snack_bar(ft.SnackBar(content=ft.Text("Impression annulée")))
             self.page.update()
 
-            # Étapes détaillées de l'impression
-            steps = [
-                ("Préparation...", "Configuration de l'imprimante"),
-                ("Formatage...", "Mise en page du bordereau"),
-                ("Envoi...", "Transmission vers l'imprimante"),
-                ("Impression...", "Impression du bordereau"),
-                ("QR Code...", "Impression du QR code"),
-                ("Finalisation...", "Vérification de la qualité"),
-            ]
-
-            for i, (step, detail) in enumerate(steps):
-                time.sleep(0.8)
-                printing_dialog.content.controls[1].value = (i + 1) / len(steps)
-                printing_dialog.content.controls[2].value = f"{step}\n{detail}"
-                self.page.update()
+        printing_dialog = ft.AlertDialog(
+            modal=True,
+            title=ft.Text("Impression en cours"),
+            content=ft.Column([
+                ft.Text(f"Imprimante: {device_name}"),
+                ft.ProgressBar(width=400, color=ft.colors.BLUE),
+                ft.Text("Mise en file d'attente...", color=ft.colors.GREY_700),
+            ], spacing=20),
+            actions=[
+                ft.TextButton("Annuler", icon=ft.icons.CANCEL, on_click=cancel_printing),
+            ],
+        )
+
+        self.page.dialog = printing_dialog
+        printing_dialog.open = True
+        self.page.update()
+
+        def show_progress(value, message):
+            printing_dialog.content.controls[1].value = value
+            printing_dialog.content.controls[2].value = message
 
-            # Simuler l'impression terminée
-            time.sleep(1)
+        def printed(result):
+            get_printer_discovery().remember_printer(device_name, printer_uri)
+            self.show_print_success(printing_dialog, device_name, printer_uri)
+
+        def failed(ex):
+            printing_dialog.open = False
+            self.page.show_snack_bar(
+                ft.SnackBar(
+                    content=ft.Text(f"❌ Erreur d'impression: {str(ex)}"),
+                    bgcolor=ft.colors.RED_400,
+                )
+            )
+
+        def queued(new_job_id):
+            nonlocal job_id
+            job_id = new_job_id
+            # Annulé pendant l'enregistrement du travail
+            if cancelled:
+                get_spool_queue().cancel(job_id)
+
+        # Le travail est enregistré en base puis envoyé par la file d'impression
+        get_executor().submit(
+            self.page,
+            lambda task: get_spool_queue().submit(self.page, printer_uri, [package[0]],
+                                                  on_progress=show_progress, on_done=printed,
+                                                  on_error=failed),
+            on_done=queued, on_error=failed,
+        )
+
+    def show_print_success(self, printing_dialog, device_name, printer_uri):
+        try:
             printing_dialog.open = False
 
             # Message de succès
@@ -1348,7 +1520,7 @@ class PackageListPage(ft.UserControl):
                     ft.ElevatedButton(
                         "Réimprimer",
                         icon=ft.icons.PRINT,
-                        on_click=lambda e: self.start_printing(device_name),
+                        on_click=lambda e: self.start_printing(device_name, printer_uri),
                         style=ft.ButtonStyle(
                             color=ft.colors.WHITE,
                             bgcolor=ft.colors.BLUE,
@@ -1384,7 +1556,7 @@ class PackageListPage(ft.UserControl):
                 ft.TextButton(
                     "Actualiser",
                     icon=ft.icons.REFRESH,
-                    on_click=lambda e: self.search_devices(connection_type),
+                    on_click=lambda e: self.search_devices(connection_type, force=True),
                 ),
                 ft.TextButton(
                     "Annuler",
@@ -1424,8 +1596,23 @@ class PackageListPage(ft.UserControl):
             ],
         )
 
-    def search_devices(self, connection_type):
-        # Animation de recherche
+    def search_devices(self, connection_type, force=False):
+        device_list = None
+        connection = 'bluetooth' if connection_type == 'bluetooth' else 'network'
+
+        # Rempli après l'ouverture de la fenêtre : Annuler peut être cliqué avant
+        tasks = []
+        cancelled = False
+
+        def cancel_search(e):
+            nonlocal cancelled
+            cancelled = True
+            for task in tasks:
+                task.cancel()
+            searching_dialog.open = False
+            self.page.update()
+
+        # Animation de recherche, remplacée par la liste dès la première imprimante trouvée
         searching_dialog = ft.AlertDialog(
             modal=True,
             title=ft.Text(f"Recherche d'imprimantes {connection_type}"),
@@ -1434,44 +1621,48 @@ class PackageListPage(ft.UserControl):
                 ft.Text(f"Recherche des périphériques {connection_type}..."),
                 ft.Text("Veuillez patienter...", color=ft.colors.GREY_500, size=12),
             ], alignment=ft.MainAxisAlignment.CENTER, spacing=10),
+            actions=[
+                ft.TextButton("Annuler", icon=ft.icons.CANCEL, on_click=cancel_search),
+            ],
         )
-        
+
+        def as_devices(printers):
+            return {
+                connection_type: [
+                    (printer['name'], printer['uri'], "-", "Disponible", printer['description'])
+                    for printer in printers
+                ]
+            }
+
+        def found(printers):
+            nonlocal device_list
+            if not printers:
+                return
+            if device_list is None:
+                searching_dialog.open = False
+                device_list = self.create_device_list_dialog(as_devices(printers), connection_type)
+                self.current_device_list = device_list
+                self.page.dialog = device_list
+                device_list.open = True
+            else:
+                device_list.content = self.create_device_list_content(as_devices(printers), connection_type)
+
+        def completed(printers):
+            if not printers:
+                searching_dialog.open = False
+                self.page.show_snack_bar(
+                    ft.SnackBar(content=ft.Text("Aucune imprimante trouvée"))
+                )
+
         self.page.dialog = searching_dialog
         searching_dialog.open = True
         self.page.update()
 
-        # Simuler la recherche
-        time.sleep(2)
-        searching_dialog.open = False
-        self.page.update()
-
-        # Liste des périphériques
-        devices = {
-            'wifi-direct': [
-                (
-                    "HP LaserJet Pro MFP M283dw", 
-                    "DIRECT-72-HP M283dw",
-                    "Excellent (100%)", 
-                    "Disponible",
-                    "Impression & Scan WiFi Direct, Recto-verso automatique"
-                ),
-                ("HP OfficeJet Pro 9020", "192.168.1.100", "Excellent (100%)", "Disponible", "Impression WiFi Direct"),
-                ("Brother MFC-L3770CDW", "192.168.1.101", "Très bon (85%)", "Disponible", "Impression & Scan WiFi Direct"),
-                ("Canon PIXMA TR8620", "192.168.1.102", "Bon (75%)", "Disponible", "Impression WiFi Direct"),
-                ("Epson WorkForce Pro", "192.168.1.103", "Faible (45%)", "Hors ligne", "Non disponible"),
-            ],
-            'bluetooth': [
-                ("HP LaserJet Pro", "20:FA:BB:02:00:01", "100%", "Disponible", ""),
-                ("Canon PIXMA", "20:FA:BB:02:00:02", "85%", "Disponible", ""),
-                ("Epson EcoTank", "20:FA:BB:02:00:03", "75%", "Occupée", ""),
-            ]
-        }
-
-        # Créer et afficher le dialogue des périphériques
-        device_list = self.create_device_list_dialog(devices, connection_type)
-        self.current_device_list = device_list
-        self.page.dialog = device_list
-        device_list.open = True
+        tasks.extend(get_printer_discovery().discover(self.page, connection, on_update=found,
+                                                    on_complete=completed, force=force))
+        if cancelled:
+            for task in tasks:
+                task.cancel()
         self.page.update()
 
     def create_device_list_content(self, devices, connection_type):
@@ -1513,11 +1704,16 @@ class PackageListPage(ft.UserControl):
                     padding=5,
                 ),
                 disabled=status != "Disponible",
-                on_click=lambda e, name=name: self.connect_device(name, connection_type) 
+                on_click=lambda e, name=name, address=address: self.connect_device(name, address)
                     if status == "Disponible" else None,
             ) for name, address, signal, status, *extra in devices[connection_type]
         ], scroll=ft.ScrollMode.AUTO)
 
+    def connect_device(self, device_name, printer_uri):
+        self.close_device_list()
+        self.current_printer_name = device_name
+        self.start_printing(device_name, printer_uri)
+
     def get_m283dw_config(self):
         return (
             "1. Sur l'écran de l'imprimante, appuyez sur le bouton WiFi Direct\n"
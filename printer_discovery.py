@@ -0,0 +1,211 @@
+"""Recherche des imprimantes en arrière-plan, avec cache.
+
+Les sources (configuration, files CUPS, mDNS, ports série Bluetooth) sont
+interrogées en parallèle ; chaque résultat est transmis dès qu'il arrive et
+gardé DISCOVERY_TTL secondes. L'imprimante utilisée en dernier sur le poste
+est mémorisée en base pour imprimer sans nouvelle recherche.
+"""
+import glob
+import os
+import shutil
+import socket
+import subprocess
+import threading
+import time
+
+from database import Database
+from printing import PRINTERS, RAW_PORT, list_cups_printers
+from tasks import TaskExecutor
+
+DISCOVERY_TTL = 300
+# Durée d'écoute des annonces mDNS, en secondes
+MDNS_TIMEOUT = 3
+# Nom du poste, clé de la dernière imprimante utilisée
+WORKSTATION = socket.gethostname()
+# Service mDNS des imprimantes acceptant l'impression brute sur le port 9100
+MDNS_SERVICE = '_pdl-datastream._tcp'
+
+
+def scan_config():
+    return list(PRINTERS)
+
+
+def scan_mdns():
+    """Raw (port 9100) network printers announced over mDNS, via avahi-browse or ippfind."""
+    found = []
+    try:
+        if shutil.which('avahi-browse'):
+            result = subprocess.run(['avahi-browse', '--resolve', '--terminate', '--parsable', MDNS_SERVICE],
+                                    capture_output=True, text=True, timeout=MDNS_TIMEOUT + 5)
+            # =;interface;protocole;nom;type;domaine;hôte;adresse;port;txt
+            for line in result.stdout.splitlines():
+                fields = line.split(';')
+                if fields[0] == '=' and len(fields) > 8 and fields[2] == 'IPv4':
+                    found.append((fields[3].replace('\\032', ' '), fields[7], fields[8]))
+        elif shutil.which('ippfind'):
+            result = subprocess.run(['ippfind', MDNS_SERVICE, '-T', str(MDNS_TIMEOUT),
+                                     '--exec', 'echo', '{service_hostname}', '{service_port}',
+                                     '{service_name}', ';'],
+                                    capture_output=True, text=True, timeout=MDNS_TIMEOUT + 5)
+            for line in result.stdout.splitlines():
+                parts = line.split(maxsplit=2)
+                if len(parts) == 3:
+                    found.append((parts[2], parts[0], parts[1]))
+    except (OSError, subprocess.TimeoutExpired):
+        return []
+
+    return [
+        {
+            'name': name,
+            'uri': f"socket://{host}:{port or RAW_PORT}",
+            'connection': 'network',
+            'description': f"Réseau (mDNS), {host}",
+        }
+        for name, host, port in found
+    ]
+
+
+def scan_bluetooth():
+    """ESC/POS printers bound to a Bluetooth serial port (rfcomm bind)."""
+    return [
+        {
+            'name': f"Imprimante Bluetooth ({os.path.basename(device)})",
+            'uri': f"escpos:{device}",
+            'connection': 'bluetooth',
+            'description': "ESC/POS, port série Bluetooth",
+        }
+        for device in sorted(glob.glob('/dev/rfcomm*'))
+    ]
+
+
+# Sources interrogées, dans l'ordre d'affichage des imprimantes trouvées
+DISCOVERY_SOURCES = {
+    'config': scan_config,
+    'cups': list_cups_printers,
+    'mdns': scan_mdns,
+    'bluetooth': scan_bluetooth,
+}
+
+
+class PrinterDiscovery:
+    def __init__(self, sources=DISCOVERY_SOURCES, ttl=DISCOVERY_TTL, workstation=WORKSTATION):
+        self.sources = sources
+        self.ttl = ttl
+        self.workstation = workstation
+        self.last_printer = None
+        self._cache = {}
+        self._lock = threading.Lock()
+        # Pool dédié : une recherche mDNS ne doit pas occuper les threads des accès à la base
+        self._executor = TaskExecutor(io_workers=len(sources))
+
+    def _merge(self, results, connection):
+        printers = []
+        seen = set()
+        for name in self.sources:
+            for printer in results.get(name, []):
+                if printer['uri'] in seen:
+                    continue
+                if connection is None or printer['connection'] in (None, connection):
+                    seen.add(printer['uri'])
+                    printers.append(printer)
+        return printers
+
+    def _fresh(self, force=False):
+        now = time.monotonic()
+        with self._lock:
+            return {
+                name: printers for name, (found_at, printers) in self._cache.items()
+                if not force and now - found_at < self.ttl
+            }
+
+    def cached(self, connection=None):
+        """Printers found by the sources whose results are still fresh."""
+        return self._merge(self._fresh(), connection)
+
+    def discover(self, page, connection=None, on_update=None, on_complete=None, force=False):
+        """Look for printers, returning the Tasks of the sources being scanned.
+
+        on_update(printers) is called with everything found so far: right
+        away with the cached results, then each time a source adds printers.
+        on_complete(printers) is called once every source has answered.
+        force ignores the cache. Cancel with task.cancel() on each Task.
+        """
+        results = self._fresh(force)
+        pending = [name for name in self.sources if name not in results]
+        shown = self._merge(results, connection) if results else None
+        if shown is not None and on_update is not None:
+            on_update(shown)
+        if not pending:
+            if on_complete is not None:
+                on_complete(self._merge(results, connection))
+            return []
+
+        remaining = len(pending)
+
+        def answered(name, printers):
+            nonlocal remaining, shown
+            with self._lock:
+                if printers is not None:
+                    self._cache[name] = (time.monotonic(), printers)
+                    results[name] = printers
+                remaining -= 1
+                complete = remaining == 0
+                merged = self._merge(results, connection)
+            # Pas de mise à jour si la source n'apporte rien pour ce type de connexion
+            if merged != shown and on_update is not None:
+                shown = merged
+                on_update(merged)
+            if complete and on_complete is not None:
+                on_complete(merged)
+
+        def failed(name, ex):
+            print(f"Erreur de recherche d'imprimantes ({name}): {ex}")
+            answered(name, None)
+
+        return [
+            self._executor.submit(page, lambda task, scan=self.sources[name]: scan(),
+                                  on_done=lambda printers, name=name: answered(name, printers),
+                                  on_error=lambda ex, name=name: failed(name, ex))
+            for name in pending
+        ]
+
+    def load_last_printer(self):
+        """Read the printer last used on this workstation (database access)."""
+        db = Database()
+        try:
+            printer = db.get_workstation_printer(self.workstation)
+        finally:
+            db.close()
+        if printer is not None:
+            self.last_printer = {'name': printer[0], 'uri': printer[1]}
+        return self.last_printer
+
+    def remember_printer(self, name, uri):
+        """Make (name, uri) the default printer of this workstation, saved in the background."""
+        self.last_printer = {'name': name, 'uri': uri}
+
+        def save(task):
+            db = Database()
+            try:
+                db.set_workstation_printer(self.workstation, name, uri)
+            finally:
+                db.close()
+
+        self._executor.submit(None, save)
+
+    def prefetch(self):
+        """Fill the cache and load the last printer without blocking (at startup)."""
+        self._executor.submit(None, lambda task: self.load_last_printer())
+        self.discover(None)
+
+
+_discovery = None
+_discovery_lock = threading.Lock()
+
+
+def get_printer_discovery():
+    global _discovery
+    with _discovery_lock:
+        if _discovery is None:
+            _discovery = PrinterDiscovery()
+    return _discovery
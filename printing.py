@@ -0,0 +1,431 @@
+"""Impression des étiquettes : backends d'imprimante et file d'attente persistante.
+
+Une imprimante est désignée par une URI, qui choisit le backend :
+
+    cups:NomImprimante     file CUPS, via la commande lp
+    socket://hôte:9100     impression brute (JetDirect) d'un PDF
+    escpos://hôte:9100     imprimante thermique ESC/POS en réseau
+    escpos:/dev/rfcomm0    imprimante thermique ESC/POS sur un port série
+                           (Bluetooth, USB)
+    file:répertoire        écrit les documents dans un répertoire (essais)
+
+SpoolQueue enregistre chaque travail dans la table print_jobs avant de
+l'envoyer. Les travaux interrompus par un arrêt brutal sont repris au
+démarrage suivant ; un envoi qui échoue est retenté après RETRY_DELAYS.
+"""
+import os
+import re
+import shutil
+import socket
+import subprocess
+import threading
+from datetime import datetime, timedelta
+from urllib.parse import urlsplit
+
+from database import Database, record_to_dict
+from qr_payload import encode_payload, LABEL_FIELDS
+from tasks import TaskCancelled
+
+# Mise en page des étiquettes envoyées aux imprimantes PDF (voir label_sheet.LAYOUTS)
+LABEL_LAYOUT = 'thermal'
+RAW_PORT = 9100
+SOCKET_TIMEOUT = 10
+LP_TIMEOUT = 30
+CHUNK_SIZE = 16 * 1024
+# Délais (en secondes) avant chaque nouvelle tentative
+RETRY_DELAYS = (5, 30, 120)
+MAX_ATTEMPTS = len(RETRY_DELAYS) + 1
+FILE_SINK_DIR = 'prints'
+
+# Imprimantes connues du poste. 'connection' vaut 'network' ou 'bluetooth' ;
+# None pour une imprimante proposée quel que soit le type de connexion.
+PRINTERS = [
+    {
+        'name': "HP LaserJet Pro MFP M283dw",
+        'uri': "socket://192.168.223.1:9100",
+        'connection': 'network',
+        'description': "Impression WiFi Direct, port 9100",
+    },
+    {
+        'name': "Imprimante thermique Bluetooth",
+        'uri': "escpos:/dev/rfcomm0",
+        'connection': 'bluetooth',
+        'description': "ESC/POS, étiquettes 80 mm",
+    },
+    {
+        'name': "Fichier PDF",
+        'uri': f"file:{FILE_SINK_DIR}",
+        'connection': None,
+        'description': f"Enregistre les étiquettes dans {FILE_SINK_DIR}/",
+    },
+]
+
+
+class PrinterError(Exception):
+    """Raised when a document cannot be sent to a printer.
+
+    retryable is False for errors that another attempt cannot fix (unknown
+    printer URI, parcel deleted...).
+    """
+
+    def __init__(self, message, retryable=True):
+        super().__init__(message)
+        self.retryable = retryable
+
+
+class PrinterBackend:
+    """Sends rendered documents to one printer; subclasses implement send()."""
+
+    extension = 'pdf'
+
+    def render(self, records, layout=LABEL_LAYOUT):
+        """Return the document bytes printing the labels of the given record dicts."""
+        # Import différé : Pillow n'est chargé qu'à la première impression
+        from label_sheet import render_label_document
+
+        return render_label_document(records, layout)
+
+    def send(self, document, title, progress):
+        """Send document, calling progress(fraction) as data is written.
+
+        progress may raise TaskCancelled to abort the transfer.
+        """
+        raise NotImplementedError
+
+
+class CupsBackend(PrinterBackend):
+    def __init__(self, printer):
+        self.printer = printer
+
+    def send(self, document, title, progress):
+        progress(0)
+        try:
+            result = subprocess.run(['lp', '-d', self.printer, '-t', title], input=document,
+                                    capture_output=True, timeout=LP_TIMEOUT)
+        except FileNotFoundError:
+            raise PrinterError("Commande lp introuvable : CUPS n'est pas installé", retryable=False)
+        except subprocess.TimeoutExpired:
+            raise PrinterError(f"CUPS ne répond pas ({self.printer})")
+        if result.returncode != 0:
+            message = result.stderr.decode('utf-8', errors='replace').strip()
+            raise PrinterError(message or f"Échec de lp (code {result.returncode})")
+        progress(1)
+
+
+class RawSocketBackend(PrinterBackend):
+    """Raw TCP printing (JetDirect / AppSocket, port 9100)."""
+
+    def __init__(self, host, port=RAW_PORT):
+        self.host = host
+        self.port = port
+
+    def write_chunks(self, stream, document, progress):
+        total = len(document) or 1
+        for start in range(0, len(document), CHUNK_SIZE):
+            stream(document[start:start + CHUNK_SIZE])
+            progress(min(1, (start + CHUNK_SIZE) / total))
+
+    def send(self, document, title, progress):
+        progress(0)
+        try:
+            with socket.create_connection((self.host, self.port), timeout=SOCKET_TIMEOUT) as sock:
+                self.write_chunks(sock.sendall, document, progress)
+        except OSError as ex:
+            raise PrinterError(f"Imprimante {self.host}:{self.port} injoignable: {ex}")
+
+
+class EscPosBackend(RawSocketBackend):
+    """ESC/POS thermal printer, over the network or a serial device."""
+
+    extension = 'bin'
+    ENCODING = 'cp1252'
+
+    def __init__(self, host=None, port=RAW_PORT, device=None):
+        super().__init__(host, port)
+        self.device = device
+
+    def render(self, records, layout=LABEL_LAYOUT):
+        # L'imprimante dessine elle-même le QR code et le texte : pas de PDF
+        return b"".join(self.render_label(record) for record in records)
+
+    def render_label(self, record):
+        payload = encode_payload(record['id'], {field: record.get(field) for field in LABEL_FIELDS})
+        data = payload.encode('ascii')
+        store_length = len(data) + 3
+        return b"".join([
+            b"\x1b@",            # initialisation
+            b"\x1bt\x10",        # table de caractères WPC1252 (accents)
+            b"\x1ba\x01",        # centré
+            b"\x1d(k\x04\x001A2\x00",   # QR code modèle 2
+            b"\x1d(k\x03\x001C\x06",    # taille des modules
+            b"\x1d(k\x03\x001E1",       # correction d'erreur M
+            b"\x1d(k" + bytes([store_length % 256, store_length // 256]) + b"1P0" + data,
+            b"\x1d(k\x03\x001Q0",       # impression du QR code
+            b"\n\x1bE\x01\x1d!\x11",    # gras, double taille
+            self.encode(f"COLIS #{record['id']}\n"),
+            b"\x1d!\x00\x1bE\x00",
+            self.encode(f"{record.get('name_dest') or ''}\n{record.get('city_dest') or ''}\n"),
+            self.encode(f"{record.get('nmbr_package') or 1} colis\n"),
+            b"\x1bd\x04",        # avance de 4 lignes
+            b"\x1dVB\x00",       # coupe partielle
+        ])
+
+    def encode(self, text):
+        return text.encode(self.ENCODING, errors='replace')
+
+    def send(self, document, title, progress):
+        if self.device is None:
+            return super().send(document, title, progress)
+        progress(0)
+        try:
+            with open(self.device, 'wb', buffering=0) as device:
+                self.write_chunks(device.write, document, progress)
+        except OSError as ex:
+            raise PrinterError(f"Imprimante {self.device} indisponible: {ex}")
+
+
+class FileBackend(PrinterBackend):
+    """Writes each document to a directory instead of printing it."""
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def send(self, document, title, progress):
+        progress(0)
+        os.makedirs(self.directory, exist_ok=True)
+        name = re.sub(r"[^\w.-]+", "_", title)
+        path = os.path.join(self.directory,
+                            f"{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}_{name}.{self.extension}")
+        with open(path, 'wb') as f:
+            f.write(document)
+        progress(1)
+
+
+def get_backend(uri):
+    """Return the PrinterBackend for a printer URI (see the module docstring)."""
+    if uri.startswith('cups:'):
+        return CupsBackend(uri[len('cups:'):])
+    if uri.startswith('file:'):
+        return FileBackend(uri[len('file:'):].removeprefix('//') or FILE_SINK_DIR)
+    if uri.startswith('escpos:') and not uri.startswith('escpos://'):
+        return EscPosBackend(device=uri[len('escpos:'):])
+
+    parts = urlsplit(uri)
+    if parts.scheme in ('socket', 'escpos') and parts.hostname:
+        backend_class = RawSocketBackend if parts.scheme == 'socket' else EscPosBackend
+        return backend_class(parts.hostname, parts.port or RAW_PORT)
+    raise PrinterError(f"URI d'imprimante non prise en charge: {uri}", retryable=False)
+
+
+def list_cups_printers():
+    """Return the CUPS destinations of this workstation, or [] without CUPS."""
+    if shutil.which('lpstat') is None:
+        return []
+    try:
+        result = subprocess.run(['lpstat', '-e'], capture_output=True, text=True, timeout=LP_TIMEOUT)
+    except (OSError, subprocess.TimeoutExpired):
+        return []
+    return [
+        {'name': name, 'uri': f"cups:{name}", 'connection': 'network', 'description': "File CUPS"}
+        for name in result.stdout.split()
+    ]
+
+
+class SpoolQueue:
+    """Background print queue backed by the print_jobs table.
+
+    A single worker thread sends jobs one at a time, oldest first. Callbacks
+    registered by submit() are called from the worker, followed by
+    page.update(), like the callbacks of tasks.TaskExecutor.
+    """
+
+    def __init__(self, max_attempts=MAX_ATTEMPTS):
+        self.max_attempts = max_attempts
+        self._listeners = {}
+        self._cancelled = set()
+        self._wakeup = False
+        self._stopping = False
+        self._thread = None
+        self._condition = threading.Condition()
+
+    def start(self):
+        with self._condition:
+            if self._thread is not None:
+                return
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name="colis-spool", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=None):
+        with self._condition:
+            self._stopping = True
+            self._condition.notify()
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            thread.join(timeout)
+
+    def submit(self, page, printer_uri, record_ids, copies=1, layout=LABEL_LAYOUT,
+               on_progress=None, on_done=None, on_error=None):
+        """Persist a job and wake the worker; returns the job id.
+
+        on_progress(value, message) reports progress between 0 and 1,
+        on_done(job_id) is called once printed and on_error(ex) once all
+        attempts have failed. Does a database write: call it off the UI thread.
+        """
+        get_backend(printer_uri)
+        db = Database()
+        try:
+            job_id = db.add_print_job(printer_uri, record_ids, layout, copies)
+        finally:
+            db.close()
+        with self._condition:
+            self._listeners[job_id] = (page, on_progress, on_done, on_error)
+            self._wakeup = True
+            self._condition.notify()
+        return job_id
+
+    def cancel(self, job_id):
+        """Cancel a pending job, or abort it between two chunks if it is being sent."""
+        with self._condition:
+            self._cancelled.add(job_id)
+            self._listeners.pop(job_id, None)
+            self._wakeup = True
+            self._condition.notify()
+
+    def _notify(self, job_id, index, *args, final=False):
+        with self._condition:
+            listener = self._listeners.pop(job_id, None) if final else self._listeners.get(job_id)
+        if listener is None or listener[index] is None:
+            return
+        try:
+            listener[index](*args)
+            if listener[0] is not None:
+                listener[0].update()
+        except Exception as ex:
+            print(f"Erreur dans un rappel d'impression: {ex}")
+
+    def _run(self):
+        db = Database()
+        try:
+            resumed = db.reset_interrupted_print_jobs()
+            if resumed:
+                print(f"{resumed} travaux d'impression interrompus remis en file d'attente")
+        finally:
+            db.close()
+
+        while True:
+            with self._condition:
+                if self._stopping:
+                    return
+                self._wakeup = False
+                cancelled, self._cancelled = self._cancelled, set()
+            try:
+                timeout = self._process(cancelled)
+            except Exception as ex:
+                print(f"Erreur de la file d'impression: {ex}")
+                timeout = RETRY_DELAYS[0]
+            with self._condition:
+                if not self._wakeup and not self._stopping:
+                    self._condition.wait(timeout)
+
+    def _process(self, cancelled):
+        """Send the next due job; return how long to wait before looking again."""
+        # Connexion rendue au pool entre deux travaux
+        db = Database()
+        try:
+            for job_id in cancelled:
+                db.cancel_print_job(job_id)
+
+            job = db.next_print_job(datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+            if job is None:
+                # Rien à imprimer : attendre un nouveau travail ou la prochaine tentative
+                next_time = db.next_print_job_time()
+                if next_time is None:
+                    return None
+                due = datetime.strptime(next_time, "%Y-%m-%d %H:%M:%S")
+                return max(0, (due - datetime.now()).total_seconds()) + 0.1
+        finally:
+            db.close()
+
+        self._print(job)
+        return 0
+
+    def _print(self, job):
+        job_id, printer_uri, record_ids, layout, copies, attempts, document = job
+        attempts += 1
+
+        def check_cancelled():
+            with self._condition:
+                if job_id in self._cancelled:
+                    raise TaskCancelled()
+
+        error = None
+        try:
+            db = Database()
+            try:
+                db.update_print_job(job_id, status='printing', attempts=attempts)
+                backend = get_backend(printer_uri)
+                if document is None:
+                    self._notify(job_id, 1, 0, "Mise en page de l'étiquette...")
+                    records = [record_to_dict(row) for row in db.iter_records_by_ids(record_ids)]
+                    if not records:
+                        raise PrinterError("Colis introuvable", retryable=False)
+                    document = backend.render(records, layout)
+                    # Conservé pour les nouvelles tentatives et la reprise après un arrêt
+                    db.update_print_job(job_id, document=document)
+            finally:
+                db.close()
+
+            # L'envoi peut bloquer longtemps : aucune connexion du pool n'est gardée pendant ce temps
+            title = "Colis " + ", ".join(str(record_id) for record_id in record_ids)
+            for copy in range(copies):
+                def progress(value, copy=copy):
+                    check_cancelled()
+                    self._notify(job_id, 1, (copy + value) / copies,
+                                 f"Envoi vers l'imprimante... ({copy + 1}/{copies})")
+
+                backend.send(document, title, progress)
+        except Exception as ex:
+            error = ex
+
+        db = Database()
+        try:
+            self._record_result(db, job_id, attempts, error)
+        finally:
+            db.close()
+
+    def _record_result(self, db, job_id, attempts, error):
+        if isinstance(error, TaskCancelled):
+            db.cancel_print_job(job_id)
+            with self._condition:
+                self._cancelled.discard(job_id)
+            return
+        if error is not None:
+            retryable = getattr(error, 'retryable', True)
+            if retryable and attempts < self.max_attempts:
+                delay = RETRY_DELAYS[min(attempts, len(RETRY_DELAYS)) - 1]
+                next_attempt = (datetime.now() + timedelta(seconds=delay)).strftime("%Y-%m-%d %H:%M:%S")
+                db.update_print_job(job_id, status='pending', next_attempt_at=next_attempt,
+                                    last_error=str(error))
+                self._notify(job_id, 1, 0, f"Échec: {error}\nNouvelle tentative dans {delay} s")
+            else:
+                db.update_print_job(job_id, status='failed', last_error=str(error))
+                self._notify(job_id, 3, error, final=True)
+            return
+
+        db.update_print_job(job_id, status='done', document=None, last_error=None)
+        self._notify(job_id, 2, job_id, final=True)
+
+
+_spool = None
+_spool_lock = threading.Lock()
+
+
+def get_spool_queue():
+    """Shared print queue, started on first use (which resumes interrupted jobs)."""
+    global _spool
+    with _spool_lock:
+        if _spool is None:
+            _spool = SpoolQueue()
+            _spool.start()
+    return _spool
@@ -0,0 +1,191 @@
+"""Cache LRU des QR codes rendus (PNG en base64).
+
+La clé est une empreinte SHA-256 du contenu encodé et des paramètres de
+rendu : un colis modifié produit un contenu différent, donc une nouvelle
+clé. invalidate_record() libère les entrées d'un colis modifié ou supprimé.
+Un répertoire optionnel conserve les PNG d'une session à l'autre ; au-delà
+de QR_CACHE_DISK_FILES fichiers, les moins récemment utilisés sont supprimés.
+"""
+import base64
+import glob
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+from tasks import get_executor
+
+QR_CACHE_SIZE = 256
+# Répertoire du cache disque, None pour le désactiver
+QR_CACHE_DIR = None
+# Nombre maximal de PNG dans le cache disque
+QR_CACHE_DISK_FILES = 5000
+
+
+class QRCache:
+    def __init__(self, max_size=QR_CACHE_SIZE, cache_dir=QR_CACHE_DIR, max_disk_files=QR_CACHE_DISK_FILES):
+        self.max_size = max_size
+        self.cache_dir = cache_dir
+        self.max_disk_files = max_disk_files
+        self.hits = 0
+        self.misses = 0
+        # clé -> (PNG en base64, id du colis ou None)
+        self._entries = OrderedDict()
+        self._record_keys = {}
+        self._disk_files = 0
+        self._lock = threading.Lock()
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+            self._disk_files = len(glob.glob(os.path.join(cache_dir, "*.png")))
+
+    @staticmethod
+    def make_key(data, error_correction, box_size, border, version):
+        params = f"{error_correction}|{box_size}|{border}|{version}|"
+        return hashlib.sha256((params + data).encode('utf-8')).hexdigest()
+
+    def _disk_path(self, key, record_id):
+        prefix = record_id if record_id is not None else "x"
+        return os.path.join(self.cache_dir, f"{prefix}_{key}.png")
+
+    def get(self, key, record_id=None):
+        """Return the cached base64 PNG for key, or None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+
+        if self.cache_dir:
+            path = self._disk_path(key, record_id)
+            if os.path.exists(path):
+                with open(path, 'rb') as f:
+                    value = base64.b64encode(f.read()).decode('utf-8')
+                # La date de modification sert d'ordre LRU au nettoyage du disque
+                os.utime(path)
+                self.put(key, value, record_id, write_disk=False)
+                with self._lock:
+                    self.hits += 1
+                return value
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, value, record_id=None, write_disk=True):
+        with self._lock:
+            self._entries[key] = (value, record_id)
+            self._entries.move_to_end(key)
+            if record_id is not None:
+                self._record_keys.setdefault(record_id, set()).add(key)
+            while len(self._entries) > self.max_size:
+                self._forget(*self._entries.popitem(last=False))
+
+        if self.cache_dir and write_disk:
+            path = self._disk_path(key, record_id)
+            is_new = not os.path.exists(path)
+            with open(path, 'wb') as f:
+                f.write(base64.b64decode(value))
+            if is_new:
+                with self._lock:
+                    self._disk_files += 1
+                    prune = self._disk_files > self.max_disk_files
+                if prune:
+                    self._prune_disk()
+
+    def _forget(self, key, entry):
+        # Appelé avec le verrou : l'entrée évincée ne doit plus être rattachée à son colis
+        record_id = entry[1]
+        keys = self._record_keys.get(record_id)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._record_keys[record_id]
+
+    def _prune_disk(self):
+        """Keep the max_disk_files // 2 most recently used PNG files."""
+        paths = []
+        for path in glob.glob(os.path.join(self.cache_dir, "*.png")):
+            try:
+                paths.append((os.path.getmtime(path), path))
+            except OSError:
+                continue
+        paths.sort(reverse=True)
+        removed = 0
+        for mtime, path in paths[self.max_disk_files // 2:]:
+            try:
+                os.remove(path)
+                removed += 1
+            except OSError:
+                continue
+        with self._lock:
+            self._disk_files = len(paths) - removed
+
+    def invalidate_record(self, record_id):
+        """Drop every cached QR code rendered for a record."""
+        with self._lock:
+            for key in self._record_keys.pop(record_id, set()):
+                self._entries.pop(key, None)
+
+        if self.cache_dir:
+            for path in glob.glob(os.path.join(self.cache_dir, f"{record_id}_*.png")):
+                os.remove(path)
+                with self._lock:
+                    self._disk_files -= 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._record_keys.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'size': len(self._entries),
+                'max_size': self.max_size,
+            }
+
+
+def render_qr(data, error_correction='M', box_size=10, border=4, version=None):
+    """Render in the process pool: qrcode and Pillow are only imported by the workers."""
+    from qr_render import render_qr_base64
+
+    return render_qr_base64(data, error_correction, box_size, border, version)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_qr_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = QRCache()
+    return _cache
+
+
+def load_qr_code(page, data, on_done, on_error=None, record_id=None,
+                 error_correction='M', box_size=10, border=4, version=None):
+    """Call on_done with the base64 PNG of data, from the cache or rendered in the process pool.
+
+    On a cache hit on_done is called right away, otherwise once rendering
+    has finished (and the page is then updated by the executor).
+    """
+    cache = get_qr_cache()
+    key = cache.make_key(data, error_correction, box_size, border, version)
+    cached = cache.get(key, record_id)
+    if cached is not None:
+        on_done(cached)
+        return None
+
+    def rendered(qr_code_data):
+        cache.put(key, qr_code_data, record_id)
+        on_done(qr_code_data)
+
+    return get_executor().submit_cpu(page, render_qr, data, error_correction, box_size,
+                                     border, version, on_done=rendered, on_error=on_error)
@@ -0,0 +1,223 @@
+"""Format compact et versionné du contenu des QR codes de colis.
+
+Un QR code de colis contient « GC1: » suivi de données binaires encodées en
+base45 (RFC 9285), ce qui permet au QR code d'utiliser le mode
+alphanumérique, plus dense que le mode octet :
+
+    varint  id du colis
+    champs  optionnels : octet d'étiquette, varint longueur, texte UTF-8
+    2 octets  somme de contrôle (CRC32 & 0xFFFF) des octets précédents
+
+Les anciens QR codes (blocs de texte multi-lignes « Nom: ... ») restent
+lisibles avec parse_qr_data().
+"""
+import re
+import zlib
+
+PAYLOAD_PREFIX = "GC"
+PAYLOAD_VERSION = 1
+
+BASE45_ALPHABET = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ $%*+-./:"
+BASE45_VALUES = {char: value for value, char in enumerate(BASE45_ALPHABET)}
+
+# Étiquettes des champs optionnels ; ne jamais réattribuer une étiquette
+FIELD_TAGS = {
+    'name_exp': 1,
+    'city_exp': 2,
+    'phone_exp': 3,
+    'name_dest': 4,
+    'phone_dest': 5,
+    'city_dest': 6,
+    'nmbr_package': 7,
+    'gender_package': 8,
+    'value_package': 9,
+    'kilos': 10,
+    'price': 11,
+    'created_at': 12,
+}
+TAG_FIELDS = {tag: field for field, tag in FIELD_TAGS.items()}
+
+# Champs imprimés sur les étiquettes, lisibles même sans accès à la base
+LABEL_FIELDS = ('name_dest', 'city_dest', 'nmbr_package')
+
+
+class PayloadError(ValueError):
+    """Raised when a QR payload is malformed or fails its checksum."""
+
+
+def b45encode(data):
+    chars = []
+    for i in range(0, len(data) - 1, 2):
+        n = data[i] * 256 + data[i + 1]
+        n, c = divmod(n, 45)
+        e, d = divmod(n, 45)
+        chars += [BASE45_ALPHABET[c], BASE45_ALPHABET[d], BASE45_ALPHABET[e]]
+    if len(data) % 2:
+        d, c = divmod(data[-1], 45)
+        chars += [BASE45_ALPHABET[c], BASE45_ALPHABET[d]]
+    return "".join(chars)
+
+
+def b45decode(text):
+    try:
+        values = [BASE45_VALUES[char] for char in text]
+    except KeyError:
+        raise PayloadError("Caractère base45 invalide")
+    if len(values) % 3 == 1:
+        raise PayloadError("Longueur base45 invalide")
+
+    data = bytearray()
+    for i in range(0, len(values), 3):
+        chunk = values[i:i + 3]
+        n = sum(value * 45 ** power for power, value in enumerate(chunk))
+        if len(chunk) == 3:
+            if n > 0xFFFF:
+                raise PayloadError("Valeur base45 invalide")
+            data += n.to_bytes(2, 'big')
+        else:
+            if n > 0xFF:
+                raise PayloadError("Valeur base45 invalide")
+            data.append(n)
+    return bytes(data)
+
+
+def _write_varint(out, value):
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return
+
+
+def _read_varint(data, pos):
+    value = 0
+    shift = 0
+    while True:
+        if pos >= len(data):
+            raise PayloadError("Données tronquées")
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return value, pos
+        shift += 7
+
+
+def _checksum(data):
+    return (zlib.crc32(data) & 0xFFFF).to_bytes(2, 'big')
+
+
+def encode_payload(record_id, fields=None):
+    """Encode a record id and optional {field: value} into a QR payload string."""
+    body = bytearray()
+    _write_varint(body, int(record_id))
+    for field, value in (fields or {}).items():
+        if value is None or value == "":
+            continue
+        encoded = str(value).encode('utf-8')
+        body.append(FIELD_TAGS[field])
+        _write_varint(body, len(encoded))
+        body += encoded
+    body += _checksum(bytes(body))
+    return f"{PAYLOAD_PREFIX}{PAYLOAD_VERSION}:{b45encode(bytes(body))}"
+
+
+def decode_payload(text):
+    """Decode a payload from encode_payload() into {'id': ..., field: value}."""
+    match = re.fullmatch(rf"{PAYLOAD_PREFIX}(\d+):(.*)", text.strip(), re.DOTALL)
+    if not match:
+        raise PayloadError("Format de QR code inconnu")
+    version = int(match.group(1))
+    if version != PAYLOAD_VERSION:
+        raise PayloadError(f"Version de QR code non prise en charge: {version}")
+
+    data = b45decode(match.group(2))
+    if len(data) < 3:
+        raise PayloadError("Données tronquées")
+    body, checksum = data[:-2], data[-2:]
+    if _checksum(body) != checksum:
+        raise PayloadError("Somme de contrôle invalide")
+
+    record_id, pos = _read_varint(body, 0)
+    result = {'id': record_id}
+    while pos < len(body):
+        tag = body[pos]
+        length, pos = _read_varint(body, pos + 1)
+        value = body[pos:pos + length]
+        if len(value) != length:
+            raise PayloadError("Données tronquées")
+        pos += length
+        # Les étiquettes inconnues (versions futures) sont ignorées
+        if tag in TAG_FIELDS:
+            try:
+                result[TAG_FIELDS[tag]] = value.decode('utf-8')
+            except UnicodeDecodeError:
+                raise PayloadError("Texte invalide dans le QR code")
+    return result
+
+
+# Correspondance des lignes de l'ancien format texte, par section
+LEGACY_SECTIONS = {
+    'EXPEDITEUR': {'Nom': 'name_exp', 'Ville': 'city_exp', 'Tel': 'phone_exp'},
+    'DESTINATAIRE': {'Nom': 'name_dest', 'Ville': 'city_dest', 'Tel': 'phone_dest'},
+    'COLIS': {
+        'Nombre': 'nmbr_package', 'Type': 'gender_package', 'Valeur': 'value_package',
+        'Poids': 'kilos', 'Prix': 'price', 'Date': 'created_at',
+    },
+}
+
+
+def _normalize_legacy_key(key):
+    key = key.strip().upper()
+    for accented, plain in (('É', 'E'), ('È', 'E')):
+        key = key.replace(accented, plain)
+    return key
+
+
+def parse_legacy_text(text):
+    """Parse the old multi-line text QR content, or return None if it is not one."""
+    result = {}
+    section = None
+    for line in text.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        colis = re.fullmatch(r"COLIS\s*#\s*(\d+)", line)
+        if colis:
+            result['id'] = int(colis.group(1))
+            continue
+        if ':' not in line:
+            continue
+        key, value = line.split(':', 1)
+        value = value.strip()
+        normalized = _normalize_legacy_key(key)
+        if normalized == 'ID':
+            if value.isdigit():
+                result['id'] = int(value)
+            continue
+        if not value:
+            # En-tête de section : « EXPÉDITEUR: », « DÉTAILS COLIS: »...
+            section = 'COLIS' if 'COLIS' in normalized else normalized
+            continue
+        fields = LEGACY_SECTIONS.get(section, {})
+        field = fields.get(key.strip().replace('Tél', 'Tel'))
+        if field:
+            # Retirer les unités ajoutées à l'affichage (« 12.5 Kg », « 30 € »)
+            if field in ('value_package', 'kilos', 'price'):
+                value = re.sub(r"\s*(€|Kg)$", "", value)
+            result[field] = value
+    return result if 'id' in result else None
+
+
+def parse_qr_data(text):
+    """Parse any parcel QR content (compact or legacy); None if it is not a parcel QR code."""
+    if text.strip().startswith(PAYLOAD_PREFIX):
+        try:
+            return decode_payload(text)
+        except (ValueError, UnicodeDecodeError):
+            # Code compact illisible : ce n'est pas non plus un texte de l'ancien format
+            return None
+    return parse_legacy_text(text)
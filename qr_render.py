@@ -0,0 +1,45 @@
+"""Rendu des QR codes en PNG encodé en base64 (pour ft.Image.src_base64).
+
+Fonction de module sans état : elle peut être exécutée dans le pool de
+processus de tasks.TaskExecutor.
+"""
+import base64
+from io import BytesIO
+
+import qrcode
+from PIL import Image
+
+ERROR_CORRECTION = {
+    'L': qrcode.constants.ERROR_CORRECT_L,
+    'M': qrcode.constants.ERROR_CORRECT_M,
+    'Q': qrcode.constants.ERROR_CORRECT_Q,
+    'H': qrcode.constants.ERROR_CORRECT_H,
+}
+
+
+def render_qr_base64(data, error_correction='M', box_size=10, border=4, version=None):
+    """Render data as a QR code and return the PNG as a base64 string."""
+    qr = qrcode.QRCode(
+        version=version,
+        error_correction=ERROR_CORRECTION[error_correction],
+        box_size=box_size,
+        border=border,
+    )
+    qr.add_data(data)
+    qr.make(fit=True)
+    qr_image = qr.make_image(fill_color="black", back_color="white")
+
+    buffer = BytesIO()
+    qr_image.save(buffer, format="PNG")
+    return base64.b64encode(buffer.getvalue()).decode('utf-8')
+
+
+def render_qr_image(data, size, error_correction='M', border=4):
+    """Render data as a size x size grayscale PIL image with sharp modules."""
+    qr = qrcode.QRCode(error_correction=ERROR_CORRECTION[error_correction], border=border)
+    qr.add_data(data)
+    qr.make(fit=True)
+    matrix = qr.get_matrix()
+    image = Image.new('L', (len(matrix), len(matrix)))
+    image.putdata([0 if module else 255 for row in matrix for module in row])
+    return image.resize((size, size), Image.NEAREST)
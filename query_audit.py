@@ -0,0 +1,123 @@
+"""Audit des plans d'exécution des requêtes de Database.
+
+Chaque méthode de lecture/écriture de Database est appelée sur une base
+temporaire ; les requêtes réellement exécutées sont capturées puis passées à
+EXPLAIN QUERY PLAN. Le script échoue (code de sortie 1) si l'une d'elles
+parcourt une table entière au lieu d'utiliser un index ; la même
+vérification tourne avec les tests (tests/test_query_audit.py).
+
+Usage : python query_audit.py
+"""
+import inspect
+import os
+import sys
+import tempfile
+
+import database
+from database import Database
+
+SAMPLE_RECORD = (
+    "Hassan", "Paris", "0612345678", "Fatima", "0698765432", "Agadir",
+    2, "Documents", 100.0, 3.5, 25.0,
+)
+
+SAMPLE_DATA = {
+    'name_exp': "Hassan", 'city_exp': "Paris", 'phone_exp': "0612345678",
+    'name_dest': "Fatima", 'phone_dest': "0698765432", 'city_dest': "Agadir",
+    'nmbr_package': "2", 'gender_package': "Documents", 'value_package': "100",
+    'kilos': "3.5", 'price': "25",
+}
+
+# (libellé, méthode, arguments, parcours complet accepté)
+AUDITED_CALLS = [
+    ("get_user", 'get_user', ("hassan",), False),
+    ("get_all_records", 'get_all_records', (), True),
+    # La première page lit les premières lignes de la clé primaire, bornée par LIMIT
+    ("get_records_page (première page)", 'get_records_page', (), True),
+    ("get_records_page (page suivante)", 'get_records_page', (1000,), False),
+    ("search_records (texte)", 'search_records', ("has",), False),
+    ("search_records (id)", 'search_records', ("1",), False),
+    ("iter_records (dates)", 'iter_records', ("2024-01-01", "2024-01-31"), False),
+    ("iter_records (ville)", 'iter_records', (None, None, "Agadir"), False),
+    ("iter_records_by_ids", 'iter_records_by_ids', ([1, 2, 3],), False),
+    ("count_records (dates)", 'count_records', ("2024-01-01", "2024-01-31"), False),
+    ("get_record", 'get_record', (1,), False),
+    ("get_record_modifications", 'get_record_modifications', (1,), False),
+    ("update_record", 'update_record', (1, SAMPLE_DATA), False),
+    ("modify_record", 'modify_record', (1, SAMPLE_DATA), False),
+    ("bulk_update_status", 'bulk_update_status', ([1, 2], "Réceptionné"), False),
+    ("delete_record", 'delete_record', (1,), False),
+    ("next_print_job", 'next_print_job', ("2024-01-01 00:00:00",), False),
+    ("next_print_job_time", 'next_print_job_time', (), False),
+    ("get_workstation_printer", 'get_workstation_printer', ("poste-1",), False),
+    ("current_change_seq", 'current_change_seq', (), False),
+    ("changes_since", 'changes_since', (0,), False),
+    ("get_summary (semaine)", 'get_summary', ("2024-01-01", "2024-01-07"), False),
+    # Sans dates, la table des résumés (petite) est lue en entier
+    ("get_summary (tout, par semaine)", 'get_summary', (None, None, ('week',)), True),
+]
+
+
+def is_full_scan(detail):
+    # Les tables virtuelles (FTS5) sont parcourues via leur propre index
+    return detail.startswith("SCAN ") and "VIRTUAL TABLE" not in detail
+
+
+def capture_queries(db, method, args):
+    queries = []
+
+    def trace(statement):
+        # Les instructions des déclencheurs arrivent sous forme de commentaires
+        if statement.lstrip().upper().startswith(("SELECT", "UPDATE", "DELETE", "WITH")):
+            queries.append(statement)
+
+    db.conn.set_trace_callback(trace)
+    try:
+        result = getattr(db, method)(*args)
+        if inspect.isgenerator(result):
+            list(result)
+    finally:
+        db.conn.set_trace_callback(None)
+    return queries
+
+
+def audit(db):
+    """Return a list of (label, query, plan) for every unexpected full scan."""
+    regressions = []
+    for label, method, args, allow_scan in AUDITED_CALLS:
+        for query in capture_queries(db, method, args):
+            plan = db.explain_query_plan(query)
+            if not allow_scan and any(is_full_scan(detail) for detail in plan):
+                regressions.append((label, query, plan))
+    return regressions
+
+
+def main():
+    fd, path = tempfile.mkstemp(suffix=".db")
+    os.close(fd)
+    try:
+        pool = database.init_pool(path, size=1)
+        db = Database(pool)
+        try:
+            db.insert_record(*SAMPLE_RECORD)
+            regressions = audit(db)
+        finally:
+            db.close()
+            pool.close_all()
+    finally:
+        os.remove(path)
+
+    if not regressions:
+        print(f"{len(AUDITED_CALLS)} appels audités, aucun parcours complet de table")
+        return 0
+
+    for label, query, plan in regressions:
+        print(f"❌ {label} : parcours complet de table")
+        print(" ".join(query.split()))
+        for detail in plan:
+            print(f"    {detail}")
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
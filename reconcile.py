@@ -0,0 +1,222 @@
+"""Rapprochement des colis à partir de photos et de vidéos.
+
+Les QR codes des photos (répertoire d'images) et des vidéos envoyées par les
+chauffeurs sont décodés dans un pool de processus, puis comparés aux colis
+attendus en base : trouvés, manquants, et codes inconnus. Le rapport est
+écrit en CSV.
+
+Usage : python reconcile.py photos/ trajet.mp4 [--report rapport.csv]
+        [--from 2024-01-01] [--to 2024-01-31] [--city Rabat] [--status Modifié]
+        [--ids 12,13,14] [--every 5] [--db users.db]
+"""
+import argparse
+import csv
+import os
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import cv2
+
+import database
+from database import Database, DB_PATH, record_to_dict
+from export import EXPORT_DIR
+from qr_payload import parse_qr_data
+from scanner import decode_frame, preprocess
+from tasks import CPU_CONTEXT, CPU_WORKERS
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.tif', '.tiff', '.webp')
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mov', '.mkv', '.webm')
+# Décoder une image sur N des vidéos (les colis restent visibles plusieurs images)
+VIDEO_FRAME_STEP = 5
+# Images envoyées au pool sans attendre leur résultat
+MAX_IN_FLIGHT = CPU_WORKERS * 4
+
+FOUND = 'trouvé'
+MISSING = 'manquant'
+UNKNOWN = 'inconnu'
+REPORT_COLUMNS = ('record_id', 'result', 'name_dest', 'city_dest', 'status', 'seen_in', 'raw_text')
+
+
+def decode_image_file(path):
+    """Return (path, [decoded texts]) for an image file; runs in the process pool."""
+    image = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+    if image is None:
+        return path, []
+    return path, [text for text, polygon in decode_frame(image, roi=1.0)]
+
+
+def decode_video_frame(label, image):
+    """Return (label, [decoded texts]) for a grayscale frame; runs in the process pool."""
+    return label, [text for text, polygon in decode_frame(image, roi=1.0)]
+
+
+def list_images(directory):
+    return sorted(
+        os.path.join(directory, name) for name in os.listdir(directory)
+        if name.lower().endswith(IMAGE_EXTENSIONS)
+    )
+
+
+def iter_video_frames(path, step=VIDEO_FRAME_STEP):
+    """Yield (label, grayscale frame) for one frame out of step of a video."""
+    capture = cv2.VideoCapture(path)
+    if not capture.isOpened():
+        raise RuntimeError(f"Vidéo illisible: {path}")
+    try:
+        index = 0
+        while True:
+            # grab() sans décoder l'image pour les images sautées
+            if not capture.grab():
+                break
+            if index % step == 0:
+                ok, frame = capture.retrieve()
+                if ok:
+                    # Conversion en gris avant l'envoi au pool : 3 fois moins de données
+                    image, offset = preprocess(frame, roi=1.0)
+                    yield f"{os.path.basename(path)}#{index}", image
+            index += 1
+    finally:
+        capture.release()
+
+
+def iter_jobs(sources, step):
+    """Yield (function, args) decoding jobs for image directories, images and videos."""
+    for source in sources:
+        if os.path.isdir(source):
+            for path in list_images(source):
+                yield decode_image_file, (path,)
+        elif source.lower().endswith(VIDEO_EXTENSIONS):
+            for label, image in iter_video_frames(source, step):
+                yield decode_video_frame, (label, image)
+        elif source.lower().endswith(IMAGE_EXTENSIONS):
+            yield decode_image_file, (source,)
+        else:
+            print(f"Source ignorée (format inconnu): {source}")
+
+
+def decode_sources(sources, step=VIDEO_FRAME_STEP, workers=CPU_WORKERS):
+    """Decode every source in a process pool; returns {text: [where it was seen]}."""
+    seen = {}
+    pending = deque()
+
+    def collect(future):
+        label, texts = future.result()
+        for text in texts:
+            seen.setdefault(text, []).append(label)
+
+    with ProcessPoolExecutor(max_workers=workers, mp_context=CPU_CONTEXT) as pool:
+        for function, args in iter_jobs(sources, step):
+            pending.append(pool.submit(function, *args))
+            # Nombre borné d'images en attente : la vidéo n'est pas chargée en mémoire
+            while len(pending) >= MAX_IN_FLIGHT:
+                collect(pending.popleft())
+        while pending:
+            collect(pending.popleft())
+    return seen
+
+
+def reconcile(seen, record_ids=None, start_date=None, end_date=None, city=None, status=None):
+    """Compare decoded QR texts with the expected records; returns the report rows.
+
+    The expected records are record_ids when given, otherwise those matching
+    the date, city and status filters.
+    """
+    sightings = {}
+    unreadable = []
+    for text, labels in seen.items():
+        data = parse_qr_data(text)
+        if data is None:
+            unreadable.append((text, labels))
+        else:
+            sightings.setdefault(data['id'], []).extend(labels)
+
+    db = Database()
+    try:
+        if record_ids is not None:
+            rows = db.iter_records_by_ids(record_ids)
+        else:
+            rows = db.iter_records(start_date=start_date, end_date=end_date, city=city, status=status)
+        expected = {row[0]: record_to_dict(row) for row in rows}
+        # Colis vus mais hors du filtre : existent-ils en base ?
+        known = {row[0]: record_to_dict(row) for row in db.iter_records_by_ids(set(sightings) - set(expected))}
+    finally:
+        db.close()
+
+    rows = []
+    for record_id, record in expected.items():
+        result = FOUND if record_id in sightings else MISSING
+        rows.append(report_row(record_id, result, record, sightings.get(record_id, [])))
+    for record_id in sorted(set(sightings) - set(expected)):
+        # Colis en base mais non attendu (autre date, autre ville) : compté comme trouvé
+        result = FOUND if record_id in known else UNKNOWN
+        rows.append(report_row(record_id, result, known.get(record_id, {}), sightings[record_id]))
+    if record_ids is not None:
+        # Ids attendus absents de la base (et jamais vus)
+        for record_id in sorted(set(record_ids) - set(expected) - set(sightings)):
+            rows.append(report_row(record_id, UNKNOWN, {}, []))
+    for text, labels in unreadable:
+        rows.append(report_row("", UNKNOWN, {}, labels, raw_text=text))
+    return rows
+
+
+def report_row(record_id, result, record, labels, raw_text=""):
+    # raw_text : texte d'un QR code qui n'est pas un code de colis
+    return (
+        record_id,
+        result,
+        record.get('name_dest', ""),
+        record.get('city_dest', ""),
+        record.get('status') or "",
+        " ".join(dict.fromkeys(labels)),
+        raw_text,
+    )
+
+
+def default_report_path():
+    """Timestamped report name in EXPORT_DIR."""
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    return os.path.join(EXPORT_DIR, f"rapprochement_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv")
+
+
+def write_report(path, rows):
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(REPORT_COLUMNS)
+        writer.writerows(rows)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rapprocher les colis photographiés ou filmés")
+    parser.add_argument('sources', nargs='+', help="répertoires d'images, images ou vidéos")
+    parser.add_argument('--report', help="rapport CSV (par défaut dans exports/)")
+    parser.add_argument('--from', dest='start_date', help="colis attendus depuis (AAAA-MM-JJ)")
+    parser.add_argument('--to', dest='end_date', help="colis attendus jusqu'au (AAAA-MM-JJ)")
+    parser.add_argument('--city', help="ville de destination des colis attendus")
+    parser.add_argument('--status', help="statut des colis attendus")
+    parser.add_argument('--ids', help="ids des colis attendus, séparés par des virgules")
+    parser.add_argument('--every', type=int, default=VIDEO_FRAME_STEP,
+                        help="décoder une image sur N des vidéos")
+    parser.add_argument('--db', default=DB_PATH, help="base SQLite")
+    args = parser.parse_args(argv)
+    if not (args.ids or args.start_date or args.end_date or args.city or args.status):
+        # Sans filtre, toute la base serait attendue et presque tout compté manquant
+        parser.error("indiquer les colis attendus : --ids, --from, --to, --city ou --status")
+
+    report = args.report or default_report_path()
+    database.init_pool(args.db)
+    seen = decode_sources(args.sources, step=args.every)
+    record_ids = [int(record_id) for record_id in args.ids.split(',')] if args.ids else None
+    rows = reconcile(seen, record_ids, start_date=args.start_date, end_date=args.end_date, city=args.city,
+                     status=args.status)
+    write_report(report, rows)
+
+    counts = {result: sum(1 for row in rows if row[1] == result) for result in (FOUND, MISSING, UNKNOWN)}
+    print(f"{counts[FOUND]} trouvés, {counts[MISSING]} manquants, {counts[UNKNOWN]} inconnus "
+          f"- rapport écrit dans {report}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,120 @@
+"""Statistiques des colis par jour, semaine ou mois.
+
+Les chiffres sont lus dans la table daily_summary, tenue à jour par des
+déclencheurs sur records : un rapport ne parcourt jamais les colis eux-mêmes
+et reste instantané quel que soit leur nombre.
+
+Usage : python reports.py [--period week] [--by city_dest] [--db users.db]
+        python reports.py --rebuild   (recalculer les résumés depuis records)
+"""
+import argparse
+import sys
+from datetime import date, timedelta
+
+import database
+from database import Database, DB_PATH, SUMMARY_GROUPS, SUMMARY_MEASURES
+
+# Périodes proposées, avec leur libellé
+PERIODS = {
+    'day': "Aujourd'hui",
+    'week': "Cette semaine",
+    'month': "Ce mois",
+    'all': "Depuis le début",
+}
+# Libellés des regroupements et des mesures
+GROUP_LABELS = {
+    'city_dest': "Ville de destination",
+    'city_exp': "Ville d'expédition",
+    'gender_package': "Type de colis",
+    'day': "Jour",
+    'week': "Semaine du",
+    'month': "Mois",
+}
+MEASURE_LABELS = {
+    'parcels': "Colis",
+    'packages': "Paquets",
+    'kilos': "Kilos",
+    'price': "Chiffre d'affaires",
+    'value_package': "Valeur déclarée",
+}
+
+
+def period_bounds(period, today=None):
+    """Return ('YYYY-MM-DD' start, end) of the current day, week (from Monday) or month."""
+    today = today or date.today()
+    if period == 'day':
+        start = today
+    elif period == 'week':
+        start = today - timedelta(days=today.weekday())
+    elif period == 'month':
+        start = today.replace(day=1)
+    elif period == 'all':
+        return None, None
+    else:
+        raise ValueError(f"Période inconnue: {period}")
+    return start.isoformat(), today.isoformat()
+
+
+def summary_report(period='week', group_by='city_dest', today=None):
+    """Return (rows, totals) for a period; each row is a dict with 'group' and the measures."""
+    if group_by not in SUMMARY_GROUPS:
+        raise ValueError(f"Regroupement inconnu: {group_by}")
+    start_date, end_date = period_bounds(period, today)
+    db = Database()
+    try:
+        results = db.get_summary(start_date, end_date, (group_by,))
+    finally:
+        db.close()
+
+    rows = [
+        {'group': result[0], **dict(zip(SUMMARY_MEASURES, result[1:]))}
+        for result in results
+    ]
+    totals = {name: sum(row[name] for row in rows) for name in SUMMARY_MEASURES}
+    return rows, totals
+
+
+def rebuild_summary():
+    db = Database()
+    try:
+        db.rebuild_summary()
+        db.conn.commit()
+    finally:
+        db.close()
+
+
+def format_measure(name, value):
+    if name in ('parcels', 'packages'):
+        return f"{value:.0f}"
+    return f"{value:.2f}"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Statistiques des colis")
+    parser.add_argument('--period', choices=PERIODS, default='week')
+    parser.add_argument('--by', choices=GROUP_LABELS, default='city_dest', help="regroupement")
+    parser.add_argument('--rebuild', action='store_true', help="recalculer les résumés depuis records")
+    parser.add_argument('--db', default=DB_PATH, help="base SQLite")
+    args = parser.parse_args(argv)
+
+    database.init_pool(args.db)
+    if args.rebuild:
+        rebuild_summary()
+        print("Résumés recalculés")
+
+    rows, totals = summary_report(args.period, args.by)
+    headers = [GROUP_LABELS[args.by]] + [MEASURE_LABELS[name] for name in SUMMARY_MEASURES]
+    table = [[str(row['group'])] + [format_measure(name, row[name]) for name in SUMMARY_MEASURES]
+             for row in rows]
+    table.append(["Total"] + [format_measure(name, totals[name]) for name in SUMMARY_MEASURES])
+    widths = [max(len(line[i]) for line in [headers] + table) for i in range(len(headers))]
+
+    print(PERIODS[args.period])
+    print("  ".join(header.ljust(width) for header, width in zip(headers, widths)))
+    for line in table:
+        print("  ".join([line[0].ljust(widths[0])] + [cell.rjust(width) for cell, width in zip(line[1:], widths[1:])]))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,268 @@
+"""Lecture des QR codes depuis la caméra.
+
+Un thread de capture lit les images et les dépose dans une file bornée : si
+le décodage prend du retard, les images les plus anciennes sont jetées au lieu
+de s'accumuler. Le décodage se fait sur une image en niveaux de gris,
+recadrée sur la zone centrale (ROI), réduite, et seulement une image sur
+decode_every.
+
+Usage (mesure sur une vidéo enregistrée) :
+    python scanner.py video.mp4 [--roi 0.7] [--scale 0.5] [--every 2] [--baseline]
+"""
+import argparse
+import queue
+import statistics
+import sys
+import threading
+import time
+
+import cv2
+import numpy as np
+from pyzbar.pyzbar import ZBarSymbol, decode
+
+# Réglages par défaut du scanner ; chaque valeur peut être passée à QRScanner
+SCAN_SETTINGS = {
+    'width': 640,          # résolution demandée à la caméra
+    'height': 480,
+    'roi': 0.7,            # fraction centrale de l'image analysée (1 = image entière)
+    'scale': 1.0,          # réduction appliquée avant le décodage
+    'decode_every': 2,     # décoder une image sur N
+    'queue_size': 2,       # images en attente entre capture et décodage
+    'preview': True,       # fenêtre de prévisualisation OpenCV
+}
+PREVIEW_WINDOW = 'QR Code Scanner'
+# Délai (en secondes) pendant lequel un même code n'est signalé qu'une fois
+DEDUPE_WINDOW = 5
+
+
+def region_of_interest(shape, roi):
+    """Return (x, y, width, height) of the centred ROI for a frame shape."""
+    height, width = shape[:2]
+    roi_w, roi_h = int(width * roi), int(height * roi)
+    return (width - roi_w) // 2, (height - roi_h) // 2, roi_w, roi_h
+
+
+def preprocess(frame, roi=SCAN_SETTINGS['roi'], scale=SCAN_SETTINGS['scale']):
+    """Grayscale, crop and downscale a BGR frame; returns (image, (x, y) offset)."""
+    x, y, width, height = region_of_interest(frame.shape, roi)
+    image = frame[y:y + height, x:x + width]
+    if image.ndim == 3:
+        image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    if scale != 1.0:
+        image = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    return image, (x, y)
+
+
+def decode_frame(frame, roi=SCAN_SETTINGS['roi'], scale=SCAN_SETTINGS['scale']):
+    """Decode the QR codes of a frame; returns [(text, polygon)] in frame coordinates."""
+    image, (x, y) = preprocess(frame, roi, scale)
+    results = []
+    for obj in decode(image, symbols=[ZBarSymbol.QRCODE]):
+        polygon = [(int(point.x / scale) + x, int(point.y / scale) + y) for point in obj.polygon]
+        results.append((obj.data.decode('utf-8', errors='replace'), polygon))
+    return results
+
+
+def unique_codes(codes, window=DEDUPE_WINDOW):
+    """Yield the codes of an iterable, skipping a code seen less than window seconds ago.
+
+    A code that stays in front of the camera keeps being suppressed.
+    """
+    last_seen = {}
+    for code in codes:
+        now = time.monotonic()
+        if now - last_seen.get(code, float('-inf')) >= window:
+            yield code
+        last_seen[code] = now
+        # Oublier les codes sortis de la fenêtre
+        if len(last_seen) > 1000:
+            last_seen = {key: seen for key, seen in last_seen.items() if now - seen < window}
+
+
+class FrameGrabber(threading.Thread):
+    """Reads frames from a cv2.VideoCapture into a bounded queue, newest first."""
+
+    def __init__(self, capture, queue_size=SCAN_SETTINGS['queue_size']):
+        super().__init__(name="colis-capture", daemon=True)
+        self.capture = capture
+        self.frames = queue.Queue(maxsize=queue_size)
+        self.dropped = 0
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            ok, frame = self.capture.read()
+            if not ok:
+                break
+            self._offer(frame)
+        # Fin du flux : débloquer le lecteur
+        self._offer(None)
+
+    def _offer(self, frame):
+        while True:
+            try:
+                self.frames.put_nowait(frame)
+                return
+            except queue.Full:
+                pass
+            # Le décodage est en retard : jeter l'image la plus ancienne
+            try:
+                self.frames.get_nowait()
+                self.dropped += 1
+            except queue.Empty:
+                pass
+
+    def stop(self):
+        self._stop_event.set()
+
+
+class QRScanner:
+    """Camera QR scanner; use as a context manager and iterate over codes()."""
+
+    def __init__(self, device=0, **settings):
+        self.device = device
+        self.settings = {**SCAN_SETTINGS, **settings}
+        self.capture = None
+        self.grabber = None
+
+    def open(self):
+        self.capture = cv2.VideoCapture(self.device)
+        if not self.capture.isOpened():
+            raise RuntimeError("Caméra indisponible")
+        self.capture.set(cv2.CAP_PROP_FRAME_WIDTH, self.settings['width'])
+        self.capture.set(cv2.CAP_PROP_FRAME_HEIGHT, self.settings['height'])
+        # Pas de tampon côté pilote : la file bornée suffit
+        self.capture.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        self.grabber = FrameGrabber(self.capture, self.settings['queue_size'])
+        self.grabber.start()
+        return self
+
+    def close(self):
+        if self.grabber is not None:
+            self.grabber.stop()
+            self.grabber.join(timeout=1)
+            self.grabber = None
+        if self.capture is not None:
+            self.capture.release()
+            self.capture = None
+        if self.settings['preview']:
+            cv2.destroyAllWindows()
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def codes(self, stop=None):
+        """Yield the text of each QR code decoded, until the stream ends.
+
+        stop is an optional threading.Event; pressing 'q' in the preview
+        window also ends the scan.
+        """
+        settings = self.settings
+        count = 0
+        while stop is None or not stop.is_set():
+            try:
+                frame = self.grabber.frames.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            if frame is None:
+                return
+
+            count += 1
+            found = []
+            if count % settings['decode_every'] == 0:
+                found = decode_frame(frame, settings['roi'], settings['scale'])
+
+            if settings['preview']:
+                self.show_preview(frame, found)
+                if cv2.waitKey(1) & 0xFF == ord('q'):
+                    return
+
+            for text, polygon in found:
+                yield text
+
+    def show_preview(self, frame, found):
+        x, y, width, height = region_of_interest(frame.shape, self.settings['roi'])
+        cv2.rectangle(frame, (x, y), (x + width, y + height), (255, 200, 0), 1)
+        for text, polygon in found:
+            points = np.array(polygon, dtype=np.int32)
+            if len(points) > 4:
+                points = cv2.convexHull(points)
+            cv2.polylines(frame, [points], True, (0, 255, 0), 3)
+        cv2.imshow(PREVIEW_WINDOW, frame)
+
+
+def benchmark(path, roi=SCAN_SETTINGS['roi'], scale=SCAN_SETTINGS['scale'],
+              decode_every=SCAN_SETTINGS['decode_every'], baseline=False):
+    """Decode a video file frame by frame and return timing statistics.
+
+    baseline decodes every full-resolution colour frame, like the original
+    camera loop, for comparison.
+    """
+    capture = cv2.VideoCapture(path)
+    if not capture.isOpened():
+        raise RuntimeError(f"Vidéo illisible: {path}")
+
+    latencies = []
+    codes = set()
+    frames = 0
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    try:
+        while True:
+            ok, frame = capture.read()
+            if not ok:
+                break
+            frames += 1
+            if not baseline and frames % decode_every:
+                continue
+            start = time.perf_counter()
+            if baseline:
+                found = [obj.data.decode('utf-8', errors='replace') for obj in decode(frame)]
+            else:
+                found = [text for text, polygon in decode_frame(frame, roi, scale)]
+            latencies.append(time.perf_counter() - start)
+            codes.update(found)
+    finally:
+        capture.release()
+
+    cpu = time.process_time() - cpu_start
+    wall = time.perf_counter() - wall_start
+    latencies.sort()
+    return {
+        'frames': frames,
+        'decoded_frames': len(latencies),
+        'codes': len(codes),
+        'latency_mean_ms': statistics.mean(latencies) * 1000 if latencies else 0,
+        'latency_p95_ms': latencies[int(len(latencies) * 0.95)] * 1000 if latencies else 0,
+        'cpu_per_frame_ms': cpu / frames * 1000 if frames else 0,
+        'fps': frames / wall if wall else 0,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Mesurer le décodage des QR codes sur une vidéo")
+    parser.add_argument('video', help="fichier vidéo enregistré")
+    parser.add_argument('--roi', type=float, default=SCAN_SETTINGS['roi'])
+    parser.add_argument('--scale', type=float, default=SCAN_SETTINGS['scale'])
+    parser.add_argument('--every', type=int, default=SCAN_SETTINGS['decode_every'],
+                        help="décoder une image sur N")
+    parser.add_argument('--baseline', action='store_true',
+                        help="décoder chaque image entière en couleur (ancienne boucle)")
+    args = parser.parse_args(argv)
+
+    stats = benchmark(args.video, args.roi, args.scale, args.every, args.baseline)
+    print(f"Images lues         : {stats['frames']}")
+    print(f"Images décodées     : {stats['decoded_frames']}")
+    print(f"QR codes distincts  : {stats['codes']}")
+    print(f"Latence moyenne     : {stats['latency_mean_ms']:.1f} ms")
+    print(f"Latence p95         : {stats['latency_p95_ms']:.1f} ms")
+    print(f"CPU par image       : {stats['cpu_per_frame_ms']:.1f} ms")
+    print(f"Images par seconde  : {stats['fps']:.1f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
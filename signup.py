@@ -1,5 +1,8 @@
+import sqlite3
+
 import flet as ft
-from database import Database
+from auth import register_user
+from tasks import get_executor
 
 class SignUpPage(ft.UserControl):
     def __init__(self, page: ft.Page, go_to_login):
@@ -83,9 +86,7 @@ class SignUpPage(ft.UserControl):
             )
             return
             
-        try:
-            db = Database()
-            db.insert_user(username, password, "")  # Phone field vide
+        def registered(result):
             self.page.show_snack_bar(
                 ft.SnackBar(
                     content=ft.Text("Compte créé avec succès"),
@@ -93,15 +94,22 @@ class SignUpPage(ft.UserControl):
                 )
             )
             self.go_to_login()
-        except Exception as e:
+
+        def failed(ex):
+            if isinstance(ex, sqlite3.IntegrityError):
+                message = "Ce nom d'utilisateur est déjà pris"
+            else:
+                message = str(ex)
             self.page.show_snack_bar(
                 ft.SnackBar(
-                    content=ft.Text(str(e)),
+                    content=ft.Text(message),
                     bgcolor=ft.colors.RED_400
                 )
             )
-        finally:
-            db.close()
+
+        # Le hachage du mot de passe est volontairement lent : hors du thread de l'interface
+        get_executor().submit(self.page, lambda task: register_user(username, password, ""),  # Phone field vide
+                              on_done=registered, on_error=failed)
 
     def build(self):
         return ft.Container(
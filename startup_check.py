@@ -0,0 +1,122 @@
+"""Mesure du temps de démarrage de l'application.
+
+Importe le module de l'application dans un interpréteur neuf avec
+`python -X importtime`, affiche les modules les plus lents et vérifie le
+budget de démarrage. Les dépendances lourdes (OpenCV, zbar, numpy, qrcode,
+Pillow) ne doivent être chargées qu'au premier scan, rendu de QR code ou
+impression : leur présence au démarrage fait échouer la vérification, ici
+comme dans tests/test_startup.py.
+
+Code de sortie : 0 si le budget est respecté, 1 sinon, 2 si l'import échoue.
+
+Usage : python startup_check.py [--budget 1000] [--runs 3] [--top 15] [--module app]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+# Budget (en ms) de l'import de app.py, c'est-à-dire de tout ce qu'il faut pour afficher la connexion
+STARTUP_BUDGET_MS = 1000
+HEAVY_MODULES = ('cv2', 'numpy', 'pyzbar', 'qrcode', 'PIL')
+STARTUP_RUNS = 3
+
+
+def parse_importtime(output):
+    """Parse -X importtime output into [(depth, self_us, cumulative_us, module)]."""
+    entries = []
+    for line in output.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        fields = line[len('import time:'):].split('|')
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue  # en-tête
+        name = fields[2].rstrip()
+        depth = len(name) - len(name.lstrip())
+        entries.append((depth, int(fields[0]), int(fields[1]), name.strip()))
+    return entries
+
+
+def measure_import(module='app'):
+    """Import module in a fresh interpreter; returns the parsed importtime entries."""
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f"import {module}"],
+        capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)),
+    )
+    if result.returncode != 0:
+        # La dernière ligne est l'exception (ex. dépendance manquante)
+        lines = [line for line in result.stderr.splitlines() if not line.startswith('import time:')]
+        raise RuntimeError(lines[-1] if lines else f"import {module} a échoué")
+    return parse_importtime(result.stderr)
+
+
+def total_ms(entries):
+    """Total import time: cumulative time of the outermost imports."""
+    if not entries:
+        return 0.0
+    top = min(depth for depth, *rest in entries)
+    return sum(cumulative for depth, own, cumulative, name in entries if depth == top) / 1000
+
+
+def heavy_modules(entries, heavy=HEAVY_MODULES):
+    return sorted({name.split('.')[0] for *rest, name in entries} & set(heavy))
+
+
+def slowest(entries, count):
+    """The count slowest top-level packages by cumulative time, in ms."""
+    packages = {}
+    for depth, own, cumulative, name in entries:
+        package = name.split('.')[0]
+        # Le temps cumulé du premier import d'un paquet inclut ses sous-modules
+        packages.setdefault(package, cumulative / 1000)
+    return sorted(packages.items(), key=lambda item: item[1], reverse=True)[:count]
+
+
+def check_startup(module='app', budget=STARTUP_BUDGET_MS, runs=STARTUP_RUNS):
+    """Measure the import of module runs times; returns (median ms, last entries, problems)."""
+    timings = []
+    entries = []
+    for _ in range(runs):
+        entries = measure_import(module)
+        timings.append(total_ms(entries))
+    median = statistics.median(timings)
+
+    problems = []
+    if median > budget:
+        problems.append(f"{median:.0f} ms au-delà du budget de {budget} ms")
+    loaded = heavy_modules(entries)
+    if loaded:
+        problems.append(f"modules lourds chargés au démarrage: {', '.join(loaded)}")
+    return median, entries, problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Mesurer le temps de démarrage de l'application")
+    parser.add_argument('--module', default='app', help="module importé au démarrage")
+    parser.add_argument('--budget', type=float, default=STARTUP_BUDGET_MS, help="budget en ms")
+    parser.add_argument('--runs', type=int, default=STARTUP_RUNS, help="mesures (médiane)")
+    parser.add_argument('--top', type=int, default=15, help="modules les plus lents affichés")
+    args = parser.parse_args(argv)
+
+    try:
+        median, entries, problems = check_startup(args.module, args.budget, args.runs)
+    except RuntimeError as ex:
+        print(f"Erreur: {ex}")
+        return 2
+
+    print(f"Import de {args.module} : {median:.0f} ms (médiane de {args.runs} mesures)")
+    print("Modules les plus lents (temps cumulé) :")
+    for package, ms in slowest(entries, args.top):
+        print(f"  {ms:8.1f} ms  {package}")
+
+    if problems:
+        for problem in problems:
+            print(f"❌ {problem}")
+        return 1
+    print(f"✅ Budget de {args.budget:.0f} ms respecté, aucun module lourd chargé")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
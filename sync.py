@@ -0,0 +1,251 @@
+"""Synchronisation de la liste des colis entre postes partageant users.db.
+
+Un thread interroge PRAGMA data_version sur une connexion dédiée : la valeur
+change dès qu'une autre connexion (autre poste, autre thread) valide une
+écriture. On vérifie alors le journal change_log et on prévient les pages
+abonnées. Les écritures du poste lui-même passent par le même chemin :
+poke() déclenche une interrogation immédiate au lieu d'un rechargement.
+Sans changement, l'intervalle double jusqu'à max_interval ; sans abonné,
+le thread attend sans interroger la base.
+"""
+import sqlite3
+import threading
+import time
+
+from database import Database, get_pool
+
+# Réglages de l'interrogation ; chaque valeur peut être passée à ChangeNotifier
+SYNC_SETTINGS = {
+    'min_interval': 0.5,   # secondes entre deux interrogations après un changement
+    'max_interval': 5.0,   # intervalle maximal quand rien ne change
+    'cpu_budget': 0.005,   # part maximale d'un cœur consacrée à l'interrogation
+}
+
+
+class ChangeNotifier:
+    """Calls subscribers with the latest change seq when records change in the database."""
+
+    def __init__(self, path=None, **settings):
+        self.path = path or get_pool().path
+        self.settings = {**SYNC_SETTINGS, **settings}
+        self.polls = 0
+        self._listeners = []
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._poke = threading.Event()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="colis-sync", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop_event.set()
+        self._poke.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.settings['max_interval'] + 1)
+            self._thread = None
+
+    def subscribe(self, callback):
+        """Call callback(seq) from the sync thread after each change to the records.
+
+        The first call after subscribing may report changes the subscriber
+        already has: compare seq with the one it loaded.
+        """
+        with self._lock:
+            self._listeners.append(callback)
+        self._wake.set()
+
+    def poke(self):
+        """Poll right away, e.g. after a write made by this station."""
+        self._poke.set()
+
+    def unsubscribe(self, callback):
+        with self._lock:
+            if callback in self._listeners:
+                self._listeners.remove(callback)
+
+    def _notify(self, seq):
+        with self._lock:
+            listeners = list(self._listeners)
+        for callback in listeners:
+            try:
+                callback(seq)
+            except Exception as ex:
+                print(f"Erreur de synchronisation: {ex}")
+
+    def _run(self):
+        settings = self.settings
+        # Connexion dédiée : data_version ne change qu'avec les écritures des autres connexions
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        try:
+            version = seq = None
+            interval = settings['min_interval']
+            while not self._stop_event.is_set():
+                with self._lock:
+                    idle = not self._listeners
+                if idle:
+                    # Aucune liste ouverte : rien à interroger jusqu'au prochain abonné
+                    self._wake.wait()
+                    self._wake.clear()
+                    interval = settings['min_interval']
+                    continue
+                self._poke.wait(interval)
+                self._poke.clear()
+                if self._stop_event.is_set():
+                    break
+
+                start = time.thread_time()
+                changed = False
+                try:
+                    current = conn.execute("PRAGMA data_version").fetchone()[0]
+                    if current != version:
+                        version = current
+                        # Une écriture ailleurs (file d'impression...) ne touche pas forcément les colis
+                        latest = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM change_log").fetchone()[0]
+                        # Premier passage : les abonnés comparent avec le seq de leur propre chargement
+                        changed = latest != seq
+                        seq = latest
+                except sqlite3.Error as ex:
+                    print(f"Erreur de synchronisation: {ex}")
+                self.polls += 1
+                cost = time.thread_time() - start
+
+                if changed:
+                    self._notify(seq)
+                    interval = settings['min_interval']
+                else:
+                    interval = min(interval * 2, settings['max_interval'])
+                # Ne jamais dépasser le budget CPU, même si une interrogation devient coûteuse
+                interval = max(interval, cost / settings['cpu_budget'])
+        finally:
+            conn.close()
+
+
+def fetch_changes(seq):
+    """Return (last_seq, changed, deleted) for everything changed since seq.
+
+    changed is newest first; a record changed then deleted only appears in
+    deleted.
+    """
+    changed = {}
+    deleted = set()
+    db = Database()
+    try:
+        while True:
+            last_seq, rows, deleted_ids = db.changes_since(seq)
+            if last_seq == seq:
+                break
+            for row in rows:
+                changed[row[0]] = row
+                deleted.discard(row[0])
+            for record_id in deleted_ids:
+                changed.pop(record_id, None)
+                deleted.add(record_id)
+            seq = last_seq
+    finally:
+        db.close()
+    return seq, sorted(changed.values(), key=lambda row: row[0], reverse=True), deleted
+
+
+def _run_now(fn, on_done, on_error):
+    try:
+        result = fn()
+    except Exception as ex:
+        on_error(ex)
+    else:
+        on_done(result)
+
+
+class ChangeFollower:
+    """Applies the change feed to a view, one refresh at a time.
+
+    apply(changed, deleted) is called with lock held: the view takes the
+    same lock for its other changes to the list. A refresh asked while one
+    is running is merged into a single rerun once it finishes. submit(fn,
+    on_done, on_error) runs fn in the background (by default right away).
+    """
+
+    def __init__(self, seq, apply, lock, submit=_run_now):
+        self.seq = seq
+        self.apply = apply
+        self.lock = lock
+        self.submit = submit
+        self._running = False
+        self._dirty = False
+        self._waiters = []
+
+    def refresh(self, on_done=None, on_error=None):
+        """Fetch and apply the changes after seq; on_done() is called once they are applied."""
+        with self.lock:
+            self._waiters.append((on_done, on_error))
+            if self._running:
+                self._dirty = True
+                return
+            self._running = True
+            seq = self.seq
+        self._start(seq)
+
+    def notify(self, seq):
+        """ChangeNotifier subscriber: refresh unless seq is already applied."""
+        with self.lock:
+            covered = seq <= self.seq
+        if not covered:
+            self.refresh()
+
+    def _start(self, seq):
+        self.submit(lambda: fetch_changes(seq), self._fetched, self._failed)
+
+    def _finish(self):
+        # Appelé avec le verrou : fin de la série de rafraîchissements
+        self._running = False
+        self._dirty = False
+        waiters, self._waiters = self._waiters, []
+        return waiters
+
+    def _fetched(self, result):
+        seq, changed, deleted = result
+        with self.lock:
+            # Lot déjà appliqué (ou plus ancien) : l'ignorer
+            if seq > self.seq:
+                self.apply(changed, deleted)
+                self.seq = seq
+            rerun = self._dirty
+            if rerun:
+                self._dirty = False
+                next_seq = self.seq
+            else:
+                waiters = self._finish()
+        if rerun:
+            self._start(next_seq)
+            return
+        for on_done, on_error in waiters:
+            if on_done is not None:
+                on_done()
+
+    def _failed(self, ex):
+        with self.lock:
+            waiters = self._finish()
+        # Un seul message par gestionnaire d'erreur, même pour des demandes regroupées
+        handlers = []
+        for on_done, on_error in waiters:
+            if on_error is not None and on_error not in handlers:
+                handlers.append(on_error)
+        for on_error in handlers:
+            on_error(ex)
+
+
+_notifier = None
+_notifier_lock = threading.Lock()
+
+
+def get_change_notifier():
+    global _notifier
+    with _notifier_lock:
+        if _notifier is None:
+            _notifier = ChangeNotifier().start()
+    return _notifier
@@ -0,0 +1,141 @@
+"""Exécution des tâches longues hors du thread des évènements Flet.
+
+Les accès à la base, la recherche d'imprimantes et l'impression passent par
+le pool de threads ; le rendu des QR codes (calcul pur) par le pool de
+processus. Les rappels on_done/on_error/on_progress sont appelés une fois
+la tâche terminée puis la page est rafraîchie avec page.update().
+"""
+import multiprocessing
+import os
+import threading
+from concurrent.futures import CancelledError, ProcessPoolExecutor, ThreadPoolExecutor
+
+IO_WORKERS = 4
+CPU_WORKERS = max(1, (os.cpu_count() or 2) - 1)
+# Processus lancés par spawn : un fork copierait les threads et les connexions SQLite ouvertes
+CPU_CONTEXT = multiprocessing.get_context("spawn")
+
+
+class TaskCancelled(Exception):
+    """Raised inside a task when it notices it has been cancelled."""
+
+
+class Task:
+    """Handle on a submitted task, used for cancellation and progress."""
+
+    def __init__(self, page, on_progress=None):
+        self.page = page
+        self.on_progress = on_progress
+        self.future = None
+        self._cancelled = threading.Event()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def cancel(self):
+        self._cancelled.set()
+        if self.future is not None:
+            self.future.cancel()
+
+    def check_cancelled(self):
+        """Stop the task at a safe point if cancel() was called."""
+        if self.cancelled:
+            raise TaskCancelled()
+
+    def wait(self, seconds):
+        """Sleep for up to seconds, returning early (and stopping) on cancellation."""
+        if self._cancelled.wait(seconds):
+            raise TaskCancelled()
+
+    def report_progress(self, value, message=None):
+        """Report progress between 0 and 1, with an optional message."""
+        if self.on_progress is None or self.cancelled:
+            return
+        self.on_progress(value, message)
+        if self.page is not None:
+            self.page.update()
+
+
+class TaskExecutor:
+    def __init__(self, io_workers=IO_WORKERS, cpu_workers=CPU_WORKERS):
+        self.io_workers = io_workers
+        self.cpu_workers = cpu_workers
+        self._io = ThreadPoolExecutor(max_workers=io_workers, thread_name_prefix="colis-io")
+        self._cpu = None
+        self._lock = threading.Lock()
+
+    def _cpu_pool(self):
+        # Le pool de processus n'est démarré qu'au premier rendu
+        with self._lock:
+            if self._cpu is None:
+                self._cpu = ProcessPoolExecutor(max_workers=self.cpu_workers, mp_context=CPU_CONTEXT)
+            return self._cpu
+
+    def submit(self, page, fn, *args, on_done=None, on_error=None, on_progress=None, **kwargs):
+        """Run fn(task, *args, **kwargs) in the I/O thread pool and return the Task."""
+        task = Task(page, on_progress)
+        task.future = self._io.submit(fn, task, *args, **kwargs)
+        self._watch(task, on_done, on_error)
+        return task
+
+    def submit_cpu(self, page, fn, *args, on_done=None, on_error=None):
+        """Run fn(*args) in the process pool; fn and args must be picklable."""
+        task = Task(page)
+        task.future = self._cpu_pool().submit(fn, *args)
+        self._watch(task, on_done, on_error)
+        return task
+
+    def _watch(self, task, on_done, on_error):
+        def failed(ex):
+            if on_error is not None:
+                on_error(ex)
+            else:
+                print(f"Erreur dans une tâche de fond: {ex}")
+
+        def done(future):
+            if task.cancelled:
+                return
+            try:
+                try:
+                    result = future.result()
+                except (CancelledError, TaskCancelled):
+                    return
+                except Exception as ex:
+                    failed(ex)
+                else:
+                    if on_done is not None:
+                        try:
+                            on_done(result)
+                        except Exception as ex:
+                            # Une erreur d'affichage est signalée comme celle de la tâche
+                            failed(ex)
+            except Exception as ex:
+                # on_error lui-même a échoué : ne pas laisser l'exception à concurrent.futures
+                print(f"Erreur dans une tâche de fond: {ex}")
+            finally:
+                # Toujours rafraîchir : sinon la page reste bloquée sur l'indicateur de chargement
+                if task.page is not None:
+                    task.page.update()
+
+        task.future.add_done_callback(done)
+
+    def shutdown(self, wait=False):
+        self._io.shutdown(wait=wait, cancel_futures=True)
+        with self._lock:
+            if self._cpu is not None:
+                self._cpu.shutdown(wait=wait, cancel_futures=True)
+                self._cpu = None
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """Shared executor used by every page."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = TaskExecutor()
+    return _executor
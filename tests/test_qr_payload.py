@@ -0,0 +1,40 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from qr_payload import (FIELD_TAGS, PAYLOAD_PREFIX, PAYLOAD_VERSION, PayloadError, _checksum,
+                        _write_varint, b45encode, decode_payload, encode_payload, parse_qr_data)
+
+
+def raw_payload(record_id, tag, value):
+    """Build a payload with a valid checksum around arbitrary field bytes."""
+    body = bytearray()
+    _write_varint(body, record_id)
+    body.append(tag)
+    _write_varint(body, len(value))
+    body += value
+    body += _checksum(bytes(body))
+    return f"{PAYLOAD_PREFIX}{PAYLOAD_VERSION}:{b45encode(bytes(body))}"
+
+
+class DecodePayloadTest(unittest.TestCase):
+    def test_round_trip(self):
+        text = encode_payload(42, {'name_dest': "Sara El Amrani", 'city_dest': "Fès", 'nmbr_package': 0})
+        self.assertEqual(parse_qr_data(text),
+                         {'id': 42, 'name_dest': "Sara El Amrani", 'city_dest': "Fès", 'nmbr_package': "0"})
+
+    def test_invalid_utf8_field(self):
+        text = raw_payload(7, FIELD_TAGS['name_dest'], b"\xff\xfe")
+        with self.assertRaises(PayloadError):
+            decode_payload(text)
+        self.assertIsNone(parse_qr_data(text))
+
+    def test_bad_checksum(self):
+        text = encode_payload(7, {'city_dest': "Rabat"})
+        self.assertIsNone(parse_qr_data(text[:-2] + ("00" if text[-2:] != "00" else "11")))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,34 @@
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+from database import Database
+from query_audit import SAMPLE_RECORD, audit
+
+
+class QueryAuditTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.pool = database.init_pool(os.path.join(self.tmp.name, 'test.db'), size=1)
+
+    def tearDown(self):
+        self.pool.close_all()
+        self.tmp.cleanup()
+
+    def test_no_full_table_scan(self):
+        db = Database(self.pool)
+        try:
+            db.insert_record(*SAMPLE_RECORD)
+            regressions = audit(db)
+        finally:
+            db.close()
+        # Le libellé et la requête fautive apparaissent dans le message d'échec
+        self.assertEqual([(label, " ".join(query.split())) for label, query, plan in regressions], [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,39 @@
+import importlib.util
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from startup_check import HEAVY_MODULES, check_startup, heavy_modules
+
+# Modules sans flet importés par app au démarrage, vérifiables même sans flet
+STARTUP_MODULES = (
+    'auth', 'database', 'export', 'printer_discovery', 'printing', 'qr_cache',
+    'qr_payload', 'reports', 'sync', 'tasks', 'throttle',
+)
+
+
+class StartupTest(unittest.TestCase):
+    def assert_light(self, module):
+        median, entries, problems = check_startup(module, runs=1)
+        self.assertEqual(heavy_modules(entries, HEAVY_MODULES), [])
+
+    def test_no_heavy_module_at_startup(self):
+        for module in STARTUP_MODULES:
+            with self.subTest(module=module):
+                self.assert_light(module)
+
+    @unittest.skipIf(importlib.util.find_spec('flet') is None, "flet n'est pas installé")
+    def test_app_startup(self):
+        try:
+            self.assert_light('app')
+        except RuntimeError as ex:
+            # Version de flet incompatible : seul STARTUP_MODULES peut être vérifié
+            if 'flet' not in str(ex):
+                raise
+            self.skipTest(str(ex))
+
+
+if __name__ == "__main__":
+    unittest.main()
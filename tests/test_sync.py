@@ -0,0 +1,96 @@
+import os
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+from database import Database
+from sync import ChangeFollower, ChangeNotifier
+
+
+def run_in_thread(fn, on_done, on_error):
+    def run():
+        try:
+            result = fn()
+        except Exception as ex:
+            on_error(ex)
+        else:
+            on_done(result)
+    threading.Thread(target=run, daemon=True).start()
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return condition()
+
+
+class LocalSaveTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        database.init_pool(os.path.join(self.tmp.name, 'test.db'))
+        self.applied = Counter()
+        self.deleted = Counter()
+        db = Database()
+        try:
+            seq = db.current_change_seq()
+        finally:
+            db.close()
+        self.follower = ChangeFollower(seq, self.apply, threading.Lock(), submit=run_in_thread)
+        # Intervalle long : seul poke() peut déclencher l'interrogation pendant le test
+        self.notifier = ChangeNotifier(min_interval=30, max_interval=30)
+        self.notifier.subscribe(self.follower.notify)
+        self.notifier.start()
+
+    def tearDown(self):
+        self.notifier.stop()
+        database.get_pool().close_all()
+        self.tmp.cleanup()
+
+    def apply(self, changed, deleted):
+        self.applied.update(row[0] for row in changed)
+        self.deleted.update(deleted)
+
+    def save(self, fn):
+        db = Database()
+        try:
+            result = fn(db)
+            seq = db.current_change_seq()
+        finally:
+            db.close()
+        self.notifier.poke()
+        self.assertTrue(wait_for(lambda: self.follower.seq >= seq))
+        return result
+
+    def test_local_save_applied_once(self):
+        first = self.save(lambda db: db.insert_record(
+            "Ali", "Rabat", "0600000000", "Sara", "0611111111", "Fès", 1, "Colis", 100, 2, 30))
+        second = self.save(lambda db: db.insert_record(
+            "Omar", "Tanger", "0622222222", "Nadia", "0633333333", "Agadir", 2, "Colis", 50, 1, 20))
+        self.save(lambda db: db.delete_record(second))
+
+        # Tick suivant du notifieur et rafraîchissement explicite : rien de nouveau
+        self.notifier.poke()
+        self.follower.refresh()
+        time.sleep(0.2)
+        self.assertEqual(self.applied, Counter({first: 1, second: 1}))
+        self.assertEqual(self.deleted, Counter({second: 1}))
+
+    def test_stale_notification_ignored(self):
+        record_id = self.save(lambda db: db.insert_record(
+            "Ali", "Rabat", "0600000000", "Sara", "0611111111", "Fès", 1, "Colis", 100, 2, 30))
+        self.follower.notify(self.follower.seq)
+        time.sleep(0.2)
+        self.assertEqual(self.applied, Counter({record_id: 1}))
+
+
+if __name__ == "__main__":
+    unittest.main()
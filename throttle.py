@@ -0,0 +1,184 @@
+"""Limitation des tentatives de connexion.
+
+Chaque nom d'utilisateur et chaque poste ont un seau de jetons en mémoire :
+une tentative consomme un jeton de chacun, rendu si elle réussit ; les
+jetons reviennent lentement. Un refus ne coûte qu'une consultation de
+dictionnaire, sans accès à users.db. Après trop d'échecs rapprochés, le
+compte est verrouillé ; les verrouillages peuvent être conservés dans une
+petite base séparée (LOCKOUT_DB) pour survivre à un redémarrage.
+"""
+import socket
+import sqlite3
+import threading
+import time
+
+# Réglages de la limitation ; chaque valeur peut être passée à LoginThrottle
+THROTTLE_SETTINGS = {
+    'capacity': 5,               # tentatives permises d'affilée
+    'refill_seconds': 30,        # délai de retour d'un jeton
+    'lockout_failures': 10,      # échecs consécutifs avant verrouillage
+    'lockout_seconds': 15 * 60,  # durée du verrouillage
+    'failure_window': 15 * 60,   # échecs oubliés après ce délai sans nouvel échec
+    'max_keys': 10000,           # seaux gardés en mémoire au plus
+}
+# Base des verrouillages, séparée de users.db ; None pour les garder en mémoire seulement
+LOCKOUT_DB = 'lockouts.db'
+TERMINAL = socket.gethostname()
+
+
+class LoginThrottle:
+    def __init__(self, lockout_db=LOCKOUT_DB, **settings):
+        self.settings = {**THROTTLE_SETTINGS, **settings}
+        self.lockout_db = lockout_db
+        # clé -> (jetons, instant de la dernière mise à jour, en time.monotonic())
+        self._buckets = {}
+        # clé -> (échecs consécutifs, instant du dernier échec, en time.monotonic())
+        self._failures = {}
+        # clé -> fin du verrouillage, en time.time() pour pouvoir être enregistrée
+        self._lockouts = {}
+        self._lock = threading.Lock()
+        if lockout_db:
+            self._load_lockouts()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.lockout_db)
+        conn.execute("""
+        CREATE TABLE IF NOT EXISTS lockouts (
+            key TEXT PRIMARY KEY,
+            locked_until REAL NOT NULL
+        )
+        """)
+        return conn
+
+    def _load_lockouts(self):
+        try:
+            conn = self._connect()
+            try:
+                now = time.time()
+                conn.execute("DELETE FROM lockouts WHERE locked_until <= ?", (now,))
+                conn.commit()
+                self._lockouts = dict(conn.execute("SELECT key, locked_until FROM lockouts"))
+            finally:
+                conn.close()
+        except sqlite3.Error as ex:
+            print(f"Erreur de lecture des verrouillages: {ex}")
+
+    def _save_lockout(self, key, locked_until):
+        if not self.lockout_db:
+            return
+        try:
+            conn = self._connect()
+            try:
+                if locked_until is None:
+                    conn.execute("DELETE FROM lockouts WHERE key = ?", (key,))
+                else:
+                    conn.execute("INSERT OR REPLACE INTO lockouts (key, locked_until) VALUES (?, ?)",
+                                 (key, locked_until))
+                conn.commit()
+            finally:
+                conn.close()
+        except sqlite3.Error as ex:
+            print(f"Erreur d'enregistrement du verrouillage: {ex}")
+
+    @staticmethod
+    def _keys(username, terminal):
+        return f"user:{username}", f"terminal:{terminal}"
+
+    def _tokens(self, key, now):
+        settings = self.settings
+        tokens, updated = self._buckets.get(key, (settings['capacity'], now))
+        return min(settings['capacity'], tokens + (now - updated) / settings['refill_seconds'])
+
+    def _wait(self, tokens):
+        """Seconds until a bucket holding tokens has one to give, 0 if it has."""
+        return 0 if tokens >= 1 else (1 - tokens) * self.settings['refill_seconds']
+
+    def _refund(self, key, now):
+        if key in self._buckets:
+            self._buckets[key] = (min(self.settings['capacity'], self._tokens(key, now) + 1), now)
+
+    def _prune(self, now):
+        # Oublier les seaux pleins : ils se comportent comme un seau neuf
+        settings = self.settings
+        full_after = settings['capacity'] * settings['refill_seconds']
+        self._buckets = {key: (tokens, updated) for key, (tokens, updated) in self._buckets.items()
+                         if now - updated < full_after}
+        self._failures = {key: (failures, last) for key, (failures, last) in self._failures.items()
+                          if now - last < settings['failure_window']}
+        # Rafale de noms différents : garder les entrées les plus récentes
+        keep = settings['max_keys'] // 2
+        if len(self._buckets) > keep:
+            recent = sorted(self._buckets.items(), key=lambda item: item[1][1], reverse=True)
+            self._buckets = dict(recent[:keep])
+        if len(self._failures) > keep:
+            recent = sorted(self._failures.items(), key=lambda item: item[1][1], reverse=True)
+            self._failures = dict(recent[:keep])
+
+    def check(self, username, terminal=TERMINAL):
+        """Register a login attempt; returns 0 if allowed, else the seconds to wait."""
+        now = time.monotonic()
+        wall = time.time()
+        user_key, terminal_key = self._keys(username, terminal)
+        with self._lock:
+            locked_until = self._lockouts.get(user_key)
+            if locked_until is not None:
+                if locked_until > wall:
+                    return locked_until - wall
+                del self._lockouts[user_key]
+            if max(len(self._buckets), len(self._failures)) > self.settings['max_keys']:
+                self._prune(now)
+            # Les deux seaux sont vérifiés avant d'en débiter un : un refus ne coûte rien à l'autre
+            user_tokens = self._tokens(user_key, now)
+            wait = self._wait(user_tokens)
+            if wait:
+                return wait
+            # Le poste ensuite : essayer plusieurs noms ne contourne pas la limite
+            terminal_tokens = self._tokens(terminal_key, now)
+            wait = self._wait(terminal_tokens)
+            if wait:
+                return wait
+            self._buckets[user_key] = (user_tokens - 1, now)
+            self._buckets[terminal_key] = (terminal_tokens - 1, now)
+            return 0
+
+    def record_failure(self, username, terminal=TERMINAL):
+        """Count a failed login; returns the lockout end (time.time()) if the account gets locked."""
+        now = time.monotonic()
+        user_key, terminal_key = self._keys(username, terminal)
+        with self._lock:
+            failures, last = self._failures.get(user_key, (0, now))
+            if now - last >= self.settings['failure_window']:
+                failures = 0
+            failures += 1
+            if failures < self.settings['lockout_failures']:
+                self._failures[user_key] = (failures, now)
+                return None
+            self._failures.pop(user_key, None)
+            locked_until = time.time() + self.settings['lockout_seconds']
+            self._lockouts[user_key] = locked_until
+        self._save_lockout(user_key, locked_until)
+        return locked_until
+
+    def record_success(self, username, terminal=TERMINAL):
+        """Forget the failures of username and give back the tokens of the attempt."""
+        now = time.monotonic()
+        user_key, terminal_key = self._keys(username, terminal)
+        with self._lock:
+            self._failures.pop(user_key, None)
+            self._refund(user_key, now)
+            self._refund(terminal_key, now)
+            was_locked = self._lockouts.pop(user_key, None) is not None
+        if was_locked:
+            self._save_lockout(user_key, None)
+
+
+_throttle = None
+_throttle_lock = threading.Lock()
+
+
+def get_login_throttle():
+    global _throttle
+    with _throttle_lock:
+        if _throttle is None:
+            _throttle = LoginThrottle()
+    return _throttle